@@ -1,28 +1,27 @@
+import io
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 from scipy import signal
+from columnar_store import load_columns
+try:
+    from result_cache import cached
+except ImportError:
+    # used without result_cache.py next to it (e.g. copied into a notebook), results are not cached
+    def cached(function=None, ignore=()):
+        return (lambda f: f) if function is None else function
 
-def sensorData(inputFileLoc):
-    sensorData = pd.read_csv(inputFileLoc, skiprows=10)
-
-    QuatW = sensorData["Quat_W"].to_numpy() #Quaternion values
-    QuatX = sensorData["Quat_X"].to_numpy()
-    QuatY = sensorData["Quat_Y"].to_numpy()
-    QuatZ = sensorData["Quat_Z"].to_numpy()
-    quatArr = np.stack((QuatX, QuatY, QuatZ, QuatW), axis=1)
+SENSOR_COLUMNS = ["Quat_W", "Quat_X", "Quat_Y", "Quat_Z", "Acc_X", "Acc_Y", "Acc_Z",
+                  "Gyr_X", "Gyr_Y", "Gyr_Z", "SampleTimeFine"]
 
-    XPos = sensorData["Acc_X"].to_numpy() #acceleration in m/s^2
-    YPos = sensorData["Acc_Y"].to_numpy()
-    ZPos = sensorData["Acc_Z"].to_numpy()
-    accArr = np.stack((XPos, YPos, ZPos), axis=1)
+def sensorData(inputFileLoc):
+    # only the columns used here are read, from the columnar cache of the csv (see columnar_store.py)
+    sensorData = load_columns(inputFileLoc, SENSOR_COLUMNS, skiprows=10)
 
-    AngX = sensorData["Gyr_X"].to_numpy() #Angular in deg/s
-    AngY = sensorData["Gyr_Y"].to_numpy()
-    AngZ = sensorData["Gyr_Z"].to_numpy()    
-    angArr = np.stack((AngX, AngY, AngZ), axis=1)
+    quatArr = np.stack([sensorData[name] for name in ("Quat_X", "Quat_Y", "Quat_Z", "Quat_W")], axis=1) #Quaternion values
+    accArr = np.stack([sensorData[name] for name in ("Acc_X", "Acc_Y", "Acc_Z")], axis=1) #acceleration in m/s^2
+    angArr = np.stack([sensorData[name] for name in ("Gyr_X", "Gyr_Y", "Gyr_Z")], axis=1) #Angular in deg/s
 
-    TimeArr = sensorData["SampleTimeFine"].to_numpy()
+    TimeArr = np.array(sensorData["SampleTimeFine"])
 
     return [quatArr, accArr, angArr, TimeArr]
 
@@ -35,7 +34,19 @@ def dataLoc(inputFileLoc):
     return tempString
 
 def visualise2D(dataIn, inputFileLoc, dataName, fs=60, threshold=0.05, order = 10, padlen = 10, fc = 10, prom=0.4):
-    
+    # the peak count and plot only depend on the data and filter settings, so both come
+    #     from the result cache when they were calculated before (see result_cache.py)
+    peakCount, image = filteredPeaks(dataIn, fs, threshold, order, padlen, fc, prom)
+
+    fileLoc = dataLoc(inputFileLoc)
+    imageName = fileLoc + '/' + dataName + '.png'
+    with open(imageName, 'wb') as imageFile:
+        imageFile.write(image)
+
+    return peakCount
+
+@cached
+def filteredPeaks(dataIn, fs=60, threshold=0.05, order = 10, padlen = 10, fc = 10, prom=0.4):
     fc_norm = fc / (threshold * fs)
 
     data_padded = np.pad(dataIn, (padlen, padlen), mode='edge')
@@ -61,15 +72,13 @@ def visualise2D(dataIn, inputFileLoc, dataName, fs=60, threshold=0.05, order = 1
     # print(calcValleys, '\n')
     xAxis = np.linspace(0, len(data_filt), num = len(data_filt))
 
-    fileLoc = dataLoc(inputFileLoc)
-    imageName = fileLoc + '/' + dataName + '.png'
-
+    image = io.BytesIO()
     plt.plot(data_padded, 'k-', label='padded')
     plt.plot(data_filt, 'b-', linewidth=4, label='filtered')
     plt.plot(xAxis[calcValleys], data_filt[calcValleys], "o", label="min", color='g')
     plt.plot(xAxis[calcPeaks], data_filt[calcPeaks], "o", label="max", color='r')
     plt.legend(loc='best')
-    plt.savefig(imageName, bbox_inches='tight')
+    plt.savefig(image, format='png', bbox_inches='tight')
     plt.clf()
 
-    return len(peaks)
\ No newline at end of file
+    return len(peaks), image.getvalue()
\ No newline at end of file
@@ -1,65 +1,81 @@
 import numpy as np
 import quaternion
 import quaternion.quaternion_time_series as qt
+try:
+    from result_cache import cached
+except ImportError:
+    # used without result_cache.py next to it (e.g. copied into a notebook), results are not cached
+    def cached(function=None, ignore=()):
+        return (lambda f: f) if function is None else function
+
+# Component orders of (N, 4) quaternion arrays. The DOT csv files (and sensorData) store
+#     quaternions as x, y, z, w, numpy-quaternion and Unity as w, x, y, z
+XYZW = (3, 0, 1, 2)  # columns of w, x, y, z in an xyzw array
+WXYZ = (0, 1, 2, 3)
+ORDERS = {'xyzw': XYZW, 'wxyz': WXYZ}
+
+# returns the w, x, y, z columns of an (N, 4) quaternion array in the given order
+def quatComponents(QuatArr, order='wxyz'):
+    QuatArr = np.asarray(QuatArr)
+    return [QuatArr[:, i] for i in ORDERS[order]]
+
+# stacks w, x, y, z columns back into an (N, 4) quaternion array in the given order
+def quatStack(W, X, Y, Z, order='wxyz'):
+    components = (W, X, Y, Z)
+    return np.stack([components[ORDERS[order].index(i)] for i in range(4)], axis=1)
+
+# inverse of every quaternion of an (N, 4) array in one pass, result in the same order
+#     inverse = conjugate / magnitude, conjugate of w + xi + yj + zk = w - xi - yj - zk
+def quatInverse(QuatArr, order='wxyz'):
+    W, X, Y, Z = quatComponents(QuatArr, order)
+    magQuat = W**2 + X**2 + Y**2 + Z**2
+    return quatStack(W/magQuat, -X/magQuat, -Y/magQuat, -Z/magQuat, order)
+
+# Hamilton product P * Q of two (N, 4) arrays in one pass, result in the same order
+def quatMultiply(P, Q, order='wxyz'):
+    W2, X2, Y2, Z2 = quatComponents(P, order)
+    W1, X1, Y1, Z1 = quatComponents(Q, order)
+    return quatStack(W2 * W1 - X2 * X1 - Y2 * Y1 - Z2 * Z1,
+                     W2 * X1 + X2 * W1 + Y2 * Z1 - Z2 * Y1,
+                     W2 * Y1 - X2 * Z1 + Y2 * W1 + Z2 * X1,
+                     W2 * Z1 + X2 * Y1 - Y2 * X1 + Z2 * W1, order)
+
+# rotation of sensor 2 relative to sensor 1 (S2 * S1^-1, the "Booker Method") with every
+#     component where it belongs, as a numpy-quaternion array
+def relativeRotation(QuatArr1, QuatArr2, order='xyzw'):
+    delta = quatMultiply(QuatArr2, quatInverse(QuatArr1, order), order)
+    return quaternion.from_float_array(quatStack(*quatComponents(delta, order)))
 
 # inverse a quaternion matrix - achieved by dividing the conjugate by the magnitude
 # if form w + xi + yj + zk conjugate = w - xi - yj - zk
 # magnitude would equal w^2 + x^2 + y^2 + z^2
-# function takes an array of quaternions and returns the inverse of those arrays
+# function takes an (N, 4) array of x, y, z, w quaternions (as returned by sensorData)
+#     and returns the (N, 4) array of their inverses in the same order
 def getInv(QuatArr):
-    invArr = []
-    for Row in QuatArr:
-        Xval = Row[0]
-        Yval = Row[1]
-        Zval = Row[2]
-        Wval = Row[3]
-    
-        magQuat = Xval**2 + Yval**2 + Zval**2 + Wval**2
+    return quatInverse(QuatArr, 'xyzw')
 
-        modX = -Xval/magQuat
-        modY = -Yval/magQuat
-        modZ = -Zval/magQuat
-        modW = Wval/magQuat
 
-        tempArr = [modX, modY, modZ, modW]
-        invArr.append(tempArr)
-
-    return invArr
-
-
-# calculate the delta method by Booker by multiplying (product value) the hand sensor quaternions
-#       by the inverse quaternion value of the wrist sensor
+# the delta method by Booker as it was first written, only kept to reproduce the earlier
+#     reports - use relativeRotation for the delta itself. Arr1 is the inverse of the wrist
+#     sensor quaternions (getInv) and Arr2 the hand sensor quaternions, both x, y, z, w
 #     S2S1w = S2w * S1w - S2x * S1x - S2y * S1y - S2z * S1z
 #     S2S1x = S2w * S1x + S2x * S1w + S2y * S1z - S2z * S1y
 #     S2S1y = S2w * S1y - S2x * S1z + S2y * S1w + S2z * S1x
 #     S2S1z = S2w * S1z + S2x * S1y - S2y * S1x + S2z * S1w
-def calcDelta(Arr1, Arr2):
-    count = 0
-    deltaList = []
-    while count < len(Arr1):
-        W1 = Arr1[count][0]
-        X1 = Arr1[count][1]
-        Y1 = Arr1[count][2]
-        Z1 = Arr1[count][3]
-
-        W2 = Arr2[count][0]
-        X2 = Arr2[count][1]
-        Y2 = Arr2[count][2]
-        Z2 = Arr2[count][3]
-
-        modW = W2 * W1 - X2 * X1 - Y2 * Y1 - Z2 * Z1
-        modX = W2 * X1 + X2 * W1 + Y2 * Z1 - Z2 * Y1
-        modY = W2 * Y1 - X2 * Z1 + Y2 * W1 + Z2 * X1
-        modZ = W2 * Z1 + X2 * Y1 - Y2 * X1 + Z2 * W1
-        # tempArr = [modW, modX, modY, modZ]
-        deltaList.append(np.quaternion(modX, modY, modZ, modW)) # convert to numpy-quaternion to use with calculate velocity
-        count = count + 1
-    return deltaList
+# NOTE the original code applied these formulas to the x, y, z, w columns as if they were
+#     w, x, y, z, then built the result with np.quaternion(S2S1x, S2S1y, S2S1z, S2S1w), which
+#     takes w first. Both mistakes are reproduced here on purpose, so this is not a rotation
+#     of the hand relative to the wrist
+def calcDeltaLegacy(Arr1, Arr2):
+    misread = quatMultiply(Arr2, Arr1, 'wxyz')  # the x, y, z, w columns taken as w, x, y, z
+    # convert to numpy-quaternion to use with calculate velocity, in the original component order
+    return quaternion.from_float_array(misread[:, [1, 2, 3, 0]])
 
 
 # Author: Michael Boyle
 # Copyright (c) 2017
 # https://www.programcreek.com/python/?code=moble%2Fquaternion%2Fquaternion-master%2Fquaternion_time_series.py#
+@cached
 def angular_velocity(R, t):
     from scipy.interpolate import InterpolatedUnivariateSpline as spline
     R = quaternion.as_float_array(R)
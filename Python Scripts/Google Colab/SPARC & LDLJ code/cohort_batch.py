@@ -0,0 +1,263 @@
+"""
+cohort_batch.py runs SmoothnessCalculation over every sensor pair recording found under a
+root directory and writes one consolidated results table.
+
+A directory holds a pair if exactly one file matches each of the sensor 1 and sensor 2
+patterns (Sensor_1.csv and Sensor_2.csv by default, as written by the DOT exporter).
+Pairs are processed in parallel worker processes. Results are kept in a state file
+next to the table, so a re-run only processes pairs whose CSVs, or the analysis code
+itself, changed since the last run.
+
+Usage:
+    python cohort_batch.py <root> [--output results.csv] [--jobs 4] [--plots] [--force]
+    python cohort_batch.py --check    # runs one generated pair end to end
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+BATCH_VERSION = 1
+SENSOR1_PATTERN = "Sensor_1.csv"
+SENSOR2_PATTERN = "Sensor_2.csv"
+# a change to any of these invalidates every stored result
+ANALYSIS_MODULES = ("SmoothnessCalculation.py", "SmoothnessCalculationHelper.py",
+                    "SmoothnessCalculationDataManager.py", "smoothness.py", "columnar_store.py")
+
+
+def discover_pairs(root, sensor1=SENSOR1_PATTERN, sensor2=SENSOR2_PATTERN):
+    """
+    Returns a sorted list of (directory relative to root, sensor 1 csv, sensor 2 csv)
+    for every directory under root holding a pair of recordings.
+    """
+    pairs = []
+    for directory, dirnames, _ in os.walk(root):
+        # skip caches such as columnar_store's .columns directories
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        files1 = glob.glob(os.path.join(glob.escape(directory), sensor1))
+        files2 = glob.glob(os.path.join(glob.escape(directory), sensor2))
+        if len(files1) == 1 and len(files2) == 1 and files1 != files2:
+            pairs.append((os.path.relpath(directory, root), files1[0], files2[0]))
+        elif files1 or files2:
+            print(f"Skipping {directory}: {len(files1)} sensor 1 and {len(files2)} sensor 2 files")
+    return pairs
+
+
+def code_fingerprint():
+    """
+    Returns a hash of the analysis source code and BATCH_VERSION.
+    """
+    h = hashlib.sha1(str(BATCH_VERSION).encode())
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in ANALYSIS_MODULES:
+        with open(os.path.join(here, name), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def input_fingerprint(files, fingerprint, plots):
+    stamps = [[os.path.basename(f), os.stat(f).st_size, os.stat(f).st_mtime_ns] for f in files]
+    return {"files": stamps, "code": fingerprint, "plots": plots}
+
+
+def process_pair(fileLoc1, fileLoc2, plots):
+    """
+    Worker: runs the smoothness calculation of one pair.
+
+    Returns
+    -------
+    results : dict
+              The values of SmoothnessCalculation.smoothnessCalculation as floats.
+    seconds : float
+              The time the calculation took.
+    """
+    from SmoothnessCalculation import smoothnessCalculation
+
+    start = time.perf_counter()
+    results = smoothnessCalculation(fileLoc1, fileLoc2, writeFiles=plots)
+    return {name: float(value) for name, value in results.items()}, time.perf_counter() - start
+
+
+def _load_state(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp, path)
+
+
+def run_cohort(root, output=None, jobs=None, plots=False, force=False,
+               sensor1=SENSOR1_PATTERN, sensor2=SENSOR2_PATTERN):
+    """
+    Processes every pair under root and writes the consolidated table.
+
+    Parameters
+    ----------
+    root    : string
+              The directory to search for pairs.
+    output  : string, optional
+              The results table, root/cohort_results.csv by default. The state
+              file is written next to it with a .state.json suffix.
+    jobs    : integer, optional
+              Number of worker processes, one per CPU by default.
+    plots   : bool
+              Also write the per-pair csv files and filter plots next to the
+              recordings, as SmoothnessCalculation.py does. [default = False]
+    force   : bool
+              Process every pair, even if its stored results are up to date.
+
+    Returns
+    -------
+    table : pd.DataFrame
+            One row per pair with its status and results.
+    """
+    if output is None:
+        output = os.path.join(root, "cohort_results.csv")
+    state_path = os.path.splitext(output)[0] + ".state.json"
+    state = {} if force else _load_state(state_path)
+    fingerprint = code_fingerprint()
+
+    pairs = discover_pairs(root, sensor1, sensor2)
+    todo = []
+    for pair, fileLoc1, fileLoc2 in pairs:
+        stamp = input_fingerprint([fileLoc1, fileLoc2], fingerprint, plots)
+        if state.get(pair, {}).get("input") != stamp:
+            state.pop(pair, None)
+            todo.append((pair, fileLoc1, fileLoc2, stamp))
+    print(f"{len(pairs)} pairs found, {len(pairs) - len(todo)} up to date, {len(todo)} to process")
+
+    errors = {}
+    if todo:
+        # the workers must not open plot windows
+        os.environ.setdefault("MPLBACKEND", "Agg")
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(process_pair, fileLoc1, fileLoc2, plots): (pair, stamp)
+                       for pair, fileLoc1, fileLoc2, stamp in todo}
+            for done, future in enumerate(as_completed(futures), 1):
+                pair, stamp = futures[future]
+                try:
+                    results, seconds = future.result()
+                except Exception as e:
+                    # failed pairs are not stored, so they are tried again next run
+                    errors[pair] = f"{type(e).__name__}: {e}"
+                    print(f"[{done}/{len(todo)}] {pair} failed: {errors[pair]}")
+                    continue
+                state[pair] = {"input": stamp, "results": results}
+                _save_state(state_path, state)
+                print(f"[{done}/{len(todo)}] {pair} ({seconds:.2f}s)")
+
+    # pairs that disappeared from the root are dropped from the state and the table
+    found = {pair for pair, _, _ in pairs}
+    state = {pair: entry for pair, entry in state.items() if pair in found}
+    _save_state(state_path, state)
+
+    rows = []
+    for pair, fileLoc1, fileLoc2 in pairs:
+        row = {"pair": pair, "sensor1": os.path.basename(fileLoc1), "sensor2": os.path.basename(fileLoc2)}
+        if pair in state:
+            row["status"] = "ok"
+            row.update(state[pair]["results"])
+        else:
+            row["status"] = errors.get(pair, "not processed")
+        rows.append(row)
+    table = pd.DataFrame(rows)
+    table.to_csv(output, index=False)
+    print(f"Results written to {output}")
+    return table
+
+
+def write_example_pair(directory, seconds=20.0, fs=60, seed=0):
+    """
+    Writes a Sensor_1.csv and Sensor_2.csv pair of squat-like movements in the layout of
+    the DOT exporter (10 lines of device information, then the columns) to directory.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    t = np.arange(int(seconds * fs)) / fs
+    for sensor, depth in ((1, 1.2), (2, 0.9)):
+        # rotation about x by angle, while the sensor moves down and up by height
+        w = 2 * np.pi / 3.0
+        angle = 0.5 * depth * (1 - np.cos(w * t))
+        angle_rate = 0.5 * depth * w * np.sin(w * t)
+        height_acc = -0.2 * w ** 2 * np.cos(w * t)
+        # the accelerometer measures the acceleration plus gravity, in the sensor frame
+        specific = 9.81 + height_acc
+        columns = {
+            "PacketCounter": np.arange(len(t)),
+            "SampleTimeFine": (1_000_000 + t * 1e6).astype(np.int64),
+            "Quat_W": np.cos(angle / 2), "Quat_X": np.sin(angle / 2),
+            "Quat_Y": np.zeros_like(t), "Quat_Z": np.zeros_like(t),
+            "Acc_X": rng.normal(0, 0.05, len(t)),
+            "Acc_Y": specific * np.sin(angle) + rng.normal(0, 0.05, len(t)),
+            "Acc_Z": specific * np.cos(angle) + rng.normal(0, 0.05, len(t)),
+            "Gyr_X": np.degrees(angle_rate) + rng.normal(0, 0.5, len(t)),
+            "Gyr_Y": rng.normal(0, 0.5, len(t)), "Gyr_Z": rng.normal(0, 0.5, len(t)),
+        }
+        path = os.path.join(directory, f"Sensor_{sensor}.csv")
+        with open(path, "w", newline="") as f:
+            f.write("".join(f"Info line {i}\n" for i in range(10)))
+            pd.DataFrame(columns).to_csv(f, index=False)
+
+
+def check(jobs=1):
+    """
+    Runs the whole batch over one generated pair in a temporary directory.
+
+    Returns
+    -------
+    ok : bool
+         True if the pair was processed and every result is a number.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        write_example_pair(os.path.join(root, "example"))
+        table = run_cohort(root, jobs=jobs)
+        row = table.iloc[0]
+        if row["status"] != "ok":
+            print(f"Check failed: {row['status']}")
+            return False
+        values = row.drop(["pair", "sensor1", "sensor2", "status"]).astype(float)
+        if not np.isfinite(values).all():
+            print(f"Check failed, results that are not numbers: {list(values.index[~np.isfinite(values)])}")
+            return False
+        print(f"Check passed, {len(values)} results")
+        return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Smoothness calculation over a cohort of DOT recordings.")
+    parser.add_argument("root", nargs="?", help="directory searched recursively for sensor pairs")
+    parser.add_argument("--output", help="results table (default: <root>/cohort_results.csv)")
+    parser.add_argument("--jobs", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--plots", action="store_true", help="also write the per-pair csv files and plots")
+    parser.add_argument("--force", action="store_true", help="reprocess pairs that are up to date")
+    parser.add_argument("--sensor1", default=SENSOR1_PATTERN, help="glob of the sensor 1 (wrist) csv")
+    parser.add_argument("--sensor2", default=SENSOR2_PATTERN, help="glob of the sensor 2 (hand) csv")
+    parser.add_argument("--check", action="store_true", help="process one generated pair instead of root")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        return 0 if check(args.jobs or 1) else 1
+    if args.root is None:
+        parser.error("the root directory is required unless --check is given")
+
+    table = run_cohort(args.root, args.output, args.jobs, args.plots, args.force, args.sensor1, args.sensor2)
+    return 0 if (table.empty or (table["status"] == "ok").all()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
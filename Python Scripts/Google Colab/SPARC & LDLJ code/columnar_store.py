@@ -0,0 +1,174 @@
+"""
+columnar_store.py converts Movella DOT CSV exports once into a columnar cache of one
+.npy file per column, and memory-maps only the columns an analysis asks for on later runs.
+
+The cache of "<dir>/Sensor_1.csv" lives in "<dir>/.columns/Sensor_1.csv/" and is rebuilt
+whenever the size or modification time of the CSV changes.
+"""
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR_NAME = ".columns"
+CACHE_VERSION = 1
+# the column header line of a DOT export is found by looking for one of these names
+HEADER_MARKERS = ("SampleTimeFine", "PacketCounter", "Quat_W")
+HEADER_SEARCH_LINES = 64
+
+
+def _cache_path(csv_path, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(csv_path)), CACHE_DIR_NAME)
+    return os.path.join(cache_dir, os.path.basename(csv_path))
+
+
+def _column_file(name):
+    return re.sub(r"[^\w.-]", "_", name) + ".npy"
+
+
+def _source_stamp(csv_path):
+    st = os.stat(csv_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def find_header_row(csv_path):
+    """
+    Returns the number of lines before the column header of a DOT export (the
+    exporter writes a block of device information first), or 0 if none of the
+    HEADER_MARKERS is found.
+    """
+    with open(csv_path, "r", encoding="utf-8", errors="replace") as f:
+        for i, line in enumerate(f):
+            if i >= HEADER_SEARCH_LINES:
+                break
+            if any(marker in line for marker in HEADER_MARKERS):
+                return i
+    return 0
+
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def convert_csv(csv_path, skiprows=None, cache_dir=None):
+    """
+    Parses the CSV and writes its columnar cache, replacing any previous one.
+
+    Parameters
+    ----------
+    csv_path : string
+               The DOT CSV export.
+    skiprows : integer, optional
+               Number of lines before the column header. Found with
+               find_header_row() if not given.
+    cache_dir : string, optional
+                Directory to keep the cache in, instead of ".columns" next to
+                the CSV.
+
+    Returns
+    -------
+    path : string
+           The cache directory of the CSV.
+    """
+    return _convert_csv(csv_path, skiprows, cache_dir)[0]
+
+
+def _convert_csv(csv_path, skiprows, cache_dir):
+    # convert_csv(), also returning the meta it wrote: reading meta.json back can find nothing
+    # when another process moves the cache aside in the meantime
+    stamp = _source_stamp(csv_path)
+    if skiprows is None:
+        skiprows = find_header_row(csv_path)
+    data = pd.read_csv(csv_path, skiprows=skiprows)
+
+    path = _cache_path(csv_path, cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # written to a temporary directory and moved into place, so parallel workers and
+    # interrupted runs never leave a half written cache behind
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=os.path.dirname(path))
+    columns = {}
+    for name in data.columns:
+        values = data[name].to_numpy()
+        if values.dtype == object:
+            values = values.astype(str)
+        columns[name] = _column_file(name)
+        np.save(os.path.join(tmp, columns[name]), values)
+    meta = dict(stamp, version=CACHE_VERSION, skiprows=skiprows, rows=len(data), columns=columns)
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    # the previous cache is moved aside rather than deleted first, so it is only missing for the
+    # moment between the two renames (os.replace can't replace a directory on Windows) and its files
+    # stay readable by whoever has them open until it is deleted
+    old = None
+    if os.path.isdir(path):
+        old = tempfile.mkdtemp(prefix=".old-", dir=os.path.dirname(path))
+        try:
+            os.replace(path, os.path.join(old, "cache"))
+        except OSError:
+            pass  # another process moved it aside already
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        # another process got there first with the same data
+        shutil.rmtree(tmp, ignore_errors=True)
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+    return path, meta
+
+
+def load_columns(csv_path, columns=None, skiprows=None, cache_dir=None):
+    """
+    Loads columns of a DOT CSV export from its columnar cache, building the cache
+    first if it is missing or older than the CSV.
+
+    Parameters
+    ----------
+    csv_path : string
+               The DOT CSV export.
+    columns  : list of strings, optional
+               The columns to load. All columns if not given.
+    skiprows, cache_dir :
+               See convert_csv().
+
+    Returns
+    -------
+    columns : dict
+              Column name to read-only np.memmap of the column.
+    """
+    path = _cache_path(csv_path, cache_dir)
+    stamp = _source_stamp(csv_path)
+    for attempt in range(2):
+        meta = _read_meta(path)
+        if (meta is None or meta.get("version") != CACHE_VERSION
+                or meta["size"] != stamp["size"] or meta["mtime_ns"] != stamp["mtime_ns"]
+                or (skiprows is not None and meta["skiprows"] != skiprows)):
+            path, meta = _convert_csv(csv_path, skiprows, cache_dir)
+
+        if columns is None:
+            columns = list(meta["columns"])
+        missing = [name for name in columns if name not in meta["columns"]]
+        if missing:
+            raise KeyError(f"{csv_path} has no column(s) {missing}")
+        try:
+            return {name: np.load(os.path.join(path, meta["columns"][name]), mmap_mode="r") for name in columns}
+        except FileNotFoundError:
+            # another process replaced the cache between reading meta.json and the columns
+            if attempt:
+                raise
+
+
+def load_frame(csv_path, columns=None, skiprows=None, cache_dir=None):
+    """
+    Same as load_columns(), but returns a pandas DataFrame, as pd.read_csv() would.
+    """
+    return pd.DataFrame(load_columns(csv_path, columns, skiprows=skiprows, cache_dir=cache_dir))
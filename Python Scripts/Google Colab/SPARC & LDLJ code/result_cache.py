@@ -0,0 +1,285 @@
+"""
+result_cache.py is a content-addressed disk cache for the results of the smoothness and
+filtering functions.
+
+A result is stored under the hash of the function name, its code and the contents of
+all its arguments, with the defaults filled in, so the same data with the same parameters
+(fs, padlevel, fc, amp_th, filter order, ...) is only ever calculated once, whichever file
+or run it came from. The code hashed is the bytecode and constants of the function and of
+every function it calls that is defined next to it, so changing an implementation (or a
+helper it uses) makes its old results unreachable. The cache is bounded in size and evicts the least recently used
+results first.
+
+It lives in ~/.cache/squat-smoothness by default. Set SMOOTHNESS_CACHE_DIR to move it,
+or to "off" to disable it, and SMOOTHNESS_CACHE_MB to change its size (512 MB).
+"""
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sys
+import tempfile
+import types
+
+import numpy as np
+
+CACHE_VERSION = 2
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "squat-smoothness")
+DEFAULT_MAX_BYTES = 512 * 2 ** 20
+
+
+def _hash_value(h, value):
+    """
+    Feeds a canonical representation of an argument into the hash h.
+    """
+    if isinstance(value, (list, tuple)):
+        try:
+            array = np.asarray(value)
+        except ValueError:
+            array = None
+        if array is not None and array.dtype != object:
+            value = array
+        else:
+            h.update(f"{type(value).__name__}{len(value)}(".encode())
+            for item in value:
+                _hash_value(h, item)
+            h.update(b")")
+            return
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        h.update(f"ndarray{value.dtype}{value.shape}".encode())
+        h.update(value.view(np.uint8).data if value.size else b"")
+    elif isinstance(value, dict):
+        h.update(f"dict{len(value)}(".encode())
+        for key in sorted(value):
+            _hash_value(h, key)
+            _hash_value(h, value[key])
+        h.update(b")")
+    elif value is None or isinstance(value, (bool, int, float, str, bytes, np.generic)):
+        h.update(f"{type(value).__name__}:{value!r}".encode())
+    else:
+        raise TypeError(f"Can't hash an argument of type {type(value).__name__} for the result cache")
+
+
+def _hash_code(h, code):
+    h.update(code.co_code)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _hash_code(h, const)
+        else:
+            h.update(repr(const).encode())
+
+
+def _code_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def _module_directory(obj):
+    module = sys.modules.get(getattr(obj, "__module__", None) or getattr(obj, "__name__", None))
+    path = getattr(module, "__file__", None)
+    return os.path.dirname(os.path.abspath(path)) if path else None
+
+
+def code_fingerprint(function):
+    """
+    Returns a hash of the code of function and of the functions it calls, directly or through
+    other functions, that are defined in modules of the same directory. Functions of other
+    packages (numpy, scipy, ...) are left out, their results are assumed to be stable.
+    """
+    h = hashlib.sha256()
+    directory = _module_directory(function)
+    seen = set()
+
+    def visit(f):
+        f = inspect.unwrap(f)
+        if not isinstance(f, types.FunctionType) or f.__code__ in seen:
+            return
+        seen.add(f.__code__)
+        _hash_code(h, f.__code__)
+        names = _code_names(f.__code__)
+        for name in sorted(names):
+            target = f.__globals__.get(name)
+            if isinstance(target, types.ModuleType):
+                # module.function calls, e.g. helper.getInv
+                if _module_directory(target) == directory:
+                    for attribute in sorted(names):
+                        visit(getattr(target, attribute, None))
+            elif target is not None and _module_directory(target) == directory:
+                visit(target)
+
+    visit(function)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Size-bounded least recently used cache of pickled results in a directory.
+
+    The modification time of an entry is its last use, so the cache can be shared by
+    several processes (e.g. cohort_batch.py workers); each one evicts by the same clock.
+
+    Parameters
+    ----------
+    directory : string
+                Where the entries are kept.
+    max_bytes : integer
+                Size the entries are trimmed to after every write.
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._size = None  # bytes in the directory, scanned on the first write
+
+    def key(self, name, arguments):
+        """
+        Returns the hex digest addressing the result of name(**arguments).
+        """
+        h = hashlib.sha256(f"{CACHE_VERSION}:{name}".encode())
+        for argument in sorted(arguments):
+            h.update(argument.encode())
+            _hash_value(h, arguments[argument])
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".pkl")
+
+    def get(self, key):
+        """
+        Returns
+        -------
+        hit   : bool
+                Whether the key was found.
+        value : object
+                The stored result, None on a miss.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.stats["misses"] += 1
+            return False, None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        self.stats["hits"] += 1
+        return True, value
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        else:
+            self._size += os.path.getsize(path)
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".pkl"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def _evict(self):
+        # other processes may have written as well, so start from the directory itself
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        self._size = 0
+        for path, size, _ in list(self._entries()):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue  # another process removed it already
+            except OSError:
+                # still open or not ours to remove, it stays in the cache
+                self._size += size
+
+
+def _default_cache():
+    directory = os.environ.get("SMOOTHNESS_CACHE_DIR", DEFAULT_DIR)
+    if directory.lower() in ("", "off", "0", "none"):
+        return None
+    max_bytes = int(float(os.environ.get("SMOOTHNESS_CACHE_MB", DEFAULT_MAX_BYTES / 2 ** 20)) * 2 ** 20)
+    return ResultCache(directory, max_bytes)
+
+
+cache = _default_cache()
+
+
+def configure(directory=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Replaces the cache used by the cached functions, or disables it if directory is None.
+    """
+    global cache
+    cache = None if directory is None else ResultCache(directory, max_bytes)
+    return cache
+
+
+def cached(function=None, ignore=()):
+    """
+    Decorator that stores the results of function in the result cache.
+
+    Parameters
+    ----------
+    ignore : tuple of strings
+             Arguments that don't change the result and are left out of the key.
+
+    The uncached function stays available as function.__wrapped__.
+    """
+    if function is None:
+        return lambda f: cached(f, ignore)
+
+    signature = inspect.signature(function)
+    name = f"{function.__module__}.{function.__qualname__}"
+    fingerprint = []  # taken on the first call, once the functions it calls are all defined
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if cache is None:
+            return function(*args, **kwargs)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = {k: v for k, v in bound.arguments.items() if k not in ignore}
+        if not fingerprint:
+            fingerprint.append(code_fingerprint(function))
+        try:
+            key = cache.key(f"{name}:{fingerprint[0]}", arguments)
+        except TypeError:
+            return function(*args, **kwargs)
+        hit, value = cache.get(key)
+        if not hit:
+            value = function(*args, **kwargs)
+            cache.put(key, value)
+        return value
+
+    return wrapper
@@ -2,9 +2,45 @@
 """
 smoothness.py contains a list of functions for estimating movement smoothness.
 """
+from functools import lru_cache
+
 import numpy as np
 
+try:
+    from result_cache import cached
+except ImportError:
+    # smoothness.py used on its own (e.g. copied into a notebook), results are not cached
+    def cached(function=None, ignore=()):
+        return (lambda f: f) if function is None else function
+
 
+@lru_cache(maxsize=64)
+def _sparc_grid(nfft, fs, fc):
+    """
+    Returns the frequency grid for the given FFT size and sampling frequency, and the
+    number of its points at or below the cut off frequency fc. Cached, as the same
+    (nfft, fs, fc) comes up on every call for signals of similar length.
+    """
+    f = np.arange(0, fs, fs / nfft)
+    f.setflags(write=False)
+    return f, int(np.count_nonzero(f <= fc))
+
+
+def _sparc_spectrum(movement, nfft, n_sel, axis=-1):
+    """
+    Returns the magnitude spectrum of the (real) movement data up to the n_sel-th frequency
+    bin, normalised by its maximum, using a real FFT. Bins above fs/2 are the mirror image
+    of the ones below, so they are filled in from the real spectrum when fc > fs/2.
+    """
+    Mf = np.abs(np.fft.rfft(movement, nfft, axis=axis))
+    Mf /= np.max(Mf, axis=axis, keepdims=True)
+    if n_sel > Mf.shape[axis]:
+        mirror = np.flip(np.take(Mf, np.arange(1, nfft - Mf.shape[axis] + 1), axis=axis), axis=axis)
+        Mf = np.concatenate((Mf, mirror), axis=axis)
+    return np.take(Mf, np.arange(n_sel), axis=axis)
+
+
+@cached
 def sparc(movement, fs, padlevel=4, fc=10.0, amp_th=0.05):
     """
     Calcualtes the smoothness of the given speed profile using the modified
@@ -54,38 +90,88 @@ def sparc(movement, fs, padlevel=4, fc=10.0, amp_th=0.05):
 
     """
     try:
+        movement = np.asarray(movement, dtype=float)
         # Number of zeros to be padded.
         nfft = int(pow(2, np.ceil(np.log2(len(movement))) + padlevel))
-        # Frequency
-        f = np.arange(0, fs, fs / nfft)
-        # Normalized magnitude spectrum
-        Mf = abs(np.fft.fft(movement, nfft))
-        Mf = Mf / max(Mf)
-        # Indices to choose only the spectrum within the given cut off
+        # Frequency grid and the number of points within the given cut off
         # frequency Fc.
         # NOTE: This is a low pass filtering operation to get rid of high
         # frequency noise from affecting the next step (amplitude threshold
         # based cut off for  arc length calculation).
-        fc_inx = ((f <= fc) * 1).nonzero()
-        f_sel = f[fc_inx]
-        Mf_sel = Mf[fc_inx]
+        f, n_sel = _sparc_grid(nfft, float(fs), float(fc))
+        f_sel = f[:n_sel]
+        # Normalized magnitude spectrum
+        Mf_sel = _sparc_spectrum(movement, nfft, n_sel)
         # Choose the amplitude threshold based cut off frequency.
         # Index of the last point on the magnitude spectrum that is greater
         # than or equal to the amplitude threshold.
-        inx = ((Mf_sel >= amp_th) * 1).nonzero()[0]
-        fc_inx = range(inx[0], inx[-1] + 1)
-        f_sel = f_sel[fc_inx]
-        Mf_sel = Mf_sel[fc_inx]
+        inx = np.flatnonzero(Mf_sel >= amp_th)
+        f_sel = f_sel[inx[0]:inx[-1] + 1]
+        Mf_sel = Mf_sel[inx[0]:inx[-1] + 1]
         # Calculate arc length
-        new_sal = -sum(
-            np.sqrt(pow(np.diff(f_sel) / (f_sel[-1] - f_sel[0]), 2) +
-                    pow(np.diff(Mf_sel), 2)))
-        
+        new_sal = -np.sum(
+            np.sqrt(np.square(np.diff(f_sel) / (f_sel[-1] - f_sel[0])) +
+                    np.square(np.diff(Mf_sel))))
+
         return new_sal # , (f, Mf), (f_sel, Mf_sel)
     except:
         return np.NaN, np.NaN, np.NaN
 
 
+def sparc_batch(movements, fs, padlevel=4, fc=10.0, amp_th=0.05):
+    """
+    Calculates the spectral arc length of several speed profiles of the same
+    length at once, with a single FFT over all of them.
+
+    Parameters
+    ----------
+    movements : np.array
+                2-D array with one movement speed profile per row.
+    fs        : float
+                The sampling frequency of the data.
+    padlevel  : integer, optional
+                See sparc. [default = 4]
+    fc        : float, optional
+                See sparc. [default = 10.]
+    amp_th    : float, optional
+                See sparc. [default = 0.05]
+
+    Returns
+    -------
+    sal       : np.array
+                The spectral arc length estimate of each row, the same as
+                calling sparc on every row.
+
+    Examples
+    --------
+    >>> t = np.arange(-1, 1, 0.01)
+    >>> move = np.exp(-5*pow(t, 2))
+    >>> sal = sparc_batch(np.array([move, move]), fs=100.)
+    >>> ['%.5f' % s for s in sal]
+    ['-1.41403', '-1.41403']
+
+    """
+    movements = np.atleast_2d(np.asarray(movements, dtype=float))
+    nfft = int(pow(2, np.ceil(np.log2(movements.shape[1])) + padlevel))
+    f, n_sel = _sparc_grid(nfft, float(fs), float(fc))
+    f_sel = f[:n_sel]
+    Mf_sel = _sparc_spectrum(movements, nfft, n_sel, axis=1)
+
+    # First and last point of each row above the amplitude threshold.
+    above = Mf_sel >= amp_th
+    first = np.argmax(above, axis=1)
+    last = n_sel - 1 - np.argmax(above[:, ::-1], axis=1)
+
+    # Arc length of every segment, only the ones between first and last count.
+    span = (f_sel[last] - f_sel[first])[:, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        seg = np.sqrt(np.square(np.diff(f_sel) / span) +
+                      np.square(np.diff(Mf_sel, axis=1)))
+    inx = np.arange(n_sel - 1)
+    inside = (inx >= first[:, np.newaxis]) & (inx < last[:, np.newaxis])
+    return -np.sum(np.where(inside, seg, 0.), axis=1)
+
+
 def dimensionless_jerk_factors(movement, fs, data_type='vel', rem_mean=False):
     """
     Returns the individual factors of the dimensionless jerk metric.
@@ -269,6 +355,7 @@ def log_dimensionless_jerk_factors(movement, fs, data_type='vel',
     return - np.log(dljfac[0]), np.log(dljfac[1]), - np.log(dljfac[2])
 
 
+@cached
 def log_dimensionless_jerk(movement, fs, data_type='vel',
                            rem_mean=False):
     """
@@ -353,40 +440,20 @@ def log_dimensionless_jerk_imu_factors(accls, gyros, grav, fs):
 
     Notes
     -----
-
+    float32 accelerometer and gyroscope data is used as is, without a
+    float64 copy. See log_dimensionless_jerk_imu_batch for many recordings.
 
     Examples
     --------
     """
-    # Sample time
-    dt = 1. / fs
-    _N = len(accls)
-
-    # Movement duration.
-    mdur = _N * dt
-
-    # Gravity subtracted mean square ampitude
-    mamp = np.power(np.linalg.norm(accls), 2) / _N
-    if gyros is not None:
-      mamp = mamp - np.power(np.linalg.norm(grav), 2)
-    
-    # Derivative of the accelerometer signal
-    _daccls = np.vstack((np.zeros((1, 3)), np.diff(accls, axis=0) * fs)).T
-    
-    # Get corrected jerk if gyroscope data is available.
-    if gyros is not None:
-      _awcross = np.array([np.cross(_as, _ws)
-                           for _as, _ws in zip(accls, gyros)]).T
-    else:
-      _awcross = np.zeros(np.shape(_daccls))
-    
-    # Corrected jerk
-    _jsc = _daccls - _awcross
-    mjerk = np.sum(np.power(np.linalg.norm(_jsc, axis=0), 2)) * dt
-
+    mdur, mamp, mjerk = _imu_jerk_factors_batch([accls],
+                                                None if gyros is None
+                                                else [gyros], grav, fs)
+    mdur, mamp, mjerk = mdur[0], mamp[0], mjerk[0]
     return - np.log(mdur), np.log(mamp), - np.log(mjerk)
 
 
+@cached
 def log_dimensionless_jerk_imu(accls, gyros, grav, fs):
     """
     Calculates the smoothness metric for the given IMU data, accelerometer
@@ -427,6 +494,219 @@ def log_dimensionless_jerk_imu(accls, gyros, grav, fs):
     return _f[0] + _f[1] + _f[2]
 
 
+def _imu_jerk_factors_batch(accls, gyros, grav, fs):
+    """
+    Duration, gravity subtracted mean square amplitude and jerk cost of one
+    or more IMU recordings, which may have different lengths. All recordings
+    are processed together: one diff, one batched np.cross and one summation
+    per recording over the concatenated samples. float32 input is kept as
+    float32, the sums are accumulated in float64.
+    """
+    accls = [np.asarray(a) for a in accls]
+    gyros = None if gyros is None else [np.asarray(w) for w in gyros]
+    dtype = np.result_type(np.float32, *accls,
+                           *(gyros if gyros is not None else ()))
+    lengths = np.array([len(a) for a in accls])
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    if len(accls) == 1:
+        _a = np.asarray(accls[0], dtype=dtype)
+        _w = None if gyros is None else np.asarray(gyros[0], dtype=dtype)
+    else:
+        _a = np.concatenate(accls).astype(dtype, copy=False)
+        _w = None if gyros is None else np.concatenate(gyros).astype(dtype, copy=False)
+
+    dt = 1. / fs
+    mdur = lengths * dt
+
+    # Gravity subtracted mean square ampitude
+    mamp = np.add.reduceat(np.sum(np.square(_a), axis=1, dtype=np.float64),
+                           starts) / lengths
+    if _w is not None:
+        mamp = mamp - np.power(np.linalg.norm(grav), 2)
+
+    # Derivative of the accelerometer signal, zero at the first sample of
+    # every recording
+    _jsc = np.empty_like(_a)
+    _jsc[0] = 0
+    np.multiply(np.diff(_a, axis=0), fs, out=_jsc[1:])
+    _jsc[starts] = 0
+
+    # Corrected jerk if gyroscope data is available.
+    if _w is not None:
+        _jsc -= np.cross(_a, _w)
+    mjerk = np.add.reduceat(np.sum(np.square(_jsc), axis=1, dtype=np.float64),
+                            starts) * dt
+    return mdur, mamp, mjerk
+
+
+def log_dimensionless_jerk_imu_batch(accls, gyros, grav, fs):
+    """
+    Calculates log_dimensionless_jerk_imu for many IMU recordings at once.
+
+    Parameters
+    ----------
+    accls : list of np.array or np.array
+            The accelerometer profile of each recording, (samples, 3) arrays
+            that may differ in length, or one (recordings, samples, 3) array.
+    gyros : list of np.array or np.array
+            The matching gyroscope profiles, or None.
+    grav  : np.array
+            Gravity vector shared by all recordings. See
+            log_dimensionless_jerk_imu.
+    fs    : float
+            The sampling frequency of the data.
+
+    Returns
+    -------
+    ldlj  : np.array
+            The log dimensionless jerk estimate of each recording.
+
+    Examples
+    --------
+    >>> t = np.arange(-1, 1, 0.01)
+    >>> move = np.exp(-5*pow(t, 2))
+    >>> accls = np.zeros((2, len(t), 3))
+    >>> accls[:, :, 2] = 9.81  # at rest the accelerometer measures gravity
+    >>> accls[0, :, 0] = move
+    >>> accls[1, :, 0] = move + 0.1 * np.sin(20 * t)
+    >>> gyros = np.zeros((2, len(t), 3))
+    >>> grav = np.array([[0, 0, -9.81]]).T
+    >>> ldlj = log_dimensionless_jerk_imu_batch(accls, gyros, grav, fs=100.)
+    >>> ['%.5f' % l for l in ldlj]
+    ['-2.99543', '-3.87281']
+
+    """
+    accls = list(accls)
+    gyros = None if gyros is None else list(gyros)
+    mdur, mamp, mjerk = _imu_jerk_factors_batch(accls, gyros, grav, fs)
+    return - np.log(mdur) + np.log(mamp) - np.log(mjerk)
+
+
+def _dimensionless_jerk_factors_batch(movements, fs, data_type='vel',
+                                      rem_mean=False):
+    """
+    dimensionless_jerk_factors for a stack of movements of shape
+    (signals, samples, dimensions), returning one array per factor.
+    """
+    param = {'vel': {'n': 2, 'N': 3},
+             'accl': {'n': 1, 'N': 1}}
+    if data_type not in param:
+        _str = '\n'.join(("data_type has to be ('vel', 'accl')!",
+                          "{0} provided is not valid".format(data_type)))
+        raise Exception(_str)
+    n, N = (param[data_type]['n'], param[data_type]['N'])
+
+    _N = movements.shape[1]
+    if _N < 3:
+        _str = '\n'.join(
+            ("Data is too short to calcalate jerk! Data must",
+             "have at least 3 samples ({0} given).".format(_N)))
+        raise Exception(_str)
+
+    dt = 1. / fs
+    if data_type == 'accl' and rem_mean == True:
+        movements = movements - np.mean(movements, axis=1, keepdims=True)
+
+    jerk = np.linalg.norm(np.diff(movements, axis=1, n=n), axis=2)
+    jerk /= np.power(dt, n)
+    mjerk = np.sum(np.power(jerk, 2), axis=1) * dt
+    mdur = np.full(len(movements), np.power(_N * dt, N))
+    mamp = np.power(np.max(np.linalg.norm(movements, axis=2), axis=1), 2)
+    return mdur, mamp, mjerk
+
+
+@cached
+def smoothness(signals, fs, metrics=('sparc', 'dlj', 'ldlj'), names=None,
+               data_type='vel', rem_mean=False, padlevel=4, fc=10.0,
+               amp_th=0.05):
+    """
+    Calculates several smoothness metrics for a stack of signals in one
+    vectorised pass, e.g. all the rows of a SmoothnessCalculation.py report.
+
+    Parameters
+    ----------
+    signals   : np.array
+                Stack of signals with the same sampling frequency and length.
+                Either (signals, samples) for 1-D speed profiles or
+                (signals, samples, dimensions) for multi-dimensional data. A
+                list of equally shaped arrays is stacked.
+    fs        : float
+                The sampling frequency of the data.
+    metrics   : tuple of strings, optional
+                Any of 'sparc', 'dlj' and 'ldlj'. SPARC is calculated on 1-D
+                signals as given and on the magnitude of multi-dimensional
+                ones, DLJ and LDLJ on the signals themselves.
+                [default = ('sparc', 'dlj', 'ldlj')]
+    names     : list of strings, optional
+                Label of each signal, stored in the 'name' field of the
+                result. [default = the signal index]
+    data_type : string or list of strings, optional
+                'vel' or 'accl', for all signals or one per signal. See
+                dimensionless_jerk. [default = 'vel']
+    rem_mean  : boolean or list of booleans, optional
+                For all signals or one per signal. See dimensionless_jerk.
+                [default = False]
+    padlevel, fc, amp_th :
+                See sparc.
+
+    Returns
+    -------
+    result    : np.recarray
+                One record per signal with a 'name' field and a field for
+                each requested metric, in the same order as metrics.
+
+    Examples
+    --------
+    >>> t = np.arange(-1, 1, 0.01)
+    >>> move = np.exp(-5*pow(t, 2))
+    >>> res = smoothness([move, move], fs=100., names=['a', 'b'])
+    >>> ['%.5f' % v for v in (res.sparc[0], res.dlj[0], res.ldlj[1])]
+    ['-1.41403', '-335.74684', '-5.81636']
+
+    """
+    for metric in metrics:
+        if metric not in ('sparc', 'dlj', 'ldlj'):
+            raise Exception("metrics have to be ('sparc', 'dlj', 'ldlj'), "
+                            "{0} provided is not valid".format(metric))
+
+    signals = np.asarray(signals, dtype=float)
+    one_d = signals.ndim == 2
+    if one_d:
+        signals = signals[:, :, np.newaxis]
+    count = len(signals)
+    if names is None:
+        names = [str(i) for i in range(count)]
+    data_types = ([data_type] * count if isinstance(data_type, str)
+                  else list(data_type))
+    rem_means = ([rem_mean] * count if np.ndim(rem_mean) == 0
+                 else list(rem_mean))
+
+    columns = {}
+    if 'sparc' in metrics:
+        speeds = signals[:, :, 0] if one_d else np.linalg.norm(signals, axis=2)
+        columns['sparc'] = sparc_batch(speeds, fs, padlevel, fc, amp_th)
+
+    if 'dlj' in metrics or 'ldlj' in metrics:
+        mdur, mamp, mjerk = (np.empty(count), np.empty(count),
+                             np.empty(count))
+        # one batched pass for every combination of data_type and rem_mean
+        for group in set(zip(data_types, rem_means)):
+            inx = [i for i in range(count)
+                   if (data_types[i], rem_means[i]) == group]
+            (mdur[inx], mamp[inx],
+             mjerk[inx]) = _dimensionless_jerk_factors_batch(
+                signals[inx], fs, *group)
+        if 'dlj' in metrics:
+            columns['dlj'] = - (mdur / mamp) * mjerk
+        if 'ldlj' in metrics:
+            columns['ldlj'] = - np.log(mdur) + np.log(mamp) - np.log(mjerk)
+
+    fields = [metric for metric in metrics if metric in columns]
+    return np.rec.fromarrays([np.asarray(names)] +
+                             [columns[field] for field in fields],
+                             names=['name'] + fields)
+
+
 def sgr(accls, grav):
     """
     Returns the siganl-to-gravity ratio for the given acceleration signal.
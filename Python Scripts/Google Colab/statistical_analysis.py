@@ -19,6 +19,15 @@ import os
 from google.colab import files
 import seaborn as sns
 
+# columnar_store.py (SPARC & LDLJ code) is optional, upload it next to the data to cache the parsed CSVs
+try:
+    from columnar_store import load_frame
+except ImportError:
+    load_frame = None
+
+# Output rate of the DOTs, only used when a file has no SampleTimeFine column (see capture_profile.py)
+SAMPLE_RATE = 60.0
+
 # Function to upload files individually
 def upload_upper_leg():
     print("Please upload the upper leg data file.")
@@ -32,9 +41,20 @@ def upload_lower_leg():
 
 # Function to load data from uploaded files
 def load_data(file_name):
+    if load_frame is not None:
+        # parsed once into the columnar cache, later runs memory-map it
+        return load_frame(file_name, skiprows=0)
     # Read the uploaded CSV file
     return pd.read_csv(file_name)
 
+# Function to create a time array in seconds from the sensor timestamps
+def time_base(data):
+    if 'SampleTimeFine' in data:
+        # SampleTimeFine is a 32-bit microsecond counter, undo its wraparounds
+        steps = np.diff(data['SampleTimeFine'].to_numpy(dtype=np.int64)) % 2**32
+        return np.concatenate(([0], np.cumsum(steps))) / 1e6
+    return np.arange(len(data)) / SAMPLE_RATE
+
 # Function to perform descriptive statistics
 def calculate_statistics(data, label):
     print(f"\nStatistics for {label}:\n")
@@ -83,8 +103,8 @@ def calculate_knee_angle(upper_leg_data, lower_leg_data):
     # Convert to degrees and adjust to represent anatomical knee angle
     knee_angle = 180 - (angle * 180 / np.pi)
 
-    # Create a time array in seconds (assuming 60 Hz sampling rate)
-    time_seconds = np.arange(len(knee_angle)) / 60.0
+    # Create a time array in seconds from the upper leg timestamps
+    time_seconds = time_base(upper_leg_data)
 
     return knee_angle, time_seconds
 
@@ -156,7 +176,7 @@ def generate_graphs(upper_leg_data, lower_leg_data, knee_angle, time_seconds):
 
 # Function to plot acceleration and gyroscope data over time
 def plot_accel_gyro_time_series(data, label):
-    time_seconds = np.arange(len(data)) / 60.0  # Assuming 60 Hz sampling rate
+    time_seconds = time_base(data)
 
     # Plot acceleration over time
     plt.figure(figsize=(10, 6))
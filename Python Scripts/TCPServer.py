@@ -1,24 +1,51 @@
+import os
+import threading
 import time
-import json
 import zmq
 import numpy as np
-from pynput import keyboard
+try:
+    from pynput import keyboard
+except ImportError:
+    keyboard = None  # not available without a display, see xdpchandler.py
 import movelladot_pc_sdk
 from xdpchandler import XdpcHandler
+from frame_assembler import FrameAssembler
+from sensor_stream import StreamSender
+from capture_profile import PROFILES, sample_capacity
+from session_recorder import SessionRecorder
+from latency import LatencyTracer, dump_on_signal
 
 # Global variables
 waitForConnections = True
 is_streaming = False
-last_sensor_data = {"sensors": []}
+stop_event = threading.Event()  # set from another thread to stop streaming and shut down, as Ctrl+C does
+
+CAPTURE_PROFILE = "default"  # see capture_profile.PROFILES
+
+# Sensor stream settings, see sensor_stream.py
+WIRE_FORMAT = "binary"  # "binary" or "json"
+BATCH_FRAMES = 1  # frames per message, more frames per send at the cost of latency
+SEND_HWM = 100  # messages queued for Unity before new ones are dropped
+LOG_INTERVAL = 5.0  # seconds between counter printouts
+TRACE_LATENCY = True  # send sequence numbers and timestamps with every frame, see latency.py
+
+# Session recording settings, see session_recorder.py
+RECORD_SESSION = True  # tee every frame and every decoded sample into SESSION_DIR/session_<date>_<time>.sqr
+SESSION_DIR = "sessions"
 
 def on_press(key):
     global waitForConnections
     waitForConnections = False
 
 class SensorManager:
-    def __init__(self):
-        self.xdpcHandler = XdpcHandler()
+    def __init__(self, profile=PROFILES["default"]):
+        self.profile = profile
+        self.xdpcHandler = XdpcHandler(sample_capacity=sample_capacity(profile))
         self.connected_dots = []
+        self.sample_counts = {}  # samples read so far per device address
+        self.output_rate = profile.output_rate
+        self.assembler = None
+        self.recorder = None  # set by open_recorder, gets every decoded sample
 
     def initialize_and_sync(self):
         if not self.xdpcHandler.initialize():
@@ -47,12 +74,16 @@ class SensorManager:
         print("Synchronisation successful.")
         return True
 
-    def configure_dots(self, output_rate=60):
+    def configure_dots(self, output_rate=None):
+        if output_rate is not None:
+            self.profile = self.profile._replace(output_rate=output_rate)
+        self.output_rate = output_rate = self.profile.output_rate
+        filter_profile = self.profile.filter_profile
         for device in self.connected_dots:
             print(f"Configuring device {device.portInfo().bluetoothAddress()}")
             
-            if device.setOnboardFilterProfile("General"):
-                print("Successfully set profile to General")
+            if device.setOnboardFilterProfile(filter_profile):
+                print(f"Successfully set profile to {filter_profile}")
             else:
                 print("Failed to set filter profile!")
 
@@ -64,8 +95,12 @@ class SensorManager:
             device.setLogOptions(movelladot_pc_sdk.XsLogOptions_Quaternion)
 
     def start_measurement(self):
+        # samples of different sensors belong to the same frame if they are within half a sample period
+        self.assembler = FrameAssembler([device.portInfo().bluetoothAddress() for device in self.connected_dots],
+                                        tolerance_us=0.5e6 / self.output_rate)
+        payload_mode = getattr(movelladot_pc_sdk, f"XsPayloadMode_{self.profile.payload_mode}")
         for device in self.connected_dots:
-            if not device.startMeasurement(movelladot_pc_sdk.XsPayloadMode_ExtendedQuaternion):
+            if not device.startMeasurement(payload_mode):
                 print(f"Could not put device into measurement mode. Reason: {device.lastResultText()}")
                 return False
         return True
@@ -83,40 +118,55 @@ class SensorManager:
     def cleanup(self):
         self.xdpcHandler.cleanup()
 
-    def get_sensor_data(self):
-        data = {"sensors": [], "time": time.time()}
-        for i, device in enumerate(self.connected_dots):
-            if self.xdpcHandler.packetsAvailable():
-                packet = self.xdpcHandler.getNextPacket(device.portInfo().bluetoothAddress())
-                if packet.containsOrientation():
-                    quat = packet.orientationQuaternion()
-                    sensor_data = {
-                        "id": f"sensor{i+1}",  # Explicitly assign sensor1 and sensor2
-                        "quaternion": {
-                            "w": float(quat[0]),
-                            "x": float(quat[1]),
-                            "y": float(quat[2]),
-                            "z": float(quat[3])
-                        }
-                    }
-                    data["sensors"].append(sensor_data)
-        return data
+    def wait_for_data(self, timeout=None):
+        # blocks until every device has a sample that get_sensor_frames has not read yet
+        return self.xdpcHandler.waitForNewSamples(self.sample_counts, timeout)
+
+    def get_sensor_frames(self):
+        # decoded samples since the last call go through the assembler, which pairs them by SampleTimeFine
+        for sensor, device in enumerate(self.connected_dots):
+            address = device.portInfo().bluetoothAddress()
+            samples, self.sample_counts[address] = self.xdpcHandler.samplesSince(
+                address, self.sample_counts.get(address, 0))
+            if self.recorder is not None:
+                # all fields of the profile, including samples the assembler will not match
+                self.recorder.write_samples(sensor, samples)
+            has_orientation = ~np.isnan(samples.orientation[:, 0])
+            self.assembler.add(address, samples.orientation[has_orientation],
+                               samples.sampleTimeFine[has_orientation], samples.arrival[has_orientation])
+
+        return self.assembler.assemble()
+
+    def open_recorder(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, time.strftime("session_%Y%m%d_%H%M%S.sqr"))
+        print(f"Recording session to {path}")
+        self.recorder = SessionRecorder(path, self.assembler.addresses, self.output_rate,
+                                        metadata={"profile": self.profile._asdict()})
+        return self.recorder
 
 def main():
-    global is_streaming, last_sensor_data
+    global is_streaming
     
     # Setup ZeroMQ Socket (PUSH)
     context = zmq.Context()
     socket = context.socket(zmq.PUSH)
+    socket.setsockopt(zmq.SNDHWM, SEND_HWM)
     socket.connect('tcp://localhost:5555')
 
-    sensor_manager = SensorManager()
+    sensor_manager = SensorManager(PROFILES[CAPTURE_PROFILE])
 
     if not sensor_manager.initialize_and_sync():
         sensor_manager.cleanup()
         return
 
     sensor_manager.configure_dots()
+    tracer = LatencyTracer("TCPServer")
+    sender = StreamSender(socket, wire_format=WIRE_FORMAT, batch_frames=BATCH_FRAMES, log_interval=LOG_INTERVAL,
+                          sample_rate=sensor_manager.output_rate, tracer=tracer, trace=TRACE_LATENCY)
+    dump = dump_on_signal(tracer)
+    if dump is not None:
+        print(f"To print the latency histograms, {dump}")
 
     print("Starting measurement...")
     if sensor_manager.start_measurement():
@@ -126,32 +176,38 @@ def main():
         print("Failed to start measurement. Exiting...")
         sensor_manager.cleanup()
         return
+    recorder = sensor_manager.open_recorder(SESSION_DIR) if RECORD_SESSION else None
 
     try:
-        while True:
+        while not stop_event.is_set():
             if is_streaming:
-                data = sensor_manager.get_sensor_data()
-                if data["sensors"]:
-                    last_sensor_data = data
-                    print(f"Sensor Data: {data}")
-                    json_data = json.dumps(data)
-                    socket.send_string(json_data)
-                elif last_sensor_data["sensors"]:
-                    print("No new data, sending last known data")
-                    json_data = json.dumps(last_sensor_data)
-                    socket.send_string(json_data)
-                else:
+                # woken by the live data callback once every sensor has a new sample,
+                # so each synchronised sample set is sent exactly once
+                if not sensor_manager.wait_for_data(timeout=1.0):
                     print("No sensor data available")
+                    continue
+                frames = sensor_manager.get_sensor_frames()
+                if recorder is not None:
+                    recorder.write(frames)
+                sender.send(frames)
             else:
                 print("Streaming is not active")
-
-            time.sleep(0.01)  # Small delay to prevent busy-waiting
+                time.sleep(0.01)  # Small delay to prevent busy-waiting
+        print("\nStop requested, stopping measurements...")
 
     except KeyboardInterrupt:
         print("\nInterrupt received, stopping measurements...")
     except Exception as e:
         print(f"An error occurred: {e}")
     finally:
+        sender.flush()  # the frames of the last partial batch
+        print(f"\nStreamed: {sender.counters}")
+        print(tracer.report())
+        if sensor_manager.assembler is not None:
+            print(f"Frame assembler: {sensor_manager.assembler.stats}")
+        if recorder is not None:
+            recorder.close()
+            print(f"Recorded: {recorder.counters}")
         print("\nStopping measurement...")
         sensor_manager.stop_measurement()
         sensor_manager.cleanup()
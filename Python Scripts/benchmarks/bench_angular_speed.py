@@ -0,0 +1,71 @@
+#####################################################
+# Micro-benchmark for the quaternion to angular speed pipeline
+# Run from the Python Scripts folder:  python benchmarks/bench_angular_speed.py
+#
+# legacy:     the per-sample loops unityConnect.py used to run on every request
+# vectorised: unityConnect.angular_speed
+####################################################
+
+import math
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unityConnect as uc  # noqa: E402
+from synthetic import squat_quaternions  # noqa: E402
+
+SIZES = (1000, 10000, 100000)
+
+
+def legacy_angular_speed(WQuat, XQuat, YQuat, ZQuat, time_array):
+    # copied from the original request handler in unityConnect.py
+    Quat_Array = []
+    for w, x, y, z in zip(WQuat, XQuat, YQuat, ZQuat):
+        Quat_Array.append(np.quaternion(w, x, y, z))
+    Quat_Array = np.array(Quat_Array)
+
+    AngularVelocity2D = uc.angular_velocity2(Quat_Array, time_array)
+
+    AngularVelocityX = []
+    AngularVelocityY = []
+    AngularVelocityZ = []
+    for Vel in AngularVelocity2D:
+        AngularVelocityX.append(Vel[0])
+        AngularVelocityY.append(Vel[1])
+        AngularVelocityZ.append(Vel[2])
+
+    AngularVelocity = []
+    for x, y, z in zip(AngularVelocityX, AngularVelocityY, AngularVelocityZ):
+        dx = math.pow(x, 2)
+        dy = math.pow(y, 2)
+        dz = math.pow(z, 2)
+        AngularVelocity.append(math.sqrt(dx + dy + dz))
+    return AngularVelocity
+
+
+def best_of(func, repeat=5):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    print(f"{'samples':>8} {'legacy ms':>10} {'vectorised ms':>14} {'speed-up':>9}")
+    for n in SIZES:
+        quats, times = squat_quaternions(n)
+        columns = [quats[:, i] for i in range(4)]
+
+        expected = legacy_angular_speed(*columns, times)
+        assert np.allclose(uc.angular_speed(quats, times), expected)
+
+        legacy = best_of(lambda: legacy_angular_speed(*columns, times))
+        vectorised = best_of(lambda: uc.angular_speed(quats, times))
+        print(f"{n:8d} {legacy * 1e3:10.2f} {vectorised * 1e3:14.2f} {legacy / vectorised:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#####################################################
+# Accuracy and speed of the angular velocity methods
+# Run from the Python Scripts folder:  python benchmarks/bench_angular_velocity.py
+#
+# spline:  unityConnect.angular_velocity2, a cubic spline over the four components
+# helper:  SmoothnessCalculationHelper.angular_velocity, a spline per component
+# log:     unityConnect.angular_velocity_fd(method='log'), the rotation between consecutive samples
+# central: unityConnect.angular_velocity_fd(method='central'), central differences
+#
+# The accuracy is measured against the exact velocity of a noiseless synthetic squat, and on the
+# default noisy squat as the difference in SPARC and LDLJ of a 10 s window from the spline's,
+# which is what the live path (unityConnect.ANGULAR_METHOD) reports.
+####################################################
+
+import os
+import sys
+import timeit
+
+import numpy as np
+import quaternion
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "Google Colab", "SPARC & LDLJ code"))
+
+import SmoothnessCalculationHelper as helper  # noqa: E402
+import unityConnect as uc  # noqa: E402
+from synthetic import squat_angular_velocity, squat_quaternions  # noqa: E402
+
+SIZES = (600, 1200, 10000, 100000)
+RATES = (60, 120)
+WINDOW_SECONDS = 10.0
+
+METHODS = {
+    "spline": lambda quats, times: uc.angular_velocity2(quaternion.from_float_array(quats), times),
+    "helper": lambda quats, times: helper.angular_velocity(quaternion.from_float_array(quats), times),
+    "log": lambda quats, times: uc.angular_velocity_fd(quats, times, method='log'),
+    "central": lambda quats, times: uc.angular_velocity_fd(quats, times, method='central'),
+}
+
+
+def best_of(func, repeat=5):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def accuracy():
+    print(f"Error against the exact velocity of a noiseless squat (rad/s), {WINDOW_SECONDS:g} s window")
+    print(f"{'method':<9}{'fs':>5}{'rms':>12}{'max':>12}{'max inside':>12}")
+    for fs in RATES:
+        n = int(WINDOW_SECONDS * fs)
+        quats, times = squat_quaternions(n, fs, noise=0)
+        exact = squat_angular_velocity(n, fs)
+        for name, method in METHODS.items():
+            error = np.linalg.norm(method(quats, times) - exact, axis=1)
+            print(f"{name:<9}{fs:>5}{np.sqrt(np.mean(error ** 2)):>12.2e}{error.max():>12.2e}"
+                  f"{error[1:-1].max():>12.2e}")
+
+    print(f"\nSmoothness of a noisy squat, {WINDOW_SECONDS:g} s windows, difference from the spline")
+    print(f"{'method':<9}{'fs':>5}{'sparc':>10}{'ldlj':>10}{'d sparc':>12}{'d ldlj':>12}")
+    for fs in RATES:
+        n = int(WINDOW_SECONDS * fs)
+        quats, times = squat_quaternions(n, fs)
+        sparc, ldlj = uc.calculate_smoothness(quats, times, fs)
+        for method in uc.ANGULAR_VELOCITY_METHODS:
+            s, l = uc.calculate_smoothness(quats, times, fs, method)
+            print(f"{method:<9}{fs:>5}{s:>10.4f}{l:>10.4f}{s - sparc:>12.2e}{l - ldlj:>12.2e}")
+
+
+def speed():
+    print(f"\n{'samples':>8}" + "".join(f"{name + ' ms':>13}" for name in METHODS)
+          + "".join(f"{name + ' x':>11}" for name in METHODS if name not in ("spline", "helper")))
+    for n in SIZES:
+        quats, times = squat_quaternions(n)
+        timings = {name: best_of(lambda: method(quats, times)) for name, method in METHODS.items()}
+        print(f"{n:8d}" + "".join(f"{t * 1e3:13.3f}" for t in timings.values())
+              + "".join(f"{timings['spline'] / t:10.1f}x" for name, t in timings.items()
+                        if name not in ("spline", "helper")))
+
+    print(f"\nWhole request calculation (uc.calculate_smoothness) of a {WINDOW_SECONDS:g} s window")
+    print(f"{'fs':>5}" + "".join(f"{method + ' ms':>13}" for method in uc.ANGULAR_VELOCITY_METHODS))
+    for fs in RATES:
+        quats, times = squat_quaternions(int(WINDOW_SECONDS * fs), fs)
+        print(f"{fs:>5}" + "".join(f"{best_of(lambda: uc.calculate_smoothness(quats, times, fs, method)) * 1e3:13.3f}"
+                                   for method in uc.ANGULAR_VELOCITY_METHODS))
+
+
+def main():
+    accuracy()
+    speed()
+
+
+if __name__ == "__main__":
+    main()
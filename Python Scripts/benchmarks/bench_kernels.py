@@ -0,0 +1,245 @@
+#####################################################
+# Benchmark suite for the smoothness kernels
+# Run from the Python Scripts folder:  python benchmarks/bench_kernels.py
+#
+# Times every kernel in KERNELS on synthetic squat signals of SIZES samples at each of RATES Hz,
+# writes the results to JSON and compares them with a stored baseline:
+#   python benchmarks/bench_kernels.py --save-baseline          # on the unchanged code
+#   python benchmarks/bench_kernels.py                          # after a change
+# A kernel is reported as a regression when it is more than --threshold slower than the baseline,
+# and as changed when its result no longer matches the baseline's. Either makes the exit status 1.
+# The result cache of smoothness.py is disabled, so every call is computed.
+####################################################
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import timeit
+
+import numpy as np
+import quaternion
+import scipy
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "Google Colab", "SPARC & LDLJ code"))
+
+import result_cache  # noqa: E402
+import smoothness  # noqa: E402
+import SmoothnessCalculationHelper as helper  # noqa: E402
+import unityConnect as uc  # noqa: E402
+from synthetic import squat_imu, squat_quaternions  # noqa: E402
+
+SIZES = (100, 1000, 10000, 100000, 1000000)
+RATES = (60, 120)
+RESULTS_DIR = os.path.join(HERE, "results")
+BASELINE = os.path.join(RESULTS_DIR, "kernels_baseline.json")
+THRESHOLD = 0.10  # relative slow-down reported as a regression
+RESULTS_VERSION = 1
+
+
+class Signals:
+    """
+    The synthetic inputs of one (samples, fs) case, built on first use so a kernel
+    only pays for the signals it needs, and outside of the timed calls.
+    """
+
+    def __init__(self, n, fs):
+        self.n = n
+        self.fs = fs
+        self._cache = {}
+
+    def _get(self, name, build):
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
+    @property
+    def quats(self):
+        # (n, 4) w, x, y, z and sample times
+        return self._get("quats", lambda: squat_quaternions(self.n, self.fs, seed=1))
+
+    @property
+    def rotations(self):
+        return self._get("rotations", lambda: quaternion.from_float_array(self.quats[0]))
+
+    @property
+    def xyzw(self):
+        # a second sensor, in the x, y, z, w order of the DOT exports
+        def build():
+            wxyz1 = self.quats[0]
+            wxyz2, _ = squat_quaternions(self.n, self.fs, depth=0.6, seed=2)
+            return np.roll(wxyz1, -1, axis=1), np.roll(wxyz2, -1, axis=1)
+        return self._get("xyzw", build)
+
+    @property
+    def speed(self):
+        # angular speed profile, the movement the SPARC and jerk metrics are calculated on
+        return self._get("speed", lambda: uc.angular_speed(*self.quats))
+
+    @property
+    def imu(self):
+        return self._get("imu", lambda: squat_imu(self.n, self.fs, seed=1))
+
+
+# kernel name -> function of the Signals that calls it once
+KERNELS = {
+    "smoothness.sparc": lambda s: smoothness.sparc(s.speed, s.fs),
+    "unityConnect.spectral_arclength": lambda s: uc.spectral_arclength(s.speed, s.fs),
+    # smoothness.py's jerk metrics take (samples, dimensions) arrays
+    "smoothness.dimensionless_jerk": lambda s: smoothness.dimensionless_jerk(s.speed[:, None], s.fs),
+    "unityConnect.dimensionless_jerk": lambda s: uc.dimensionless_jerk(s.speed, s.fs),
+    "smoothness.log_dimensionless_jerk": lambda s: smoothness.log_dimensionless_jerk(s.speed[:, None], s.fs),
+    "unityConnect.log_dimensionless_jerk": lambda s: uc.log_dimensionless_jerk(s.speed, s.fs),
+    "smoothness.log_dimensionless_jerk_imu": lambda s: smoothness.log_dimensionless_jerk_imu(
+        s.imu[0], s.imu[1], s.imu[2], s.fs),
+    "unityConnect.angular_velocity": lambda s: uc.angular_velocity(s.rotations, s.quats[1]),
+    "unityConnect.angular_velocity2": lambda s: uc.angular_velocity2(s.rotations, s.quats[1]),
+    "helper.angular_velocity": lambda s: helper.angular_velocity(s.rotations, s.quats[1]),
+    "unityConnect.angular_velocity_fd.log": lambda s: uc.angular_velocity_fd(*s.quats, method='log'),
+    "unityConnect.angular_velocity_fd.central": lambda s: uc.angular_velocity_fd(*s.quats, method='central'),
+    "helper.getInv": lambda s: helper.getInv(s.xyzw[0]),
+    "helper.calcDeltaLegacy": lambda s: helper.calcDeltaLegacy(helper.getInv(s.xyzw[0]), s.xyzw[1]),
+    "helper.relativeRotation": lambda s: helper.relativeRotation(*s.xyzw),
+}
+
+
+def digest(result):
+    """
+    Returns:
+        A float summarising a kernel's result, to notice when an optimisation changes it
+    """
+    if isinstance(result, tuple):
+        result = result[0]  # sparc returns (sal, (f, Mf), (f_sel, Mf_sel))
+    result = np.asarray(result)
+    if result.dtype == np.quaternion:
+        result = quaternion.as_float_array(result)
+    return float(np.sum(np.abs(result.astype(float))))
+
+
+def time_kernel(func, repeat, min_time):
+    """
+    Returns:
+        The best and mean seconds per call over repeat rounds of as many calls as fill min_time,
+        the calls per round and the result of the last call
+    """
+    result = func()  # warm up (imports, lru caches) and keep the result
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+    rounds = [elapsed] + timer.repeat(repeat=repeat - 1, number=number) if repeat > 1 else [elapsed]
+    return min(rounds) / number, sum(rounds) / len(rounds) / number, number, result
+
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__, "scipy": scipy.__version__,
+            "platform": platform.platform(), "machine": platform.machine(), "processor": platform.processor(),
+            "cpus": os.cpu_count()}
+
+
+def run(kernels, sizes, rates, repeat, min_time):
+    results = []
+    print(f"{'kernel':<40}{'samples':>9}{'fs':>5}{'best ms':>12}{'mean ms':>12}{'calls':>7}")
+    for n in sizes:
+        for fs in rates:
+            signals = Signals(n, fs)
+            for name in kernels:
+                best, mean, number, result = time_kernel(lambda: KERNELS[name](signals), repeat, min_time)
+                results.append({"kernel": name, "samples": n, "fs": fs, "seconds": best, "mean": mean,
+                                "calls": number, "rounds": repeat, "value": digest(result)})
+                print(f"{name:<40}{n:>9}{fs:>5}{best * 1e3:>12.4f}{mean * 1e3:>12.4f}{number:>7}")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the ratio of every result to the baseline's.
+
+    Returns:
+        The number of regressions and of changed results
+    """
+    previous = {(r["kernel"], r["samples"], r["fs"]): r for r in baseline["results"]}
+    regressions = changed = 0
+    print(f"\nCompared with the baseline of {baseline['created']} ({baseline['environment']['platform']})")
+    print(f"{'kernel':<40}{'samples':>9}{'fs':>5}{'baseline ms':>13}{'now ms':>12}{'ratio':>8}")
+    for r in results:
+        old = previous.get((r["kernel"], r["samples"], r["fs"]))
+        if old is None:
+            continue
+        ratio = r["seconds"] / old["seconds"]
+        note = ""
+        if ratio > 1 + threshold:
+            note = "  slower"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            note = "  faster"
+        if not np.isclose(r["value"], old["value"], rtol=1e-6, atol=1e-9, equal_nan=True):
+            note += f"  result changed ({old['value']:.9g} -> {r['value']:.9g})"
+            changed += 1
+        print(f"{r['kernel']:<40}{r['samples']:>9}{r['fs']:>5}{old['seconds'] * 1e3:>13.4f}"
+              f"{r['seconds'] * 1e3:>12.4f}{ratio:>7.2f}x{note}")
+    print(f"{regressions} regressions beyond {threshold:.0%}, {changed} changed results")
+    return regressions, changed
+
+
+def save(path, document):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(document, f, indent=1)
+    print(f"Results written to {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the smoothness kernels.")
+    parser.add_argument("--kernels", nargs="+", choices=sorted(KERNELS), default=list(KERNELS),
+                        metavar="KERNEL", help=f"kernels to run (default: all of {', '.join(KERNELS)})")
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES), help="signal lengths in samples")
+    parser.add_argument("--rates", nargs="+", type=float, default=list(RATES), help="sample rates in Hz")
+    parser.add_argument("--repeat", type=int, default=5, help="timed rounds per case, the best one counts")
+    parser.add_argument("--min-time", type=float, default=0.1, help="seconds each round runs for at least")
+    parser.add_argument("--output", help="results file (default: results/kernels_<date>_<time>.json)")
+    parser.add_argument("--baseline", default=BASELINE, help="results to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="also store the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="slow-down reported as a regression")
+    args = parser.parse_args(argv)
+
+    result_cache.configure(None)
+    rates = [int(fs) if float(fs).is_integer() else fs for fs in args.rates]
+    created = datetime.datetime.now().isoformat(timespec="seconds")
+    document = {"version": RESULTS_VERSION, "created": created, "environment": environment(),
+                "results": run(args.kernels, args.sizes, rates, args.repeat, args.min_time)}
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"kernels_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    save(output, document)
+
+    status = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions, changed = compare(document["results"], baseline, args.threshold)
+        status = 1 if regressions or changed else 0
+    elif not args.save_baseline:
+        print(f"No baseline at {args.baseline}, store one with --save-baseline")
+    if args.save_baseline:
+        # a NaN digest matches any other NaN, so it would never catch a change of that kernel
+        invalid = [r for r in document["results"] if not np.isfinite(r["value"])]
+        if invalid:
+            for r in invalid:
+                print(f"Not saving the baseline: {r['kernel']} ({r['samples']} samples, {r['fs']} Hz) "
+                      f"returned {r['value']}")
+            return 1
+        save(args.baseline, document)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+#####################################################
+# Equivalence checks and micro-benchmark for the quaternion kernels of SmoothnessCalculationHelper
+# Run from the Python Scripts folder:  python benchmarks/bench_quaternion_kernels.py
+#
+# legacy:     the per-row loops getInv and calcDelta used to run
+# vectorised: the array kernels that replaced them
+####################################################
+
+import os
+import sys
+import timeit
+
+import numpy as np
+import quaternion
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "Google Colab", "SPARC & LDLJ code"))
+
+import SmoothnessCalculationHelper as helper  # noqa: E402
+from synthetic import squat_quaternions  # noqa: E402
+
+SIZES = (1000, 10000, 100000)
+
+
+def legacy_getInv(QuatArr):
+    # copied from the original SmoothnessCalculationHelper.py
+    invArr = []
+    for Row in QuatArr:
+        Xval = Row[0]
+        Yval = Row[1]
+        Zval = Row[2]
+        Wval = Row[3]
+
+        magQuat = Xval**2 + Yval**2 + Zval**2 + Wval**2
+
+        modX = -Xval/magQuat
+        modY = -Yval/magQuat
+        modZ = -Zval/magQuat
+        modW = Wval/magQuat
+
+        tempArr = [modX, modY, modZ, modW]
+        invArr.append(tempArr)
+
+    return invArr
+
+
+def legacy_calcDelta(Arr1, Arr2):
+    # copied from the original SmoothnessCalculationHelper.py
+    count = 0
+    deltaList = []
+    while count < len(Arr1):
+        W1 = Arr1[count][0]
+        X1 = Arr1[count][1]
+        Y1 = Arr1[count][2]
+        Z1 = Arr1[count][3]
+
+        W2 = Arr2[count][0]
+        X2 = Arr2[count][1]
+        Y2 = Arr2[count][2]
+        Z2 = Arr2[count][3]
+
+        modW = W2 * W1 - X2 * X1 - Y2 * Y1 - Z2 * Z1
+        modX = W2 * X1 + X2 * W1 + Y2 * Z1 - Z2 * Y1
+        modY = W2 * Y1 - X2 * Z1 + Y2 * W1 + Z2 * X1
+        modZ = W2 * Z1 + X2 * Y1 - Y2 * X1 + Z2 * W1
+        deltaList.append(np.quaternion(modX, modY, modZ, modW))
+        count = count + 1
+    return deltaList
+
+
+def check_equivalence(n=2000):
+    """
+    Asserts that the kernels reproduce the legacy loops and numpy-quaternion.
+    """
+    wxyz1, _ = squat_quaternions(n, seed=1)
+    wxyz2, _ = squat_quaternions(n, seed=2)
+    wxyz2 *= 1.1  # not unit length, so the inverse differs from the conjugate
+    xyzw1, xyzw2 = np.roll(wxyz1, -1, axis=1), np.roll(wxyz2, -1, axis=1)
+
+    # same values as the loops, including their mixed-up component order (calcDeltaLegacy)
+    inv = helper.getInv(xyzw1)
+    assert np.allclose(inv, legacy_getInv(xyzw1), rtol=1e-12, atol=0)
+    delta = helper.calcDeltaLegacy(inv, xyzw2)
+    legacy = quaternion.as_float_array(np.array(legacy_calcDelta(legacy_getInv(xyzw1), xyzw2)))
+    assert np.allclose(quaternion.as_float_array(delta), legacy, rtol=1e-12, atol=1e-15)
+
+    # explicit ordering agrees with numpy-quaternion in either layout
+    q1, q2 = quaternion.from_float_array(wxyz1), quaternion.from_float_array(wxyz2)
+    expected = quaternion.as_float_array(q2 * np.reciprocal(q1))
+    assert np.allclose(quaternion.as_float_array(helper.relativeRotation(xyzw1, xyzw2)), expected)
+    assert np.allclose(quaternion.as_float_array(helper.relativeRotation(wxyz1, wxyz2, 'wxyz')), expected)
+    assert np.allclose(helper.quatInverse(wxyz2), quaternion.as_float_array(np.reciprocal(q2)))
+    assert np.allclose(helper.quatMultiply(wxyz2, wxyz1), quaternion.as_float_array(q2 * q1))
+    print("getInv, calcDeltaLegacy, quatInverse, quatMultiply and relativeRotation: equivalent")
+
+
+def best_of(func, repeat=5):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    check_equivalence()
+    print(f"{'samples':>8} {'kernel':>10} {'legacy ms':>10} {'vectorised ms':>14} {'speed-up':>9}")
+    for n in SIZES:
+        wxyz1, _ = squat_quaternions(n, seed=1)
+        wxyz2, _ = squat_quaternions(n, seed=2)
+        xyzw1, xyzw2 = np.roll(wxyz1, -1, axis=1), np.roll(wxyz2, -1, axis=1)
+        inv = helper.getInv(xyzw1)
+        cases = (
+            ("getInv", lambda: legacy_getInv(xyzw1), lambda: helper.getInv(xyzw1)),
+            ("calcDelta", lambda: legacy_calcDelta(inv, xyzw2), lambda: helper.calcDeltaLegacy(inv, xyzw2)),
+        )
+        for name, legacy_func, vectorised_func in cases:
+            legacy = best_of(legacy_func)
+            vectorised = best_of(vectorised_func)
+            print(f"{n:8d} {name:>10} {legacy * 1e3:10.2f} {vectorised * 1e3:14.3f} {legacy / vectorised:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
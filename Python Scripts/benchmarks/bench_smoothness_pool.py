@@ -0,0 +1,96 @@
+#####################################################
+# Throughput benchmark for the smoothness process pool
+# Run from the Python Scripts folder:  python benchmarks/bench_smoothness_pool.py
+#
+# offline: sliding windows over a long recording, serial vs SmoothnessPool
+# live:    several clients pipelining requests at SmoothnessServer, thread vs process mode
+####################################################
+
+import asyncio
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unityConnect as uc  # noqa: E402
+from smoothness_pool import SmoothnessPool  # noqa: E402
+from synthetic import squat_quaternions  # noqa: E402
+
+FS = 60
+WINDOW = 600  # 10 s windows
+STEP = 60  # one window per second of recording
+RECORDING_SECONDS = 600
+LIVE_CLIENTS = 8
+LIVE_REQUESTS = 20  # per client
+LIVE_PORT = 5597
+
+
+def bench_offline(process_counts):
+    quats, times = squat_quaternions(RECORDING_SECONDS * FS, fs=FS)
+    windows = list(range(0, len(quats) - WINDOW + 1, STEP))
+
+    start = time.perf_counter()
+    for first in windows:
+        uc.calculate_smoothness(quats[first:first + WINDOW], times[first:first + WINDOW], FS)
+    serial = time.perf_counter() - start
+    print(f"offline  serial      {len(windows) / serial:8.1f} windows/s")
+
+    for processes in process_counts:
+        with SmoothnessPool(processes=processes) as pool:
+            pool.map_windows(quats[:WINDOW], times[:WINDOW], WINDOW, STEP, FS)  # start the workers
+            start = time.perf_counter()
+            pool.map_windows(quats, times, WINDOW, STEP, FS)
+            elapsed = time.perf_counter() - start
+        print(f"offline  {processes:2d} process  {len(windows) / elapsed:8.1f} windows/s "
+              f"({serial / elapsed:.2f}x)")
+
+
+async def _live_client(port, seed):
+    quats, times = squat_quaternions(WINDOW, fs=FS, seed=seed)
+    samples = np.column_stack((quats, np.full(len(quats), 1 / FS)))
+    payload = uc.encode_binary_samples(samples)
+    frame = uc.FRAME_HEADER.pack(len(payload)) + payload
+
+    reader, writer = await asyncio.open_connection('localhost', port)
+    writer.write(frame * LIVE_REQUESTS)
+    for _ in range(LIVE_REQUESTS):
+        await uc.read_frame_async(reader)
+    writer.close()
+
+
+async def _bench_live(mode, workers):
+    server = uc.SmoothnessServer(port=LIVE_PORT, max_workers=workers, executor_mode=mode)
+    task = asyncio.create_task(server.serve())
+    await asyncio.sleep(0.5)
+    start = time.perf_counter()
+    await asyncio.gather(*(_live_client(LIVE_PORT, seed) for seed in range(LIVE_CLIENTS)))
+    elapsed = time.perf_counter() - start
+    server.stop()
+    await task
+    return elapsed
+
+
+def bench_live(process_counts):
+    requests = LIVE_CLIENTS * LIVE_REQUESTS
+    for mode in ('thread', 'process'):
+        for workers in process_counts:
+            # the server prints every request, keep the benchmark output readable
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                elapsed = asyncio.run(_bench_live(mode, workers))
+            print(f"live     {mode:7s} {workers:2d} workers  {requests / elapsed:8.1f} requests/s")
+
+
+def main():
+    cores = os.cpu_count() or 1
+    process_counts = sorted({1, 2, 4, cores} & set(range(1, cores + 1)))
+    print(f"{cores} cores")
+    bench_offline(process_counts)
+    bench_live(process_counts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#####################################################
+# Synthetic squat-like signals for the benchmarks
+####################################################
+
+import numpy as np
+
+
+def squat_quaternions(n, fs=60, squat_period=3.0, depth=1.2, noise=0.01, seed=0):
+    """
+    Generates a thigh-like orientation that swings about one axis like repeated squats.
+
+    Parameters
+    ----------
+    n            : integer
+                   Number of samples.
+    fs           : float
+                   Sampling frequency in Hz.
+    squat_period : float
+                   Seconds per squat.
+    depth        : float
+                   Peak rotation of a squat in radians.
+    noise        : float
+                   Standard deviation of the rotation noise in radians.
+    seed         : integer
+                   Seed for the noise.
+
+    Returns
+    -------
+    quats : np.array
+            (n, 4) array of unit w, x, y, z quaternion components.
+    times : np.array
+            (n,) array of sample times in seconds.
+    """
+    rng = np.random.default_rng(seed)
+    times = np.arange(n) / fs
+    angle = 0.5 * depth * (1 - np.cos(2 * np.pi * times / squat_period)) + rng.normal(0, noise, n)
+    # small wobble about a second axis so the rotation is not planar
+    wobble = 0.05 * np.sin(2 * np.pi * times / (0.7 * squat_period))
+
+    quats = np.empty((n, 4))
+    quats[:, 0] = np.cos(angle / 2) * np.cos(wobble / 2)
+    quats[:, 1] = np.sin(angle / 2) * np.cos(wobble / 2)
+    quats[:, 2] = np.cos(angle / 2) * np.sin(wobble / 2)
+    quats[:, 3] = np.sin(angle / 2) * np.sin(wobble / 2)
+    return quats, times
+
+
+def squat_angular_velocity(n, fs=60, squat_period=3.0, depth=1.2):
+    """
+    The exact angular velocity of squat_quaternions without noise, to measure the
+    error of the numerical methods against.
+
+    Returns
+    -------
+    omega : np.array
+            (n, 3) array of world frame angular velocities in rad/s.
+    """
+    times = np.arange(n) / fs
+    phase = 2 * np.pi * times / squat_period
+    angle = 0.5 * depth * (1 - np.cos(phase))
+    angle_rate = 0.5 * depth * 2 * np.pi / squat_period * np.sin(phase)
+    wobble_rate = 0.05 * 2 * np.pi / (0.7 * squat_period) * np.cos(phase / 0.7)
+    # the orientation is a rotation by angle about x followed (in the body) by wobble about y
+    return np.column_stack((angle_rate, wobble_rate * np.cos(angle), wobble_rate * np.sin(angle)))
+
+
+
+def squat_imu(n, fs=60, noise=0.05, seed=0, travel=0.4, **kwargs):
+    """
+    Generates accelerometer and gyroscope signals of a sensor moving like
+    squat_quaternions, in the sensor frame.
+
+    Besides turning, the sensor travels forward and back by travel metres with
+    every squat, like a knee does. This linear acceleration is horizontal, so the
+    mean square of the signal stays above |g|^2 and the IMU metrics are finite.
+
+    Parameters
+    ----------
+    n      : integer
+             Number of samples.
+    fs     : float
+             Sampling frequency in Hz.
+    noise  : float
+             Standard deviation of the accelerometer noise in m/s^2.
+    seed   : integer
+             Seed for the noise.
+    travel : float
+             Forward travel of the sensor in metres.
+    kwargs :
+             Passed on to squat_quaternions.
+
+    Returns
+    -------
+    accls : np.array
+            (n, 3) array of accelerations, gravity included, in m/s^2.
+    gyros : np.array
+            (n, 3) array of angular velocities in rad/s.
+    grav  : np.array
+            The gravity vector in the world frame.
+    """
+    import quaternion
+
+    quats, _ = squat_quaternions(n, fs, seed=seed, **kwargs)
+    R = quaternion.from_float_array(quats)
+    grav = np.array([0.0, 0.0, 9.81])
+    # forward (y) position 0.5 * travel * (1 - cos(2 pi t / squat_period)), differentiated twice
+    omega = 2 * np.pi / kwargs.get("squat_period", 3.0)
+    linear = np.zeros((n, 3))
+    linear[:, 1] = 0.5 * travel * omega ** 2 * np.cos(omega * np.arange(n) / fs)
+    # into the sensor frame, conj(q) v q for each sample
+    accls = quaternion.as_vector_part(np.conjugate(R) * quaternion.from_vector_part(grav + linear) * R)
+    accls += np.random.default_rng(seed + 1).normal(0, noise, (n, 3))
+    # body frame angular velocity 2 q* dq/dt, by finite differences
+    Rdot = quaternion.from_float_array(np.gradient(quats, 1 / fs, axis=0))
+    gyros = quaternion.as_float_array(2 * np.conjugate(R) * Rdot)[:, 1:]
+    return accls, gyros, grav
@@ -0,0 +1,30 @@
+#####################################################
+# Capture profiles for the Movella DOTs
+# A profile is chosen per session and sets the output rate, payload mode and onboard filter
+# profile. The output rate travels with the data (sensor stream header, recorder) so every
+# consumer sizes its buffers, FFTs and time bases from it.
+####################################################
+
+from collections import namedtuple
+
+# payload_mode is the name of a movelladot_pc_sdk.XsPayloadMode_ constant
+CaptureProfile = namedtuple("CaptureProfile", ["output_rate", "payload_mode", "filter_profile"])
+
+PROFILES = {
+    # orientation and free acceleration, what the game has always used
+    "default": CaptureProfile(60, "ExtendedQuaternion", "General"),
+    "high_rate": CaptureProfile(120, "ExtendedQuaternion", "General"),
+    # orientation plus calibrated acceleration and angular velocity for offline inertial analysis
+    "inertial": CaptureProfile(60, "CustomMode5", "General"),
+    "inertial_high_rate": CaptureProfile(120, "CustomMode5", "Dynamic"),
+}
+
+SAMPLE_BUFFER_SECONDS = 16  # decoded samples kept per device, see XdpcHandler
+
+
+def sample_capacity(profile):
+    """
+    Returns:
+        The number of decoded samples to keep per device for the profile's output rate
+    """
+    return int(SAMPLE_BUFFER_SECONDS * profile.output_rate)
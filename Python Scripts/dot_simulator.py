@@ -0,0 +1,530 @@
+#####################################################
+# Hardware-free stand-in for the Movella DOT PC SDK (movelladot_pc_sdk)
+#
+# Implements the part of the SDK that xdpchandler.py and TCPServer.py use: a connection manager
+# that "detects" simulated DOTs, devices that accept the configuration calls, and a clock thread
+# that fires onLiveDataAvailable on the registered XdpcHandler with synced SampleTimeFine, like
+# real synced DOTs do. The data is synthesised squat motion or a replay of DOT CSV exports or a
+# session file (see session_recorder.py), at real time or sped up, with optional packet loss.
+#
+# Run the whole TCPServer streaming path without hardware, e.g. 4 sensors at 50x real time with
+# 1% packet loss for 30 seconds, with a local receiver standing in for Unity:
+#   python dot_simulator.py --sensors 4 --speed 50 --loss 0.01 --duration 30 --sink
+#
+# Or use it from a script: install() before importing xdpchandler / TCPServer, then configure().
+####################################################
+
+import argparse
+import sys
+import threading
+import time
+
+import numpy as np
+
+STF_WRAP = 2 ** 32  # SampleTimeFine is an unsigned 32-bit microsecond counter
+
+# SDK constants used by xdpchandler.py and TCPServer.py
+XsPayloadMode_ExtendedQuaternion = "ExtendedQuaternion"
+XsPayloadMode_CompleteQuaternion = "CompleteQuaternion"
+XsPayloadMode_CustomMode5 = "CustomMode5"
+XsPayloadMode_RateQuantities = "RateQuantities"
+XsLogOptions_Quaternion = 0
+XDS_Destructing = "Destructing"
+
+# payload modes that carry calibrated acceleration and angular velocity instead of free acceleration
+INERTIAL_PAYLOADS = (XsPayloadMode_CustomMode5, XsPayloadMode_RateQuantities)
+
+
+def XsTimeStamp_nowMs():
+    return int(time.monotonic() * 1000)
+
+
+def XsResultValueToString(result):
+    return str(result)
+
+
+def XsDotFirmwareUpdateResultToString(result):
+    return str(result)
+
+
+class XsVersion:
+    def toXsString(self):
+        return "dot_simulator"
+
+
+def xsdotsdkDllVersion(version):
+    pass
+
+
+class XsDotCallback:
+    """
+    Base of XdpcHandler, the SDK's version dispatches the C++ callbacks
+    """
+
+    def __init__(self):
+        pass
+
+
+class XsDotUsbDevice:
+    pass
+
+
+class XsDataPacket:
+    """
+    A simulated data packet, XsDataPacket(packet) copies one like the SDK's copy constructor does
+    """
+
+    def __init__(self, other=None):
+        self._orientation = self._freeAcceleration = self._calibratedAcceleration = None
+        self._gyroscope = self._sampleTimeFine = None
+        if other is not None:
+            self.__dict__.update(other.__dict__)
+
+    def containsOrientation(self):
+        return self._orientation is not None
+
+    def orientationQuaternion(self):
+        return self._orientation
+
+    def containsFreeAcceleration(self):
+        return self._freeAcceleration is not None
+
+    def freeAcceleration(self):
+        return self._freeAcceleration
+
+    def containsCalibratedAcceleration(self):
+        return self._calibratedAcceleration is not None
+
+    def calibratedAcceleration(self):
+        return self._calibratedAcceleration
+
+    def containsCalibratedGyroscopeData(self):
+        return self._gyroscope is not None
+
+    def calibratedGyroscopeData(self):
+        return self._gyroscope
+
+    def containsSampleTimeFine(self):
+        return self._sampleTimeFine is not None
+
+    def sampleTimeFine(self):
+        return self._sampleTimeFine
+
+
+class XsDeviceId:
+    def __init__(self, index):
+        self.index = index
+
+    def toXsString(self):
+        return f"SIM{self.index:04d}"
+
+    def __eq__(self, other):
+        return isinstance(other, XsDeviceId) and other.index == self.index
+
+    def __hash__(self):
+        return hash(self.index)
+
+
+class XsPortInfo:
+    def __init__(self, index):
+        self.index = index
+        self._deviceId = XsDeviceId(index)
+
+    def bluetoothAddress(self):
+        return f"D4:22:CD:00:00:{self.index:02X}"
+
+    def isBluetooth(self):
+        return True
+
+    def deviceId(self):
+        return self._deviceId
+
+    def portName(self):
+        return f"sim{self.index}"
+
+    def baudrate(self):
+        return 0
+
+
+class XsDotDevice:
+    """
+    A simulated DOT, configuration calls are stored and always succeed
+    """
+
+    def __init__(self, manager, portInfo):
+        self._manager = manager
+        self._portInfo = portInfo
+        self.outputRate = 60
+        self.filterProfile = "General"
+        self.payloadMode = None  # set while measuring
+
+    def portInfo(self):
+        return self._portInfo
+
+    def bluetoothAddress(self):
+        return self._portInfo.bluetoothAddress()
+
+    def deviceTagName(self):
+        return f"Simulated DOT {self._portInfo.index}"
+
+    def lastResultText(self):
+        return "XRV_OK"
+
+    def setOnboardFilterProfile(self, profile):
+        self.filterProfile = profile
+        return True
+
+    def setOutputRate(self, rate):
+        self.outputRate = rate
+        return True
+
+    def setLogOptions(self, options):
+        return True
+
+    def startMeasurement(self, payloadMode):
+        self.payloadMode = payloadMode
+        self._manager._startClock()
+        return True
+
+    def stopMeasurement(self):
+        self.payloadMode = None
+        return True
+
+
+class SimulatedSource:
+    """
+    Sensor data for the simulator to play back, all sensors sampled at the same SampleTimeFine
+
+    Parameters:
+        sampleTimeFine: (T,) increasing microsecond timestamps, without the 32-bit wrap
+        orientation: (S, T, 4) w, x, y, z quaternions per sensor
+        acceleration: (S, T, 3) m/s^2 per sensor, or None
+        gyroscope: (S, T, 3) deg/s per sensor, or None
+    """
+
+    def __init__(self, sampleTimeFine, orientation, acceleration=None, gyroscope=None):
+        self.sampleTimeFine = np.asarray(sampleTimeFine, dtype=np.int64)
+        self.orientation = np.asarray(orientation, dtype=float)
+        self.acceleration = None if acceleration is None else np.asarray(acceleration, dtype=float)
+        self.gyroscope = None if gyroscope is None else np.asarray(gyroscope, dtype=float)
+
+    @property
+    def sensors(self):
+        return len(self.orientation)
+
+    def __len__(self):
+        return len(self.sampleTimeFine)
+
+
+def synthetic_source(sensors, rate, seconds=60.0, squat_period=3.0, noise=0.01, seed=0):
+    """
+    Returns:
+        A SimulatedSource of sensors squatting together about the x axis, each with its own range of motion
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * rate)
+    t = np.arange(n) / rate
+    phase = (1 - np.cos(2 * np.pi * t / squat_period)) / 2
+    orientation = np.empty((sensors, n, 4))
+    acceleration = np.empty((sensors, n, 3))
+    gyroscope = np.empty((sensors, n, 3))
+    for s in range(sensors):
+        depth = 1.2 / (1 + 0.5 * s)
+        angle = depth * phase + rng.normal(0, noise, n)
+        orientation[s] = np.stack((np.cos(angle / 2), np.sin(angle / 2), np.zeros(n), np.zeros(n)), axis=1)
+        gyroscope[s] = np.stack((np.degrees(np.gradient(angle, t)), np.zeros(n), np.zeros(n)), axis=1)
+        acceleration[s] = np.stack((np.zeros(n), 9.81 * np.sin(angle), 9.81 * np.cos(angle)), axis=1)
+        acceleration[s] += rng.normal(0, 0.05, (n, 3))
+    sampleTimeFine = 1_000_000 + np.round(t * 1e6).astype(np.int64)
+    return SimulatedSource(sampleTimeFine, orientation, acceleration, gyroscope)
+
+
+def csv_source(paths):
+    """
+    Returns:
+        A SimulatedSource replaying DOT CSV exports, one file per sensor, cut to the shortest file
+    """
+    import pandas as pd
+
+    columns = []
+    for path in paths:
+        # the exporter writes a block of device information before the column header
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            skiprows = next((i for i, line in enumerate(f) if "Quat_W" in line), 0)
+        columns.append(pd.read_csv(path, skiprows=skiprows))
+    n = min(len(data) for data in columns)
+
+    def stack(names):
+        if not all(name in data for data in columns for name in names):
+            return None
+        return np.stack([data[names].to_numpy(dtype=float)[:n] for data in columns])
+
+    steps = np.diff(columns[0]["SampleTimeFine"].to_numpy(dtype=np.int64)[:n]) % STF_WRAP
+    sampleTimeFine = columns[0]["SampleTimeFine"].iloc[0] + np.concatenate(([0], np.cumsum(steps)))
+    return SimulatedSource(sampleTimeFine, stack(["Quat_W", "Quat_X", "Quat_Y", "Quat_Z"]),
+                           stack(["Acc_X", "Acc_Y", "Acc_Z"]), stack(["Gyr_X", "Gyr_Y", "Gyr_Z"]))
+
+
+def session_source(path):
+    """
+    Returns:
+        A SimulatedSource replaying the orientations of a session file written by SessionRecorder
+    """
+    from session_recorder import SessionReader
+
+    frames = SessionReader(path).frames()
+    return SimulatedSource(frames["sampleTimeFine"], np.swapaxes(frames["quaternions"], 0, 1))
+
+
+# Simulator settings, see configure()
+settings = {"sensors": 2, "speed": 1.0, "loss": 0.0, "source": None, "loop": True, "seed": 0}
+
+
+def configure(sensors=None, speed=None, loss=None, source=None, loop=None, seed=None):
+    """
+    Sets up the connection managers created from now on
+
+    Parameters:
+        sensors: The number of DOTs detected, ignored when replaying a source
+        speed: Playback speed relative to real time, 0 for as fast as possible
+        loss: The probability that a packet is lost
+        source: A SimulatedSource to replay, None to synthesise squats at the configured output rate
+        loop: Start the source again from the beginning when it ends, with SampleTimeFine carrying on
+        seed: Seed of the packet loss and arrival order
+    """
+    for key, value in dict(sensors=sensors, speed=speed, loss=loss, source=source, loop=loop, seed=seed).items():
+        if value is not None:
+            settings[key] = value
+
+
+def install():
+    """
+    Makes `import movelladot_pc_sdk` import this module instead of the SDK
+    """
+    sys.modules["movelladot_pc_sdk"] = sys.modules[__name__]
+
+
+class XsDotConnectionManager:
+    """
+    Simulated connection manager, owns the devices and the clock thread that feeds the callbacks
+
+    Attributes:
+        stats: packets sent, packets lost, ticks (sample times played back) and lateness, the
+            largest number of seconds the clock fell behind its schedule
+    """
+
+    def __init__(self):
+        self._settings = dict(settings)
+        source = self._settings["source"]
+        sensors = source.sensors if source is not None else self._settings["sensors"]
+        self._ports = [XsPortInfo(i) for i in range(sensors)]
+        self._devices = {}
+        self._handlers = []
+        self._clock = None
+        self._stop = threading.Event()
+        self.stats = {"packets": 0, "lost": 0, "ticks": 0, "lateness": 0.0}
+
+    def addXsDotCallbackHandler(self, handler):
+        self._handlers.append(handler)
+
+    def enableDeviceDetection(self):
+        for port in self._ports:
+            for handler in self._handlers:
+                handler.onAdvertisementFound(port)
+
+    def disableDeviceDetection(self):
+        pass
+
+    def detectUsbDevices(self):
+        return []
+
+    def openPort(self, portInfo):
+        self._devices.setdefault(portInfo.deviceId(), XsDotDevice(self, portInfo))
+        return True
+
+    def device(self, deviceId):
+        return self._devices.get(deviceId)
+
+    def usbDevice(self, deviceId):
+        return None
+
+    def startSync(self, address):
+        return True
+
+    def lastResultText(self):
+        return "XRV_OK"
+
+    def close(self):
+        self._stop.set()
+        if self._clock is not None and self._clock is not threading.current_thread():
+            self._clock.join()
+
+    def _startClock(self):
+        if self._clock is None:
+            self._clock = threading.Thread(target=self._run, name="dot_simulator clock", daemon=True)
+            self._clock.start()
+
+    def _run(self):
+        devices = sorted(self._devices.values(), key=lambda device: device.portInfo().index)
+        source = self._settings["source"]
+        if source is None:
+            source = synthetic_source(len(devices), devices[0].outputRate, seed=self._settings["seed"])
+        speed, loss, loop = self._settings["speed"], self._settings["loss"], self._settings["loop"]
+        rng = np.random.default_rng(self._settings["seed"])
+
+        stf = source.sampleTimeFine - source.sampleTimeFine[0]
+        period = int(np.median(np.diff(stf))) if len(stf) > 1 else 16667
+        offset = 0  # microseconds added to SampleTimeFine by earlier loops of the source
+        start = time.perf_counter()
+        k = 0
+        while not self._stop.is_set():
+            if k == len(source):
+                if not loop:
+                    break
+                offset += int(stf[-1]) + period
+                k = 0
+            elapsed = (offset + stf[k]) / 1e6
+            if speed > 0:
+                delay = start + elapsed / speed - time.perf_counter()
+                if delay > 0.001:
+                    self._stop.wait(delay)
+                else:
+                    self.stats["lateness"] = max(self.stats["lateness"], -delay)
+
+            sampleTimeFine = int(source.sampleTimeFine[0] + offset + stf[k]) % STF_WRAP
+            # synced DOTs sample together but their packets arrive in any order
+            for s in rng.permutation(len(devices)):
+                device = devices[s]
+                if device.payloadMode is None:
+                    continue
+                if loss > 0 and rng.random() < loss:
+                    self.stats["lost"] += 1
+                    continue
+                packet = XsDataPacket()
+                packet._sampleTimeFine = sampleTimeFine
+                packet._orientation = tuple(source.orientation[s, k])
+                if source.acceleration is not None:
+                    if device.payloadMode in INERTIAL_PAYLOADS:
+                        packet._calibratedAcceleration = tuple(source.acceleration[s, k])
+                    else:
+                        packet._freeAcceleration = tuple(source.acceleration[s, k])
+                if source.gyroscope is not None and device.payloadMode in INERTIAL_PAYLOADS:
+                    packet._gyroscope = tuple(source.gyroscope[s, k])
+                for handler in self._handlers:
+                    handler.onLiveDataAvailable(device, packet)
+                self.stats["packets"] += 1
+            self.stats["ticks"] += 1
+            k += 1
+
+
+class StreamSink:
+    """
+    Stands in for Unity: pulls the sensor stream on port 5555, counts what arrives and records the
+    latency of the traced frames (sent->sink and callback->sink, see latency.py)
+    """
+
+    def __init__(self, address="tcp://*:5555"):
+        import zmq
+        from latency import LatencyTracer
+
+        self._context = zmq.Context.instance()
+        self._socket = self._context.socket(zmq.PULL)
+        self._socket.bind(address)
+        self._running = True
+        self.counters = {"messages": 0, "frames": 0, "bytes": 0, "lost": 0, "malformed": 0}
+        self.tracer = LatencyTracer("Sink")
+        self._nextSeq = None
+        self._thread = threading.Thread(target=self._run, name="dot_simulator sink", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        import json
+        import struct
+
+        from latency import now_ns
+        from sensor_stream import STREAM_MAGIC, unpack_frames, unpack_trace
+
+        while self._running:
+            if not self._socket.poll(100):
+                continue
+            parts = self._socket.recv_multipart()
+            received = now_ns()
+            self.counters["messages"] += 1
+            self.counters["bytes"] += sum(len(part) for part in parts)
+            try:
+                if len(parts) >= 2 and parts[0][:4] == STREAM_MAGIC:
+                    frames = len(unpack_frames(parts)[0])
+                    trace = unpack_trace(parts)
+                    traces = [] if trace is None else list(zip(trace["seq"], trace["callback"], trace["sent"]))
+                else:
+                    frames = 1
+                    data = json.loads(parts[0])
+                    traces = [(data["seq"], data["trace"]["callback"], data["trace"]["sent"])] if "trace" in data else []
+            except (ValueError, KeyError, TypeError, struct.error):
+                # a truncated or foreign message, counted and skipped so the sink keeps receiving
+                self.counters["malformed"] += 1
+                continue
+            self.counters["frames"] += frames
+            for seq, callback, sent in traces:
+                # a gap in the sequence numbers is a frame lost between the assembler and here
+                if self._nextSeq is not None and seq > self._nextSeq:
+                    self.counters["lost"] += int(seq) - self._nextSeq
+                self._nextSeq = int(seq) + 1
+                self.tracer.record("sent->sink", int(sent), received)
+                if callback:
+                    self.tracer.record("callback->sink", int(callback), received)
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        self._socket.close(linger=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run TCPServer.py against simulated Movella DOTs.")
+    parser.add_argument("--sensors", type=int, default=2, help="number of simulated DOTs (at least 2)")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed, 10 = 10x real time, 0 = unthrottled")
+    parser.add_argument("--loss", type=float, default=0.0, help="probability that a packet is lost")
+    parser.add_argument("--replay", nargs="+", metavar="FILE",
+                        help="one DOT CSV export per sensor, or one session file (.sqr) to replay")
+    parser.add_argument("--no-loop", action="store_true", help="stop sending when the replay ends")
+    parser.add_argument("--profile", default="default", help="capture profile, see capture_profile.py")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    parser.add_argument("--sink", action="store_true", help="receive the stream here instead of in Unity")
+    parser.add_argument("--no-record", action="store_true", help="don't record a session file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    source = None
+    if args.replay:
+        if len(args.replay) == 1 and args.replay[0].endswith(".sqr"):
+            source = session_source(args.replay[0])
+        else:
+            source = csv_source(args.replay)
+
+    install()
+    configure(sensors=args.sensors, speed=args.speed, loss=args.loss, source=source,
+              loop=not args.no_loop, seed=args.seed)
+
+    import TCPServer
+    import xdpchandler
+
+    xdpchandler.waitForConnections = False  # every simulated DOT is detected at once, don't wait for a key
+    TCPServer.CAPTURE_PROFILE = args.profile
+    TCPServer.RECORD_SESSION = not args.no_record
+
+    sink = StreamSink() if args.sink else None
+    if args.duration:
+        # ends the TCPServer.main loop between two sends, so it shuts down and prints its counters
+        timer = threading.Timer(args.duration, TCPServer.stop_event.set)
+        timer.daemon = True
+        timer.start()
+    TCPServer.main()
+    if sink is not None:
+        sink.close()
+        print(f"Sink received: {sink.counters}")
+        print(sink.tracer.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#####################################################
+# Timestamp-aligned frame assembler for synced Movella DOTs
+# Pairs the samples of N sensors by their SampleTimeFine instead of by arrival order
+####################################################
+
+from collections import deque
+
+import numpy as np
+
+from latency import now_ns
+
+STF_WRAP = 2 ** 32  # SampleTimeFine is an unsigned 32-bit microsecond counter
+
+
+class FrameAssembler:
+    """
+    Aligns the samples of several synced DOTs into frames by device timestamp.
+
+    A frame is only emitted once every sensor has a sample within tolerance of the others.
+    Samples that can no longer be matched are dropped and counted:
+        late:      the sample is older than the last emitted frame
+        unmatched: another sensor has already moved past it (its partner was lost)
+        overflow:  a sensor got more than max_pending samples ahead of the others
+
+    Parameters:
+        addresses: The bluetooth addresses of the sensors, in frame order
+        tolerance_us: The maximum spread of SampleTimeFine within a frame, in microseconds
+        max_pending: The number of unmatched samples kept per sensor
+    """
+
+    def __init__(self, addresses, tolerance_us=8000, max_pending=64):
+        self.addresses = list(addresses)
+        self.tolerance_us = tolerance_us
+        self._pending = {address: deque(maxlen=max_pending) for address in self.addresses}
+        self._newest = {address: None for address in self.addresses}
+        self._lastFrameTime = None
+        self.stats = {"frames": 0, "late": 0, "unmatched": 0, "overflow": 0, "maxSkew": 0}
+
+    def _unwrap(self, address, raw):
+        # make SampleTimeFine continuous across the 32-bit wrap (about every 71 minutes) by
+        # taking the signed 32-bit distance to the newest sample seen so far
+        newest = self._newest[address]
+        if newest is None:
+            t = raw
+        else:
+            delta = (raw - newest) % STF_WRAP
+            if delta >= STF_WRAP // 2:
+                delta -= STF_WRAP
+            t = newest + delta
+        if newest is None or t > newest:
+            self._newest[address] = t
+        return t
+
+    def add(self, address, orientation, sampleTimeFine, arrival=None):
+        """
+        Queues new samples of one sensor
+
+        Parameters:
+            address: The bluetooth address of the sensor
+            orientation: (N, 4) array of w, x, y, z quaternion components, oldest first
+            sampleTimeFine: (N,) array of the matching SampleTimeFine values
+            arrival: (N,) array of the latency.now_ns() times the samples were decoded, if known
+        """
+        pending = self._pending[address]
+        if arrival is None:
+            arrival = [None] * len(sampleTimeFine)
+        for quat, raw, received in zip(np.array(orientation, dtype=float), sampleTimeFine, arrival):
+            t = self._unwrap(address, int(raw))
+            if self._lastFrameTime is not None and t <= self._lastFrameTime:
+                self.stats["late"] += 1
+                continue
+            if len(pending) == pending.maxlen:
+                self.stats["overflow"] += 1
+            pending.append((t, quat, None if received is None else int(received)))
+
+    def assemble(self):
+        """
+        Returns:
+             A list of the frames that can be completed with the queued samples, oldest first.
+             Each frame is a dict with the frame time, the skew (spread of SampleTimeFine in
+             microseconds) and the orientation of every sensor in address order, plus its sequence
+             number and the arrival (of its last sample) and assembled times for the latency trace.
+        """
+        frames = []
+        assembled = now_ns()
+        queues = [self._pending[address] for address in self.addresses]
+        while all(queues):
+            heads = [queue[0][0] for queue in queues]
+            newest = max(heads)
+            if newest - min(heads) > self.tolerance_us:
+                # any sample too far behind the newest head can't be matched any more
+                for queue, head in zip(queues, heads):
+                    if newest - head > self.tolerance_us:
+                        queue.popleft()
+                        self.stats["unmatched"] += 1
+                continue
+
+            samples = [queue.popleft() for queue in queues]
+            skew = newest - min(heads)
+            arrivals = [received for _, _, received in samples if received is not None]
+            self._lastFrameTime = newest
+            frames.append({
+                "sampleTimeFine": newest,
+                "skew": skew,
+                "orientations": [quat for _, quat, _ in samples],
+                "seq": self.stats["frames"] & 0xFFFFFFFF,
+                "arrival": max(arrivals) if arrivals else None,
+                "assembled": assembled,
+            })
+            self.stats["frames"] += 1
+            self.stats["maxSkew"] = max(self.stats["maxSkew"], skew)
+        return frames
@@ -0,0 +1,194 @@
+#####################################################
+# End-to-end latency tracing of the sensor frames
+#
+# Every frame gets a sequence number in the FrameAssembler and monotonic timestamps at each hop:
+#   callback:  XdpcHandler.onLiveDataAvailable decoded the last sample of the frame
+#   assembled: FrameAssembler.assemble completed the frame
+#   sent:      StreamSender handed the message to ZeroMQ
+# and the sequence number, callback and sent timestamps travel with the frame to Unity (see
+# sensor_stream.py), which attaches them to its smoothness requests so unityConnect.py can add
+# its own hops (see ServerReceiver.cs and SquatGameController.cs).
+#
+# The timestamps are now_ns() in Python and Stopwatch.GetTimestamp() in Unity, both the system-wide
+# monotonic clock (QueryPerformanceCounter on Windows, CLOCK_MONOTONIC on Linux), so they are
+# comparable across the processes as long as they all run on the same machine.
+#
+# Each process keeps a LatencyTracer of HDR-style histograms per stage, printed on demand with
+# DUMP_SIGNAL (Ctrl+Break on Windows, kill -USR1 <pid> elsewhere) and when the process exits.
+####################################################
+
+import math
+import os
+import signal
+import threading
+import time
+
+now_ns = time.perf_counter_ns
+
+SUB_BUCKET_BITS = 8  # 256 sub-buckets, values are kept to within 1/128 (0.8%)
+HIGHEST_US = 60_000_000  # longer latencies are counted as a minute
+
+# Ctrl+Break on Windows, SIGUSR1 elsewhere
+DUMP_SIGNAL = getattr(signal, "SIGBREAK", None) or getattr(signal, "SIGUSR1", None)
+
+
+def _bucket_index(value):
+    # values below 2^SUB_BUCKET_BITS get a bucket each, above that every power of two is split into
+    # 2^(SUB_BUCKET_BITS - 1) buckets, the log-linear layout of an HdrHistogram
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    if shift <= 0:
+        return value
+    return (1 << SUB_BUCKET_BITS) + ((shift - 1) << (SUB_BUCKET_BITS - 1)) + (value >> shift) \
+        - (1 << (SUB_BUCKET_BITS - 1))
+
+
+def _bucket_highest(index):
+    # the highest value that falls into the bucket
+    if index < 1 << SUB_BUCKET_BITS:
+        return index
+    half = 1 << (SUB_BUCKET_BITS - 1)
+    shift = (index - (1 << SUB_BUCKET_BITS)) // half + 1
+    mantissa = (index - (1 << SUB_BUCKET_BITS)) % half + half
+    return ((mantissa + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of latencies in microseconds with a fixed relative precision
+
+    Recording is a constant time bucket increment and the memory is fixed (a few thousand counters),
+    so it can stay on for a whole session. Negative latencies, from clocks that don't agree, are
+    counted as 0 and in negative.
+
+    Parameters:
+        highest_us: Latencies above this are counted as highest_us
+    """
+
+    def __init__(self, highest_us=HIGHEST_US):
+        self.highest_us = highest_us
+        self.counts = [0] * (_bucket_index(highest_us) + 1)
+        self.reset()
+
+    def reset(self):
+        self.counts[:] = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.negative = 0
+
+    def record(self, value_us):
+        value = int(value_us)
+        if value < 0:
+            self.negative += 1
+            value = 0
+        value = min(value, self.highest_us)
+        self.counts[_bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.negative += other.negative
+
+    def percentile(self, p):
+        """
+        Returns:
+            The latency in microseconds that p percent of the recorded latencies are at or below,
+            None if nothing was recorded
+        """
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(_bucket_highest(index), self.max)
+        return self.max
+
+    def summary(self):
+        """
+        Returns:
+            A dict of the count and the mean, min, p50, p95, p99 and max latencies in milliseconds
+        """
+        if not self.count:
+            return {"count": 0}
+        return {"count": self.count, "mean": self.total / self.count / 1e3, "min": self.min / 1e3,
+                "p50": self.percentile(50) / 1e3, "p95": self.percentile(95) / 1e3,
+                "p99": self.percentile(99) / 1e3, "max": self.max / 1e3, "negative": self.negative}
+
+
+class LatencyTracer:
+    """
+    A LatencyHistogram per stage, safe to record into from several threads
+
+    Parameters:
+        name: The process or component the stages belong to, used in the report
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, start_ns, end_ns):
+        """
+        Records the time from start_ns to end_ns (now_ns() timestamps) as a latency of stage
+        """
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+            histogram.record((end_ns - start_ns) // 1000)
+
+    def summary(self):
+        """
+        Returns:
+            A dict of stage to LatencyHistogram.summary(), in the order the stages were first recorded
+        """
+        with self._lock:
+            return {stage: histogram.summary() for stage, histogram in self._histograms.items()}
+
+    def reset(self):
+        with self._lock:
+            for histogram in self._histograms.values():
+                histogram.reset()
+
+    def report(self):
+        """
+        Returns:
+            The summary as a table, latencies in milliseconds
+        """
+        lines = [f"{self.name} latency (ms)",
+                 f"{'stage':<28}{'count':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"]
+        for stage, summary in self.summary().items():
+            if not summary["count"]:
+                continue
+            lines.append(f"{stage:<28}{summary['count']:>9}{summary['p50']:>9.2f}{summary['p95']:>9.2f}"
+                         f"{summary['p99']:>9.2f}{summary['max']:>9.2f}")
+            if summary["negative"]:
+                lines[-1] += f"  ({summary['negative']} negative, are the processes on one machine?)"
+        return "\n".join(lines)
+
+
+def dump_on_signal(*tracers):
+    """
+    Prints the reports of the tracers whenever the process receives DUMP_SIGNAL.
+    Has to be called from the main thread.
+
+    Returns:
+        A description of how to trigger the dump, or None if the platform has no DUMP_SIGNAL
+    """
+    if DUMP_SIGNAL is None:
+        return None
+    signal.signal(DUMP_SIGNAL, lambda signum, frame: print("\n".join(tracer.report() for tracer in tracers)))
+    return "press Ctrl+Break" if DUMP_SIGNAL == getattr(signal, "SIGBREAK", None) else f"run kill -USR1 {os.getpid()}"
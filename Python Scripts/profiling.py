@@ -0,0 +1,106 @@
+#####################################################
+# Lightweight per-stage profiling of a request handler, kept in-process
+#
+# A stage is timed by taking a clock() before it and a lap() after it, which records the time in
+# between into an HDR-style histogram of that stage (see latency.py) and returns the clock for the
+# next stage:
+#   t = profiler.clock()
+#   data = json.loads(frame)
+#   t = profiler.lap("decode", t)
+# Counters keep the number of events and the total and largest value counted, e.g. bytes per request.
+# When the profiler is disabled clock(), lap() and count() return straight away.
+####################################################
+
+import datetime
+import json
+import threading
+import time
+
+from latency import LatencyTracer, now_ns
+
+
+class StageProfiler:
+    """
+    Timers per stage and counters, safe to use from several threads
+
+    Parameters:
+        name: The process or component profiled, used in the stats
+        enabled: Whether anything is recorded, can be changed at any time
+    """
+
+    def __init__(self, name, enabled=True):
+        self.name = name
+        self.enabled = enabled
+        self.stages = LatencyTracer(name)
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._since = time.time()
+
+    def clock(self):
+        """
+        Returns:
+            The start time of a stage to pass to lap(), 0 when disabled
+        """
+        return now_ns() if self.enabled else 0
+
+    def lap(self, stage, start):
+        """
+        Records the time since start (from clock() or an earlier lap()) as a duration of stage
+
+        Returns:
+            The current time, the start of the next stage
+        """
+        if not self.enabled:
+            return 0
+        now = now_ns()
+        self.stages.record(stage, start, now)
+        return now
+
+    def add(self, stage, duration_ns):
+        """
+        Records a duration measured elsewhere, e.g. in a worker process
+        """
+        if self.enabled:
+            self.stages.record(stage, 0, duration_ns)
+
+    def count(self, counter, value=1):
+        """
+        Counts one event of counter with the given value (1 to only count events)
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._counters.get(counter)
+            if entry is None:
+                entry = self._counters[counter] = {"count": 0, "total": 0, "max": 0}
+            entry["count"] += 1
+            entry["total"] += value
+            entry["max"] = max(entry["max"], value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._since = time.time()
+        self.stages.reset()
+
+    def stats(self):
+        """
+        Returns:
+            A JSON serialisable dict of the counters (count, total, mean and max) and the stage
+            durations (count, mean, min, p50, p95, p99, max in milliseconds) since the last reset
+        """
+        with self._lock:
+            counters = {counter: dict(entry, mean=entry["total"] / entry["count"])
+                        for counter, entry in self._counters.items()}
+            since = self._since
+        return {"name": self.name, "enabled": self.enabled,
+                "since": datetime.datetime.fromtimestamp(since).isoformat(timespec="seconds"),
+                "seconds": time.time() - since, "counters": counters, "stages": self.stages.summary()}
+
+    def write_stats(self, path, **extra):
+        """
+        Appends the stats, the time and any extra values to path as one line of JSON
+        """
+        record = dict(time=datetime.datetime.now().isoformat(timespec="seconds"), **self.stats(), **extra)
+        with open(path, "a") as f:
+            f.write(json.dumps(record) + "\n")
@@ -0,0 +1,233 @@
+#####################################################
+# Wire format and sender for the sensor stream to Unity (ZeroMQ PUSH, port 5555)
+#
+# binary: a two or three part message
+#   part 1: little-endian header (magic "SQS1", version, sensor count, frame count,
+#           output rate in Hz, flags, 1 reserved byte)
+#   part 2: frame count packed records of (int64 SampleTimeFine, int32 skew in microseconds,
+#           float32 w, x, y, z per sensor)
+#   part 3: only if flags has FLAG_TRACE, frame count records of (uint32 sequence number,
+#           4 reserved bytes, int64 callback and sent timestamps in ns), see latency.py
+# json:   one {"sensors": [...], "rate": ...} string per frame, the original format plus the rate,
+#         and "seq" and "trace": {"callback": ..., "sent": ...} when traced
+####################################################
+
+import json
+import struct
+import time
+
+import numpy as np
+import zmq
+
+from latency import now_ns
+
+STREAM_MAGIC = b"SQS1"
+STREAM_VERSION = 3
+STREAM_HEADER = struct.Struct("<4sBBHHBx")
+FLAG_TRACE = 0x01
+TRACE_DTYPE = np.dtype({"names": ["seq", "callback", "sent"], "formats": ["<u4", "<i8", "<i8"],
+                        "offsets": [0, 8, 16], "itemsize": 24})
+
+
+def frame_dtype(sensors):
+    """
+    Returns:
+        The packed record dtype of one binary frame with the given number of sensors
+    """
+    return np.dtype([("sampleTimeFine", "<i8"), ("skew", "<i4"), ("quaternions", "<f4", (sensors, 4))])
+
+
+def frames_to_records(frames):
+    """
+    Returns:
+        The assembled frames (see FrameAssembler.assemble) as a frame_dtype record array
+    """
+    records = np.empty(len(frames), dtype=frame_dtype(len(frames[0]["orientations"])))
+    records["sampleTimeFine"] = [frame["sampleTimeFine"] for frame in frames]
+    records["skew"] = [frame["skew"] for frame in frames]
+    records["quaternions"] = [frame["orientations"] for frame in frames]
+    return records
+
+
+def frames_to_trace(frames, sent):
+    """
+    Returns:
+        The sequence numbers and callback timestamps of the frames, and the sent timestamp, as a TRACE_DTYPE
+        record array. Frames without an arrival time get a callback timestamp of 0.
+    """
+    trace = np.zeros(len(frames), dtype=TRACE_DTYPE)
+    trace["seq"] = [frame.get("seq", 0) for frame in frames]
+    trace["callback"] = [frame.get("arrival") or 0 for frame in frames]
+    trace["sent"] = sent
+    return trace
+
+
+def pack_frames(frames, sample_rate=0, sent=None):
+    """
+    Packs assembled frames (see FrameAssembler.assemble) into the parts of a binary message
+
+    Parameters:
+        frames: The frames to pack
+        sample_rate: The output rate of the sensors in Hz, 0 if unknown
+        sent: The latency.now_ns() time of sending, None to leave out the trace part
+    """
+    records = frames_to_records(frames)
+    flags = FLAG_TRACE if sent is not None else 0
+    header = STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, records.dtype["quaternions"].shape[0],
+                                len(frames), int(sample_rate), flags)
+    parts = [header, records.tobytes()]
+    if sent is not None:
+        parts.append(frames_to_trace(frames, sent).tobytes())
+    return parts
+
+
+def unpack_frames(parts):
+    """
+    Unpacks a binary message
+
+    Returns:
+        A record array with sampleTimeFine, skew and quaternions ((sensors, 4) w, x, y, z) per frame,
+        and the output rate of the sensors in Hz (0 if unknown)
+    """
+    magic, version, sensors, count, sample_rate, _ = _unpack_header(parts)
+    return np.frombuffer(parts[1], dtype=frame_dtype(sensors), count=count), sample_rate
+
+
+def unpack_trace(parts):
+    """
+    Returns:
+        The TRACE_DTYPE records of a binary message, None if it wasn't traced
+    """
+    magic, version, sensors, count, sample_rate, flags = _unpack_header(parts)
+    if not flags & FLAG_TRACE or len(parts) < 3:
+        return None
+    return np.frombuffer(parts[2], dtype=TRACE_DTYPE, count=count)
+
+
+def _unpack_header(parts):
+    # version 2 is the same header without flags, so it is never traced
+    magic, version, sensors, count, sample_rate, flags = STREAM_HEADER.unpack(parts[0])
+    if magic != STREAM_MAGIC or version not in (2, STREAM_VERSION):
+        raise ValueError(f"Unsupported sensor stream message (magic {magic!r}, version {version}).")
+    return magic, version, sensors, count, sample_rate, flags if version == STREAM_VERSION else 0
+
+
+def frame_to_json(frame, sample_rate=0, sent=None):
+    """
+    Returns:
+        The frame in the original JSON format, with the output rate of the sensors in Hz as "rate",
+        and its sequence number and latency trace timestamps if sent (a latency.now_ns() time) is given
+    """
+    data = {"sensors": [], "time": time.time(), "rate": sample_rate,
+            "sampleTimeFine": frame["sampleTimeFine"], "skew": frame["skew"]}
+    if sent is not None:
+        data["seq"] = frame.get("seq", 0)
+        data["trace"] = {"callback": frame.get("arrival") or 0, "sent": sent}
+    for i, (w, x, y, z) in enumerate(frame["orientations"]):
+        data["sensors"].append({
+            "id": f"sensor{i+1}",  # Explicitly assign sensor1 and sensor2
+            "quaternion": {
+                "w": float(w),
+                "x": float(x),
+                "y": float(y),
+                "z": float(z)
+            }
+        })
+    return json.dumps(data)
+
+
+class StreamSender:
+    """
+    Sends assembled frames over a ZeroMQ PUSH socket, optionally batching several frames per message
+
+    Instead of printing every frame, counters are kept and printed at most every log_interval seconds:
+    frames and messages handed to ZeroMQ, and the frames and messages dropped at the high-water mark.
+    Frames still waiting in a partial batch are in neither until flush() is called.
+    The latency of every frame sent is recorded into tracer (callback->assembled, assembled->sent and
+    callback->sent, see latency.py).
+
+    Parameters:
+        socket: A connected ZeroMQ PUSH socket
+        wire_format: 'binary' or 'json'
+        batch_frames: The number of frames per binary message. A batch is only sent once it is full,
+            which adds up to batch_frames - 1 sample periods of latency
+        log_interval: Seconds between the counter printouts, None to never print
+        sample_rate: The output rate of the sensors in Hz, sent along with every message
+        tracer: A latency.LatencyTracer to record into, None to not record
+        trace: Send the sequence numbers and timestamps along with the frames
+    """
+
+    def __init__(self, socket, wire_format="binary", batch_frames=1, log_interval=5.0, sample_rate=0,
+                 tracer=None, trace=True):
+        if wire_format not in ("binary", "json"):
+            raise ValueError(f"wire_format has to be ('binary', 'json'), {wire_format} provided is not valid")
+        self.socket = socket
+        self.wire_format = wire_format
+        self.batch_frames = batch_frames
+        self.log_interval = log_interval
+        self.sample_rate = sample_rate
+        self.tracer = tracer
+        self.trace = trace
+        self.counters = {"frames": 0, "messages": 0, "bytes": 0, "dropped": 0, "dropped_frames": 0}
+        self._batch = []
+        self._lastLog = time.monotonic()
+        self._lastFrames = 0
+
+    def send(self, frames):
+        for frame in frames:
+            if self.wire_format == "json":
+                sent = now_ns()
+                message = frame_to_json(frame, self.sample_rate, sent if self.trace else None)
+                if self._send([message.encode("utf-8")], 1):
+                    self._record([frame], sent)
+            else:
+                self._batch.append(frame)
+                if len(self._batch) >= self.batch_frames:
+                    self.flush()
+        self._log()
+
+    def flush(self):
+        """
+        Sends the frames of a partial batch, call it before closing the socket
+        """
+        if self._batch:
+            sent = now_ns()
+            if self._send(pack_frames(self._batch, self.sample_rate, sent if self.trace else None), len(self._batch)):
+                self._record(self._batch, sent)
+            self._batch = []
+
+    def _send(self, parts, frames):
+        try:
+            # never block the streamer, Unity only needs the newest frames
+            self.socket.send_multipart(parts, flags=zmq.NOBLOCK)
+        except zmq.Again:
+            self.counters["dropped"] += 1
+            self.counters["dropped_frames"] += frames
+            return False
+        self.counters["messages"] += 1
+        self.counters["frames"] += frames
+        self.counters["bytes"] += sum(len(part) for part in parts)
+        return True
+
+    def _record(self, frames, sent):
+        if self.tracer is None:
+            return
+        for frame in frames:
+            arrival, assembled = frame.get("arrival"), frame.get("assembled")
+            if arrival is not None and assembled is not None:
+                self.tracer.record("callback->assembled", arrival, assembled)
+            if assembled is not None:
+                self.tracer.record("assembled->sent", assembled, sent)
+            if arrival is not None:
+                self.tracer.record("callback->sent", arrival, sent)
+
+    def _log(self):
+        now = time.monotonic()
+        if self.log_interval is None or now - self._lastLog < self.log_interval:
+            return
+        rate = (self.counters["frames"] - self._lastFrames) / (now - self._lastLog)
+        print(f"Streamed {self.counters['frames']} frames ({rate:.1f}/s), {self.counters['messages']} messages, "
+              f"{self.counters['bytes']} bytes, {self.counters['dropped']} messages ({self.counters['dropped_frames']} frames) "
+              f"dropped at the high-water mark")
+        self._lastLog = now
+        self._lastFrames = self.counters["frames"]
@@ -0,0 +1,308 @@
+#####################################################
+# Append-only binary session log of the assembled sensor frames and the raw decoded samples
+#
+# file:   header, metadata, chunk, chunk, ..., index footer
+# header: little-endian (magic "SQR1", version, sensor count, output rate in Hz,
+#         metadata length, start time in seconds since the epoch)
+# meta:   UTF-8 JSON with the sensor addresses and anything else passed to the recorder
+# chunk:  (magic, record count, first and last SampleTimeFine, CRC-32 of the records) followed by
+#         record count fixed-size records, either
+#         "SQRC": assembled frames, sensor_stream.frame_dtype records
+#         "SQRS": every sample decoded from any sensor, matched into a frame or not, with all of its
+#                 fields (SAMPLE_DTYPE records, NaN where the capture profile has no such data)
+# footer: one (offset, record count, first and last SampleTimeFine, kind) entry per chunk, then
+#         (index offset, chunk count, magic "SQRE")
+#
+# Version 1 files hold only frame chunks and have no kind in their index entries.
+#
+# Chunks are only ever appended, so a crash loses at most the frames that were not flushed yet.
+# The footer is written on close; without it the reader rebuilds the index by walking the chunks
+# and stops at the first one that is short or fails its CRC.
+####################################################
+
+import json
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from sensor_stream import frame_dtype, frames_to_records
+
+SESSION_MAGIC = b"SQR1"
+SESSION_VERSION = 2
+SESSION_HEADER = struct.Struct("<4sBBHId")
+CHUNK_MAGIC = b"SQRC"
+SAMPLE_CHUNK_MAGIC = b"SQRS"
+CHUNK_HEADER = struct.Struct("<4sIqqI4x")
+# the fields of xdpchandler.SampleStore, and the index of the sensor in the addresses
+SAMPLE_DTYPE = np.dtype([("sensor", "<u1"), ("sampleTimeFine", "<i8"), ("arrival", "<i8"),
+                         ("orientation", "<f8", 4), ("acceleration", "<f8", 3), ("gyroscope", "<f8", 3)])
+INDEX_ENTRY_V1 = np.dtype([("offset", "<u8"), ("frames", "<u4"), ("first", "<i8"), ("last", "<i8")])
+INDEX_ENTRY = np.dtype([("offset", "<u8"), ("frames", "<u4"), ("first", "<i8"), ("last", "<i8"), ("kind", "<u4")])
+FRAME_CHUNK = 0
+SAMPLE_CHUNK = 1
+CHUNK_KINDS = {CHUNK_MAGIC: FRAME_CHUNK, SAMPLE_CHUNK_MAGIC: SAMPLE_CHUNK}
+FOOTER_MAGIC = b"SQRE"
+FOOTER = struct.Struct("<QI4s")
+
+
+class SessionRecorder:
+    """
+    Tees assembled frames and the raw decoded samples into an append-only session file
+
+    Frames and samples are collected in preallocated chunks that are written once they are full or
+    flush_interval seconds have passed, so memory use does not grow with the length of the session.
+
+    Parameters:
+        path: The file to create, an existing file is overwritten
+        addresses: The bluetooth addresses of the sensors, in frame order
+        sample_rate: The output rate of the sensors in Hz
+        chunk_frames: The maximum number of frames per chunk, and of samples per sensor in a sample chunk
+        flush_interval: The maximum number of seconds a frame waits before it is written
+        fsync: Also ask the OS to put every chunk on disk, which survives a power cut and not just
+            a crash of this process
+        metadata: Extra JSON-serialisable values stored in the header (e.g. the capture profile)
+    """
+
+    def __init__(self, path, addresses, sample_rate, chunk_frames=1024, flush_interval=1.0, fsync=False,
+                 metadata=None):
+        self.path = path
+        self.addresses = list(addresses)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.counters = {"frames": 0, "samples": 0, "chunks": 0, "bytes": 0}
+        self._chunk = np.empty(chunk_frames, dtype=frame_dtype(len(self.addresses)))
+        self._pending = 0
+        self._samples = np.empty(chunk_frames * len(self.addresses), dtype=SAMPLE_DTYPE)
+        self._pendingSamples = 0
+        self._index = []
+        self._lastFlush = time.monotonic()
+
+        meta = dict(metadata or {}, addresses=self.addresses)
+        meta = json.dumps(meta).encode("utf-8")
+        self._file = open(path, "wb")
+        self._file.write(SESSION_HEADER.pack(SESSION_MAGIC, SESSION_VERSION, len(self.addresses),
+                                             int(sample_rate), len(meta), time.time()))
+        self._file.write(meta)
+        self._sync()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, frames):
+        """
+        Queues assembled frames (see FrameAssembler.assemble), writing chunks as they fill up
+        """
+        if frames:
+            records = frames_to_records(frames)
+            while len(records):
+                n = min(len(records), len(self._chunk) - self._pending)
+                self._chunk[self._pending:self._pending + n] = records[:n]
+                self._pending += n
+                records = records[n:]
+                if self._pending == len(self._chunk):
+                    self._write_chunk(CHUNK_MAGIC, self._chunk[:self._pending])
+                    self._pending = 0
+        self._flush_due()
+
+    def write_samples(self, sensor, samples):
+        """
+        Queues decoded samples of one sensor, whether or not they end up in a frame
+
+        Parameters:
+            sensor: The index of the sensor in addresses
+            samples: xdpchandler.Samples columns (see XdpcHandler.samplesSince)
+        """
+        start = 0
+        while start < len(samples.sampleTimeFine):
+            n = min(len(samples.sampleTimeFine) - start, len(self._samples) - self._pendingSamples)
+            records = self._samples[self._pendingSamples:self._pendingSamples + n]
+            records["sensor"] = sensor
+            for field in ("sampleTimeFine", "arrival", "orientation", "acceleration", "gyroscope"):
+                records[field] = getattr(samples, field)[start:start + n]
+            self._pendingSamples += n
+            start += n
+            if self._pendingSamples == len(self._samples):
+                self._write_chunk(SAMPLE_CHUNK_MAGIC, self._samples[:self._pendingSamples])
+                self._pendingSamples = 0
+        self._flush_due()
+
+    def _flush_due(self):
+        if (self._pending or self._pendingSamples) and time.monotonic() - self._lastFlush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Appends the queued frames and samples as one chunk each
+        """
+        self._lastFlush = time.monotonic()
+        if self._pending:
+            self._write_chunk(CHUNK_MAGIC, self._chunk[:self._pending])
+            self._pending = 0
+        if self._pendingSamples:
+            self._write_chunk(SAMPLE_CHUNK_MAGIC, self._samples[:self._pendingSamples])
+            self._pendingSamples = 0
+
+    def _write_chunk(self, magic, records):
+        data = records.tobytes()
+        # samples of several sensors are interleaved, so their first and last are the range
+        first, last = int(records["sampleTimeFine"].min()), int(records["sampleTimeFine"].max())
+        offset = self._file.tell()
+        self._file.write(CHUNK_HEADER.pack(magic, len(records), first, last, zlib.crc32(data)))
+        self._file.write(data)
+        self._sync()
+
+        kind = CHUNK_KINDS[magic]
+        self._index.append((offset, len(records), first, last, kind))
+        self.counters["frames" if kind == FRAME_CHUNK else "samples"] += len(records)
+        self.counters["chunks"] += 1
+        self.counters["bytes"] += CHUNK_HEADER.size + len(data)
+
+    def close(self):
+        """
+        Writes the remaining frames and samples and the index footer
+        """
+        if self._file.closed:
+            return
+        self.flush()
+        offset = self._file.tell()
+        self._file.write(np.array(self._index, dtype=INDEX_ENTRY).tobytes())
+        self._file.write(FOOTER.pack(offset, len(self._index), FOOTER_MAGIC))
+        self._sync()
+        self._file.close()
+
+    def _sync(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+
+class SessionReader:
+    """
+    Memory-maps a session file written by SessionRecorder
+
+    Parameters:
+        path: The session file
+
+    Attributes:
+        info: The header fields and metadata (addresses, sample_rate, start_time, ...)
+        index: INDEX_ENTRY array of the frame chunks
+        sample_index: INDEX_ENTRY array of the sample chunks, empty for version 1 files
+        complete: False if the file had no footer (the recorder did not close) and the index
+            was rebuilt from the chunks
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._map = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, sensors, sample_rate, meta_len, start_time = SESSION_HEADER.unpack_from(self._map)
+        if magic != SESSION_MAGIC or version not in (1, SESSION_VERSION):
+            raise ValueError(f"Unsupported session file (magic {magic!r}, version {version}).")
+        self.version = version
+        self._entry = INDEX_ENTRY if version >= 2 else INDEX_ENTRY_V1
+        self.dtype = frame_dtype(sensors)
+        self._dataStart = SESSION_HEADER.size + meta_len
+        meta = bytes(self._map[SESSION_HEADER.size:self._dataStart])
+        self.info = dict(json.loads(meta.decode("utf-8")), sensors=sensors, sample_rate=sample_rate,
+                         start_time=start_time)
+
+        index = self._read_footer()
+        self.complete = index is not None
+        if not self.complete:
+            index = self._scan_chunks()
+        if version >= 2:
+            self.index = index[index["kind"] == FRAME_CHUNK]
+            self.sample_index = index[index["kind"] == SAMPLE_CHUNK]
+        else:
+            self.index = index
+            self.sample_index = np.empty(0, dtype=INDEX_ENTRY)
+
+    def __len__(self):
+        return int(self.index["frames"].sum())
+
+    def _read_footer(self):
+        size = len(self._map)
+        if size < self._dataStart + FOOTER.size:
+            return None
+        offset, chunks, magic = FOOTER.unpack_from(self._map, size - FOOTER.size)
+        if magic != FOOTER_MAGIC or offset + chunks * self._entry.itemsize != size - FOOTER.size:
+            return None
+        return np.frombuffer(self._map, dtype=self._entry, count=chunks, offset=offset)
+
+    def _scan_chunks(self):
+        index = []
+        offset = self._dataStart
+        size = len(self._map)
+        while offset + CHUNK_HEADER.size <= size:
+            magic, frames, first, last, crc = CHUNK_HEADER.unpack_from(self._map, offset)
+            if magic not in CHUNK_KINDS or (self.version < 2 and magic != CHUNK_MAGIC):
+                break
+            kind = CHUNK_KINDS[magic]
+            end = offset + CHUNK_HEADER.size + frames * (self.dtype if kind == FRAME_CHUNK else SAMPLE_DTYPE).itemsize
+            if end > size or zlib.crc32(self._map[offset + CHUNK_HEADER.size:end]) != crc:
+                break
+            index.append((offset, frames, first, last) + ((kind,) if self.version >= 2 else ()))
+            offset = end
+        return np.array(index, dtype=self._entry)
+
+    def chunk(self, i):
+        """
+        Returns:
+            The records of chunk i, a read-only view into the file
+        """
+        start = int(self.index["offset"][i]) + CHUNK_HEADER.size
+        return self._map[start:start + int(self.index["frames"][i]) * self.dtype.itemsize].view(self.dtype)
+
+    def sample_chunk(self, i):
+        """
+        Returns:
+            The SAMPLE_DTYPE records of sample chunk i, a read-only view into the file
+        """
+        start = int(self.sample_index["offset"][i]) + CHUNK_HEADER.size
+        return self._map[start:start + int(self.sample_index["frames"][i]) * SAMPLE_DTYPE.itemsize].view(SAMPLE_DTYPE)
+
+    def frames(self, first=None, last=None):
+        """
+        Returns:
+            The records of the chunks that overlap the SampleTimeFine range [first, last] (the whole
+            session by default), trimmed to the range, oldest first
+        """
+        return self._select(self.index, self.chunk, self.dtype, first, last)
+
+    def samples(self, sensor=None, first=None, last=None):
+        """
+        Parameters:
+            sensor: The index or bluetooth address of a sensor, None for all sensors
+
+        Returns:
+            The SAMPLE_DTYPE records of the decoded samples in the SampleTimeFine range [first, last]
+            (the whole session by default), in the order they were decoded
+        """
+        records = self._select(self.sample_index, self.sample_chunk, SAMPLE_DTYPE, first, last)
+        if sensor is not None:
+            if isinstance(sensor, str):
+                sensor = self.info["addresses"].index(sensor)
+            records = records[records["sensor"] == sensor]
+        return records
+
+    def _select(self, index, chunk, dtype, first, last):
+        selected = np.ones(len(index), dtype=bool)
+        if first is not None:
+            selected &= index["last"] >= first
+        if last is not None:
+            selected &= index["first"] <= last
+        chunks = [chunk(i) for i in np.flatnonzero(selected)]
+        if not chunks:
+            return np.empty(0, dtype=dtype)
+        records = np.concatenate(chunks)
+        keep = np.ones(len(records), dtype=bool)
+        if first is not None:
+            keep &= records["sampleTimeFine"] >= first
+        if last is not None:
+            keep &= records["sampleTimeFine"] <= last
+        return records[keep]
@@ -0,0 +1,122 @@
+#####################################################
+# Process pool for the smoothness metrics
+# Evaluates SPARC and LDLJ for many sessions or windows in parallel. The sample arrays are
+# copied once into a shared memory block and every worker reads its slice from there, so
+# only the block name and slice bounds are pickled per task.
+####################################################
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from unityConnect import calculate_smoothness
+
+FIELDS = 5  # w, x, y, z, time
+
+
+def _calculate_shared(name, shape, start, stop, fs):
+    # runs in the worker process
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        window = block[start:stop]
+        try:
+            result = calculate_smoothness(window[:, :4], window[:, 4], fs)
+        except Exception:
+            result = (np.nan, np.nan)
+        # views into the block have to be released before the memory is closed
+        del block, window
+        return result
+    finally:
+        shm.close()
+
+
+class SmoothnessPool:
+    """
+    Pool of worker processes that calculates SPARC and LDLJ in parallel.
+
+    Parameters
+    ----------
+    processes : integer, optional
+                Number of worker processes. [default = number of cores]
+
+    Examples
+    --------
+    >>> with SmoothnessPool(processes=4) as pool:
+    ...     results = pool.map(sessions, fs=60)
+    """
+
+    def __init__(self, processes=None):
+        self._executor = ProcessPoolExecutor(max_workers=processes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def _run(self, block, slices, fs):
+        shm = shared_memory.SharedMemory(create=True, size=max(block.nbytes, 1))
+        try:
+            shared = np.ndarray(block.shape, dtype=np.float64, buffer=shm.buf)
+            shared[:] = block
+            del shared
+            futures = [self._executor.submit(_calculate_shared, shm.name, block.shape, start, stop, fs)
+                       for start, stop in slices]
+            return [future.result() for future in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def map(self, sessions, fs):
+        """
+        Calculates the smoothness of every session.
+
+        Parameters
+        ----------
+        sessions : iterable
+                   (quats, times) pairs, with quats an (N, 4) array of w, x, y, z
+                   components and times the (N,) sample times.
+        fs       : float
+                   The sampling frequency passed on to the smoothness metrics.
+
+        Returns
+        -------
+        results  : list
+                   (sparc, ldlj) for each session, (nan, nan) where the calculation failed.
+        """
+        blocks = [np.column_stack((quats, times)) for quats, times in sessions]
+        bounds = np.cumsum([0] + [len(b) for b in blocks])
+        block = np.concatenate(blocks) if blocks else np.empty((0, FIELDS))
+        return self._run(block, list(zip(bounds[:-1], bounds[1:])), fs)
+
+    def map_windows(self, quats, times, window, step, fs):
+        """
+        Calculates the smoothness of sliding windows over one recording. The recording is
+        shared once, each window is only a slice of it.
+
+        Parameters
+        ----------
+        quats  : np.array
+                 (N, 4) array of w, x, y, z quaternion components.
+        times  : np.array
+                 (N,) array of sample times.
+        window : integer
+                 Number of samples per window.
+        step   : integer
+                 Number of samples between the starts of consecutive windows.
+        fs     : float
+                 The sampling frequency passed on to the smoothness metrics.
+
+        Returns
+        -------
+        results : list
+                  (sparc, ldlj) for each window, (nan, nan) where the calculation failed.
+        """
+        block = np.column_stack((quats, times))
+        slices = [(start, start + window) for start in range(0, len(block) - window + 1, step)]
+        return self._run(block, slices, fs)
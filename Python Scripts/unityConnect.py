@@ -1,332 +1,978 @@
-#####################################################
-# Eve Cooper 19780207
-# Project 1 - MXEN40001
-# Calculating the Ranges for movement Smoothness
-####################################################
-
-import socket
-import json
-
-import numpy as np
-import pandas as pd
-import math
-import quaternion
-import struct  # Import struct module to pack and unpack data
-
-
-####################################################################################################################
-
-# FUNCTIONS
-
-# https://www.programcreek.com/python/example/125385/numpy.quaternion   Ex 17
-def angular_velocity(R, t):
-    from scipy.interpolate import InterpolatedUnivariateSpline as spline
-    R = quaternion.as_float_array(R)
-    # create array of same size as R
-    Rdot = np.empty_like(R)
-    for i in range(4):  # as .as_float_array, extracts the quarternion to 4 individual numbers
-        # create spline (connect all points to create a function, then take the derivative with respect to time
-        # ==> velocity (Rdot)
-        Rdot[:, i] = spline(t, R[:, i]).derivative()(t)
-    R = quaternion.from_float_array(R)  # ber ack to quarternion array
-    Rdot = quaternion.from_float_array(Rdot)  # back to quarternion array
-    return quaternion.as_float_array(2 * Rdot / R)[:, 1:]  # (2 * ds/dt) / s
-
-def angular_velocity2(R, t):
-    # this method was used to validate the angular velocity method
-    # as this method was from the quaternion.quaternion_time_series
-    # this is the qt.angular_velocity(R,t) function that has been used
-    # i have left it here so that we know what is going on in the function
-    from scipy.interpolate import CubicSpline
-
-    R = quaternion.as_float_array(R)
-    Rdot = CubicSpline(t, R).derivative()(t)
-    R = quaternion.from_float_array(R)
-    Rdot = quaternion.from_float_array(Rdot)
-    return quaternion.as_float_array(2 * Rdot / R)[:, 1:]
-
-
-def spectral_arclength(movement, fs, padlevel=4, fc=10.0, amp_th=0.05):
-    """
-    Calcualtes the smoothness of the given speed profile using the modified spectral
-    arc length metric.
-    Parameters
-    ----------
-    movement : np.array
-               The array containing the movement speed profile.
-    fs       : float
-               The sampling frequency of the data.
-    padlevel : integer, optional
-               Indicates the amount of zero padding to be done to the movement
-               data for estimating the spectral arc length. [default = 4]
-    fc       : float, optional
-               The max. cut off frequency for calculating the spectral arc
-               length metric. [default = 10.]
-    amp_th   : float, optional
-               The amplitude threshold to used for determing the cut off
-               frequency upto which the spectral arc length is to be estimated.
-               [default = 0.05]
-    Returns
-    -------
-    sal      : float
-               The spectral arc length estimate of the given movement's
-               smoothness.
-    (f, Mf)  : tuple of two np.arrays
-               This is the frequency(f) and the magntiude spectrum(Mf) of the
-               given movement data. This spectral is from 0. to fs/2.
-    (f_sel, Mf_sel) : tuple of two np.arrays
-                      This is the portion of the spectrum that is selected for
-                      calculating the spectral arc length.
-    Notes
-    -----
-    This is the modfieid spectral arc length metric, which has been tested only
-    for discrete movements.
-    It is suitable for movements that are a few seconds long, but for long
-    movements it might be slow and results might not make sense (like any other
-    smoothness metric).
-    Examples
-    --------
-    >>> t = np.arange(-1, 1, 0.01)
-    >>> move = np.exp(-5*pow(t, 2))
-    >>> sal, _, _ = spectral_arclength(move, fs=100.)
-    >>> '%.5f' % sal
-    '-1.41403'
-    """
-    # Number of zeros to be padded.
-    nfft = int(pow(2, np.ceil(np.log2(len(movement))) + padlevel))
-
-    # Frequency
-    f = np.arange(0, fs, fs / nfft)
-    # Normalized magnitude spectrum
-    Mf = abs(np.fft.fft(movement, nfft))
-    Mf = Mf / max(Mf)
-
-    # Indices to choose only the spectrum within the given cut off frequency Fc.
-    # NOTE: This is a low pass filtering operation to get rid of high frequency
-    # noise from affecting the next step (amplitude threshold based cut off for
-    # arc length calculation).
-    fc_inx = ((f <= fc) * 1).nonzero()
-    f_sel = f[fc_inx]
-    Mf_sel = Mf[fc_inx]
-
-    # Choose the amplitude threshold based cut off frequency.
-    # Index of the last point on the magnitude spectrum that is greater than
-    # or equal to the amplitude threshold.
-    inx = ((Mf_sel >= amp_th) * 1).nonzero()[0]
-    fc_inx = range(inx[0], inx[-1] + 1)
-    f_sel = f_sel[fc_inx]
-    Mf_sel = Mf_sel[fc_inx]
-
-    # Calculate arc length
-    new_sal = -sum(np.sqrt(pow(np.diff(f_sel) / (f_sel[-1] - f_sel[0]), 2) +
-                           pow(np.diff(Mf_sel), 2)))
-    return new_sal, (f, Mf), (f_sel, Mf_sel)
-
-def dimensionless_jerk(movement, fs):
-    """
-    Calculates the smoothness metric for the given speed profile using the dimensionless jerk
-    metric.
-
-    Parameters
-    ----------
-    movement : np.array
-               The array containing the movement speed profile.
-    fs       : float
-               The sampling frequency of the data.
-    Returns
-    -------
-    dl       : float
-               The dimensionless jerk estimate of the given movement's smoothness.
-    Notes
-    -----
-
-    Examples
-    --------
-    >>> t = np.arange(-1, 1, 0.01)
-    >>> move = np.exp(-5*pow(t, 2))
-    >>> dl = dimensionless_jerk(move, fs=100.)
-    >>> '%.5f' % dl
-    '-335.74684'
-    """
-    # first enforce data into an numpy array.
-    movement = np.array(movement)
-
-    # calculate the scale factor and jerk.
-    movement_peak = max(abs(movement))
-    dt = 1. / fs
-    movement_dur = len(movement) * dt
-    jerk = np.diff(movement, 2) / pow(dt, 2)
-    scale = pow(movement_dur, 3) / pow(movement_peak, 2)
-
-    # estimate dj
-    return - scale * sum(pow(jerk, 2)) * dt
-
-
-def log_dimensionless_jerk(movement, fs):
-    """
-    Calculates the smoothness metric for the given speed profile using the log dimensionless jerk
-    metric.
-
-    Parameters
-    ----------
-    movement : np.array
-               The array containing the movement speed profile.
-    fs       : float
-               The sampling frequency of the data.
-    Returns
-    -------
-    ldl      : float
-               The log dimensionless jerk estimate of the given movement's smoothness.
-    Notes
-    -----
-
-    Examples
-    --------
-    >>> t = np.arange(-1, 1, 0.01)
-    >>> move = np.exp(-5*pow(t, 2))
-    >>> ldl = log_dimensionless_jerk(move, fs=100.)
-    >>> '%.5f' % ldl
-    '-5.81636'
-    """
-    return -np.log(abs(dimensionless_jerk(movement, fs)))
-
-
-# Function to receive data with a variable size
-def receive_data_with_length(socket_conn):
-    # Receive the length of the incoming data (as a 4-byte integer)
-    data_length_bytes = socket_conn.recv(4)
-    if not data_length_bytes:
-        return None  # No data received, return None
-
-    # Unpack the length as an unsigned 32-bit integer
-    data_length = struct.unpack("!I", data_length_bytes)[0]
-
-    # Receive the actual data
-    received_data = b''
-    while len(received_data) < data_length:
-        chunk = socket_conn.recv(min(1024, data_length - len(received_data)))
-        if not chunk:
-            return None  # No more data to receive
-        received_data += chunk
-
-    return received_data
-
-
-####################################################################################################################
-
-HOST = 'localhost'  # Localhost
-PORT = 5556       # Choose a port number
-
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
-    server_socket.bind((HOST, PORT))
-    server_socket.listen()
-
-    print(f"Server listening on {HOST}:{PORT}")
-
-    connection, address = server_socket.accept()
-    with connection:
-        print(f"Connected by {address}")
-
-        while True:
-            data = connection.recv(60000)
-            print("data receiving...")
-            if not data:
-                break
-
-            try:
-                received_data_str = data.decode("utf-8")
-                the_data = json.loads(received_data_str)
-
-                print("Received data:", the_data)  # Print the received data
-
-                quaternions = the_data['quaternions']
-                deltaTime = the_data['deltaTime']
-                total_time = the_data['time']
-
-                print('received data')
-
-                WQuat = []
-                XQuat = []
-                YQuat = []
-                ZQuat = []
-                timestamps = []
-
-                for quaternion_entry in quaternions:
-                    WQuat.append(quaternion_entry["w"])
-                    XQuat.append(quaternion_entry["x"])
-                    YQuat.append(quaternion_entry["y"])
-                    ZQuat.append(quaternion_entry["z"])
-                    timestamps.append(quaternion_entry["timestamp"])
-
-                WQuat = np.array(WQuat)
-                XQuat = np.array(XQuat)
-                YQuat = np.array(YQuat)
-                ZQuat = np.array(ZQuat)
-                timestamps = np.array(timestamps)
-
-                Quat_Array = []
-                for w, x, y, z in zip(WQuat, XQuat, YQuat, ZQuat):
-                    Quat_Array.append(np.quaternion(w, x, y, z))
-
-                Quat_Array = np.array(Quat_Array)
-
-                # Use the timestamps from the quaternion data
-                time_array = np.cumsum(timestamps)
-
-                AngularVelocity2D = angular_velocity2(Quat_Array, time_array)  # produces 2d array
-                # [[xVel,yVel,zVel],[xVel,yVel,zVel],[xVel,yVel,zVel]...]  Assuming it is angular velocity in x,y,z planes
-
-                AngularVelocityX = []
-                AngularVelocityY = []
-                AngularVelocityZ = []
-                for Vel in AngularVelocity2D:  # Split into 3 Arrays of x,y,z
-                    # Vel = [xVel,yVel,zVel]
-                    AngularVelocityX.append(Vel[0])
-                    AngularVelocityY.append(Vel[1])
-                    AngularVelocityZ.append(Vel[2])
-
-                AngularVelocity = []
-                for x, y, z in zip(AngularVelocityX, AngularVelocityY, AngularVelocityZ):
-                    dx = math.pow(x, 2)
-                    dy = math.pow(y, 2)
-                    dz = math.pow(z, 2)
-                    AngularVelocity.append(math.sqrt(dx + dy + dz))  # square root of velocities
-
-                # CALCULATE SMOOTHNESS MEASURES
-
-                sparc_Angular, _, _ = spectral_arclength(AngularVelocity, fs=9, padlevel=4, fc=10.0, amp_th=0.05)
-                ldlj_Angular = log_dimensionless_jerk(AngularVelocity, fs=9)
-
-                print("SPARC: ")
-                print(sparc_Angular)
-                print("LDLJ: ")
-                print(ldlj_Angular)
-
-                # Send a response (if needed)
-                # Create a response dictionary with the data you want to send back
-                response_data = {
-                    "message": "Data received successfully",
-                    "SPARC": sparc_Angular,  # Add your additional data here
-                    "LDLJ": ldlj_Angular
-                }
-
-                connection.sendall(json.dumps(response_data).encode("utf-8"))
-                print("Data Sent")
-            except json.decoder.JSONDecodeError as e:
-                # Handle the case where the received data is not valid JSON
-                print("Error decoding JSON:", e)
-            except Exception as e:
-                print(f"An error occurred: {e}")
-                # You may choose to close the connection or take other appropriate action
-
-            # Close the server socket (outside the loop)
-connection.close()
-
-    #        # Process the received data (deserialize if it's JSON)
-    #        received_data = json.loads(data.decode())
-    #        # Perform some actions with received_data
-    #        print(received_data)
-
-    #        # Send a response (if needed)
-    #        response_data = {"message": "Data received successfully"}
-    #        connection.sendall(json.dumps(response_data).encode())
\ No newline at end of file
+#####################################################
+# Eve Cooper 19780207
+# Project 1 - MXEN40001
+# Calculating the Ranges for movement Smoothness
+####################################################
+
+import json
+import asyncio
+import signal
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+import quaternion
+import struct  # Import struct module to pack and unpack data
+from functools import lru_cache
+
+from latency import LatencyTracer, dump_on_signal, now_ns
+from profiling import StageProfiler
+
+
+####################################################################################################################
+
+# FUNCTIONS
+
+# https://www.programcreek.com/python/example/125385/numpy.quaternion   Ex 17
+def angular_velocity(R, t):
+    from scipy.interpolate import InterpolatedUnivariateSpline as spline
+    R = quaternion.as_float_array(R)
+    # create array of same size as R
+    Rdot = np.empty_like(R)
+    for i in range(4):  # as .as_float_array, extracts the quarternion to 4 individual numbers
+        # create spline (connect all points to create a function, then take the derivative with respect to time
+        # ==> velocity (Rdot)
+        Rdot[:, i] = spline(t, R[:, i]).derivative()(t)
+    R = quaternion.from_float_array(R)  # ber ack to quarternion array
+    Rdot = quaternion.from_float_array(Rdot)  # back to quarternion array
+    return quaternion.as_float_array(2 * Rdot / R)[:, 1:]  # (2 * ds/dt) / s
+
+def angular_velocity2(R, t):
+    # this method was used to validate the angular velocity method
+    # as this method was from the quaternion.quaternion_time_series
+    # this is the qt.angular_velocity(R,t) function that has been used
+    # i have left it here so that we know what is going on in the function
+    from scipy.interpolate import CubicSpline
+
+    R = quaternion.as_float_array(R)
+    Rdot = CubicSpline(t, R).derivative()(t)
+    R = quaternion.from_float_array(R)
+    Rdot = quaternion.from_float_array(Rdot)
+    return quaternion.as_float_array(2 * Rdot / R)[:, 1:]
+
+
+ANGULAR_VELOCITY_METHODS = ('spline', 'log', 'central')
+
+
+def angular_velocity_fd(quats, times, method='log'):
+    """
+    Calculates the angular velocity of a quaternion time series from neighbouring samples in one
+    vectorised pass, a fast alternative to fitting splines (angular_velocity, angular_velocity2).
+    Like those it returns the world frame velocity, the vector part of 2 * dq/dt * q^-1.
+
+    Parameters
+    ----------
+    quats  : np.array
+             (N, 4) array of unit w, x, y, z quaternion components, N >= 3.
+    times  : np.array
+             (N,) array of strictly increasing sample times.
+    method : string, optional
+             'log': the rotation between consecutive samples, 2 * log(q[k+1] * conj(q[k])) / dt,
+                    exact for a constant velocity and unaffected by sign flips of the quaternions.
+                    The interval velocities are interpolated to the sample times.
+             'central': second order central differences of the components (np.gradient),
+                    the derivative the splines approximate.
+             [default = 'log']
+
+    Returns
+    -------
+    omega : np.array
+            (N, 3) array of angular velocities in rad per unit of times.
+    """
+    if method not in ('log', 'central'):
+        raise ValueError(f"method has to be ('log', 'central'), {method} provided is not valid")
+    quats = np.asarray(quats, dtype=float)
+    times = np.asarray(times, dtype=float)
+    if len(quats) < 3:
+        raise ValueError(f"Need at least 3 samples to calculate the angular velocity ({len(quats)} given).")
+    R = quaternion.from_float_array(quats)
+
+    if method == 'central':
+        Rdot = quaternion.from_float_array(np.gradient(quats, times, axis=0, edge_order=2))
+        return quaternion.as_float_array(2 * Rdot * np.conjugate(R))[:, 1:]
+
+    # rotation from each sample to the next, in the hemisphere of the shorter way round
+    delta = quaternion.as_float_array(R[1:] * np.conjugate(R[:-1]))
+    delta[delta[:, 0] < 0] *= -1
+    w = delta[:, 0]
+    v = delta[:, 1:]
+    norm = np.linalg.norm(v, axis=1)
+    # log of a unit quaternion is atan2(|v|, w) * v / |v|, which tends to v / w for small angles
+    small = norm < 1e-12
+    scale = np.arctan2(norm, w) / np.where(small, 1.0, norm)
+    scale[small] = 1 / w[small]
+    dt = np.diff(times)
+    rates = v * (2 * scale / dt)[:, None]  # the velocity over each interval, centred between samples
+
+    omega = np.empty((len(quats), 3))
+    # weights of the central difference on an uneven grid
+    before = dt[:-1, None]
+    after = dt[1:, None]
+    omega[1:-1] = (after * rates[:-1] + before * rates[1:]) / (before + after)
+    # linear extrapolation of the interval velocities to the first and last samples
+    omega[0] = rates[0] - (rates[1] - rates[0]) * dt[0] / (dt[0] + dt[1])
+    omega[-1] = rates[-1] + (rates[-1] - rates[-2]) * dt[-1] / (dt[-1] + dt[-2])
+    return omega
+
+
+@lru_cache(maxsize=64)
+def _sparc_grid(nfft, fs, fc):
+    # Frequency grid for the FFT size and sampling frequency, and the number of its points at or
+    # below fc. Cached because every request with a similar window length asks for the same one.
+    f = np.arange(0, fs, fs / nfft)
+    f.setflags(write=False)
+    return f, int(np.count_nonzero(f <= fc))
+
+
+def _mirror_spectrum(Mf, nfft, n_sel):
+    # Returns the first n_sel bins of the full spectrum from the real FFT bins in Mf (last axis).
+    # Bins above fs/2 mirror the ones below, which matters when fc > fs/2 (e.g. fs=9, fc=10).
+    half = Mf.shape[-1]
+    if n_sel <= half:
+        return Mf[..., :n_sel]
+    mirror = Mf[..., nfft - half:0:-1]
+    return np.concatenate((Mf, mirror), axis=-1)[..., :n_sel]
+
+
+def spectral_arclength(movement, fs, padlevel=4, fc=10.0, amp_th=0.05):
+    """
+    Calcualtes the smoothness of the given speed profile using the modified spectral
+    arc length metric.
+    Parameters
+    ----------
+    movement : np.array
+               The array containing the movement speed profile.
+    fs       : float
+               The sampling frequency of the data.
+    padlevel : integer, optional
+               Indicates the amount of zero padding to be done to the movement
+               data for estimating the spectral arc length. [default = 4]
+    fc       : float, optional
+               The max. cut off frequency for calculating the spectral arc
+               length metric. [default = 10.]
+    amp_th   : float, optional
+               The amplitude threshold to used for determing the cut off
+               frequency upto which the spectral arc length is to be estimated.
+               [default = 0.05]
+    Returns
+    -------
+    sal      : float
+               The spectral arc length estimate of the given movement's
+               smoothness.
+    (f, Mf)  : tuple of two np.arrays
+               This is the frequency(f) and the magntiude spectrum(Mf) of the
+               given movement data. This spectral is from 0. to fs/2.
+    (f_sel, Mf_sel) : tuple of two np.arrays
+                      This is the portion of the spectrum that is selected for
+                      calculating the spectral arc length.
+    Notes
+    -----
+    This is the modfieid spectral arc length metric, which has been tested only
+    for discrete movements.
+    It is suitable for movements that are a few seconds long, but for long
+    movements it might be slow and results might not make sense (like any other
+    smoothness metric).
+    Examples
+    --------
+    >>> t = np.arange(-1, 1, 0.01)
+    >>> move = np.exp(-5*pow(t, 2))
+    >>> sal, _, _ = spectral_arclength(move, fs=100.)
+    >>> '%.5f' % sal
+    '-1.41403'
+    """
+    movement = np.asarray(movement, dtype=float)
+    # Number of zeros to be padded.
+    nfft = int(pow(2, np.ceil(np.log2(len(movement))) + padlevel))
+
+    # Frequency grid and the number of points within the given cut off frequency Fc.
+    # NOTE: This is a low pass filtering operation to get rid of high frequency
+    # noise from affecting the next step (amplitude threshold based cut off for
+    # arc length calculation).
+    f, n_sel = _sparc_grid(nfft, float(fs), float(fc))
+    # Normalized magnitude spectrum, 0 to fs/2
+    Mf = np.abs(np.fft.rfft(movement, nfft))
+    Mf /= np.max(Mf)
+    f_sel = f[:n_sel]
+    Mf_sel = _mirror_spectrum(Mf, nfft, n_sel)
+
+    # Choose the amplitude threshold based cut off frequency.
+    # Index of the last point on the magnitude spectrum that is greater than
+    # or equal to the amplitude threshold.
+    inx = np.flatnonzero(Mf_sel >= amp_th)
+    f_sel = f_sel[inx[0]:inx[-1] + 1]
+    Mf_sel = Mf_sel[inx[0]:inx[-1] + 1]
+
+    # Calculate arc length
+    new_sal = -np.sum(np.sqrt(np.square(np.diff(f_sel) / (f_sel[-1] - f_sel[0])) +
+                              np.square(np.diff(Mf_sel))))
+    return new_sal, (f[:len(Mf)], Mf), (f_sel, Mf_sel)
+
+
+def spectral_arclength_batch(movements, fs, padlevel=4, fc=10.0, amp_th=0.05):
+    """
+    Calculates the spectral arc length of several speed profiles of the same length at
+    once, with a single FFT over all of them.
+
+    Parameters
+    ----------
+    movements : np.array
+                2-D array with one movement speed profile per row.
+    fs, padlevel, fc, amp_th :
+                See spectral_arclength.
+    Returns
+    -------
+    sal       : np.array
+                The spectral arc length estimate of each row, the same as calling
+                spectral_arclength on every row.
+    Examples
+    --------
+    >>> t = np.arange(-1, 1, 0.01)
+    >>> move = np.exp(-5*pow(t, 2))
+    >>> sal = spectral_arclength_batch(np.array([move, move]), fs=100.)
+    >>> ['%.5f' % s for s in sal]
+    ['-1.41403', '-1.41403']
+    """
+    movements = np.atleast_2d(np.asarray(movements, dtype=float))
+    nfft = int(pow(2, np.ceil(np.log2(movements.shape[1])) + padlevel))
+    f, n_sel = _sparc_grid(nfft, float(fs), float(fc))
+    f_sel = f[:n_sel]
+    Mf = np.abs(np.fft.rfft(movements, nfft, axis=1))
+    Mf /= np.max(Mf, axis=1, keepdims=True)
+    Mf_sel = _mirror_spectrum(Mf, nfft, n_sel)
+
+    # First and last point of each row above the amplitude threshold.
+    above = Mf_sel >= amp_th
+    first = np.argmax(above, axis=1)
+    last = n_sel - 1 - np.argmax(above[:, ::-1], axis=1)
+
+    # Arc length of every segment, only the ones between first and last count.
+    span = (f_sel[last] - f_sel[first])[:, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        seg = np.sqrt(np.square(np.diff(f_sel) / span) + np.square(np.diff(Mf_sel, axis=1)))
+    inx = np.arange(n_sel - 1)
+    inside = (inx >= first[:, np.newaxis]) & (inx < last[:, np.newaxis])
+    return -np.sum(np.where(inside, seg, 0.), axis=1)
+
+def dimensionless_jerk(movement, fs):
+    """
+    Calculates the smoothness metric for the given speed profile using the dimensionless jerk
+    metric.
+
+    Parameters
+    ----------
+    movement : np.array
+               The array containing the movement speed profile.
+    fs       : float
+               The sampling frequency of the data.
+    Returns
+    -------
+    dl       : float
+               The dimensionless jerk estimate of the given movement's smoothness.
+    Notes
+    -----
+
+    Examples
+    --------
+    >>> t = np.arange(-1, 1, 0.01)
+    >>> move = np.exp(-5*pow(t, 2))
+    >>> dl = dimensionless_jerk(move, fs=100.)
+    >>> '%.5f' % dl
+    '-335.74684'
+    """
+    # first enforce data into an numpy array.
+    movement = np.array(movement)
+
+    # calculate the scale factor and jerk.
+    movement_peak = max(abs(movement))
+    dt = 1. / fs
+    movement_dur = len(movement) * dt
+    jerk = np.diff(movement, 2) / pow(dt, 2)
+    scale = pow(movement_dur, 3) / pow(movement_peak, 2)
+
+    # estimate dj
+    return - scale * sum(pow(jerk, 2)) * dt
+
+
+def log_dimensionless_jerk(movement, fs):
+    """
+    Calculates the smoothness metric for the given speed profile using the log dimensionless jerk
+    metric.
+
+    Parameters
+    ----------
+    movement : np.array
+               The array containing the movement speed profile.
+    fs       : float
+               The sampling frequency of the data.
+    Returns
+    -------
+    ldl      : float
+               The log dimensionless jerk estimate of the given movement's smoothness.
+    Notes
+    -----
+
+    Examples
+    --------
+    >>> t = np.arange(-1, 1, 0.01)
+    >>> move = np.exp(-5*pow(t, 2))
+    >>> ldl = log_dimensionless_jerk(move, fs=100.)
+    >>> '%.5f' % ldl
+    '-5.81636'
+    """
+    return -np.log(abs(dimensionless_jerk(movement, fs)))
+
+
+def angular_speed(quats, times, method='spline'):
+    """
+    Calculates the angular speed profile of a quaternion time series in one vectorised pass.
+    This is the magnitude of angular_velocity2, without building quaternion objects one at a
+    time or splitting the result into lists.
+
+    Parameters
+    ----------
+    quats  : np.array
+             (N, 4) array of w, x, y, z quaternion components.
+    times  : np.array
+             (N,) array of strictly increasing sample times.
+    method : string, optional
+             'spline' for the cubic spline of angular_velocity2, 'log' or 'central' for the
+             finite differences of angular_velocity_fd. [default = 'spline']
+
+    Returns
+    -------
+    speed : np.array
+            (N,) array of angular speeds.
+    """
+    if method != 'spline':
+        return np.linalg.norm(angular_velocity_fd(quats, times, method), axis=1)
+
+    from scipy.interpolate import CubicSpline
+
+    R = np.asarray(quats, dtype=float)
+    Rdot = CubicSpline(times, R).derivative()(times)
+    # from_float_array only reinterprets the memory, so no per-sample objects are created
+    omega = quaternion.as_float_array(2 * quaternion.from_float_array(Rdot) / quaternion.from_float_array(R))[:, 1:]
+    return np.linalg.norm(omega, axis=1)
+
+
+def calculate_smoothness(quats, times, fs, method='spline'):
+    """
+    Calculates SPARC and LDLJ of the angular speed of a quaternion time series.
+
+    Parameters
+    ----------
+    quats : np.array
+            (N, 4) array of w, x, y, z quaternion components.
+    times : np.array
+            (N,) array of strictly increasing sample times.
+    fs     : float
+             The sampling frequency passed on to the smoothness metrics.
+    method : string, optional
+             The angular velocity method, see angular_speed. [default = 'spline']
+
+    Returns
+    -------
+    sparc : float
+            The spectral arc length of the angular speed.
+    ldlj  : float
+            The log dimensionless jerk of the angular speed.
+    """
+    sparc_Angular, ldlj_Angular, _ = calculate_smoothness_timed(quats, times, fs, method)
+    return sparc_Angular, ldlj_Angular
+
+
+def calculate_smoothness_timed(quats, times, fs, method='spline'):
+    """
+    Same as calculate_smoothness, but also returns the nanoseconds spent in each stage
+    ({"angular_velocity", "sparc", "ldlj"}), so they can be profiled even when the
+    calculation runs in another process.
+    """
+    t0 = now_ns()
+    AngularVelocity = angular_speed(quats, times, method)
+    t1 = now_ns()
+    sparc_Angular, _, _ = spectral_arclength(AngularVelocity, fs=fs, padlevel=4, fc=10.0, amp_th=0.05)
+    t2 = now_ns()
+    ldlj_Angular = log_dimensionless_jerk(AngularVelocity, fs=fs)
+    t3 = now_ns()
+    return sparc_Angular, ldlj_Angular, {"angular_velocity": t1 - t0, "sparc": t2 - t1, "ldlj": t3 - t2}
+
+
+# Framed protocol
+# Every request and reply is a 4-byte unsigned big-endian length followed by that many bytes of
+# payload, so a message no longer has to arrive in a single recv() and several requests can be
+# pipelined on one connection. Replies are sent in the same order the requests arrived.
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 16 * 1024 * 1024  # refuse anything larger rather than allocating it
+
+
+# Binary sample format
+# Optional alternative to the JSON payload. A frame that starts with BINARY_MAGIC holds a
+# little-endian header (magic, version, flags, sample rate in Hz, sample count) followed by the
+# samples as contiguous little-endian float32 records of (w, x, y, z, dt). A sample rate of 0 means
+# the sender didn't say and the server's FS is used. With FLAG_TRACE the samples are followed by the
+# latency trace of the newest sensor frame (BINARY_TRACE: sequence number, 4 reserved bytes, callback
+# and sent timestamps in ns, see latency.py). Any other frame is parsed as JSON.
+BINARY_MAGIC = b"SQB1"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<4sBBHI")
+BINARY_RECORD = np.dtype("<f4")
+BINARY_FIELDS = 5  # w, x, y, z, dt
+BINARY_TRACE = struct.Struct("<I4xqq")
+FLAG_RESET = 0x01
+FLAG_REP = 0x02
+FLAG_TRACE = 0x04
+
+
+def encode_binary_samples(samples, reset=False, rep=False, fs=0, trace=None):
+    """
+    Packs an (N, 5) array of (w, x, y, z, dt) rows sampled at fs Hz into a binary payload, followed
+    by trace ({"seq", "callback", "sent"}) if given.
+    """
+    samples = np.ascontiguousarray(samples, dtype=BINARY_RECORD).reshape(-1, BINARY_FIELDS)
+    flags = (FLAG_RESET if reset else 0) | (FLAG_REP if rep else 0) | (FLAG_TRACE if trace else 0)
+    header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, flags, int(round(fs)), len(samples))
+    payload = header + samples.tobytes()
+    if trace:
+        payload += BINARY_TRACE.pack(trace["seq"], trace["callback"], trace["sent"])
+    return payload
+
+
+def decode_binary_samples(payload):
+    """
+    Unpacks a binary payload without copying the sample data.
+
+    Returns
+    -------
+    samples : np.array
+              (N, 5) float32 view of (w, x, y, z, dt) rows into the payload buffer.
+    flags   : integer
+              Combination of FLAG_RESET, FLAG_REP and FLAG_TRACE.
+    fs      : integer
+              The sample rate in Hz, 0 if the sender didn't provide one.
+    trace   : dict
+              The seq, callback and sent values of the latency trace, None without FLAG_TRACE.
+    """
+    magic, version, flags, fs, count = BINARY_HEADER.unpack_from(payload)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError(f"Unsupported binary payload (magic {magic!r}, version {version}).")
+    size = BINARY_HEADER.size + count * BINARY_FIELDS * BINARY_RECORD.itemsize
+    if len(payload) != size + (BINARY_TRACE.size if flags & FLAG_TRACE else 0):
+        raise ValueError(f"Binary payload of {len(payload)} bytes does not hold {count} samples.")
+
+    samples = np.frombuffer(payload, dtype=BINARY_RECORD, count=count * BINARY_FIELDS,
+                            offset=BINARY_HEADER.size).reshape(count, BINARY_FIELDS)
+    trace = None
+    if flags & FLAG_TRACE:
+        trace = dict(zip(("seq", "callback", "sent"), BINARY_TRACE.unpack_from(payload, size)))
+    return samples, flags, fs, trace
+
+
+# Incremental smoothness engine
+# Unity only needs to send the samples it has collected since the last request; the engine keeps
+# the recent history in a fixed size ring buffer and only ever recomputes over the current window,
+# so the cost of a request no longer grows with the length of the session.
+class SmoothnessEngine:
+    """
+    Stateful per-connection calculator for SPARC and LDLJ over a sliding window.
+
+    Parameters
+    ----------
+    fs             : float
+                     The sampling frequency passed on to the smoothness metrics.
+    window_mode    : string
+                     'seconds' to use the last window_seconds of data, or 'rep' to use
+                     every sample since the last call to new_rep(). [default = 'seconds']
+    window_seconds : float
+                     Length of the window when window_mode is 'seconds'. [default = 10.]
+    capacity       : integer
+                     Number of samples held in the ring buffer. Older samples are
+                     overwritten, which also bounds the length of a 'rep' window.
+                     [default = 2048]
+    pool           : concurrent.futures.Executor, optional
+                     If given, compute() runs the calculation on this executor (e.g. a
+                     ProcessPoolExecutor) and waits for the result. [default = None]
+    angular_method : string, optional
+                     How the angular velocity is calculated, ('spline', 'log', 'central'),
+                     see angular_speed. [default = 'spline']
+    """
+
+    MIN_SAMPLES = 4
+    WINDOW_MARGIN = 1.5  # the buffer holds at least this many 'seconds' windows at the current fs
+
+    def __init__(self, fs=9, window_mode='seconds', window_seconds=10.0, capacity=2048, pool=None,
+                 angular_method='spline'):
+        if window_mode not in ('seconds', 'rep'):
+            raise ValueError(f"window_mode has to be ('seconds', 'rep'), {window_mode} provided is not valid")
+        if angular_method not in ANGULAR_VELOCITY_METHODS:
+            raise ValueError(f"angular_method has to be {ANGULAR_VELOCITY_METHODS}, {angular_method} provided is not valid")
+        self.fs = fs
+        self.window_mode = window_mode
+        self.window_seconds = window_seconds
+        self.capacity = capacity
+        self.pool = pool
+        self.angular_method = angular_method
+
+        self._quats = np.empty((capacity, 4))
+        self._times = np.empty(capacity)
+        self._head = 0  # index the next sample is written to
+        self._count = 0  # number of valid samples in the buffer
+        self._rep_count = 0  # number of samples since the last new_rep()
+        self._last_time = 0.0
+
+    def __len__(self):
+        return self._count
+
+    def reset(self):
+        """
+        Forget all buffered samples, e.g. when a new session starts on the same connection.
+        """
+        self._head = 0
+        self._count = 0
+        self._rep_count = 0
+        self._last_time = 0.0
+
+    def set_sample_rate(self, fs):
+        """
+        Change the sampling frequency, e.g. when a client streams at 120 Hz instead of FS.
+
+        The ring buffer grows (keeping its samples) if it can no longer hold a full
+        'seconds' window at the new rate; it never shrinks.
+        """
+        self.fs = fs
+        needed = int(np.ceil(self.WINDOW_MARGIN * self.window_seconds * fs))
+        if needed <= self.capacity:
+            return
+
+        start = (self._head - self._count) % self.capacity
+        idx = (start + np.arange(self._count)) % self.capacity
+        quats = np.empty((needed, 4))
+        times = np.empty(needed)
+        quats[:self._count] = self._quats[idx]
+        times[:self._count] = self._times[idx]
+        self._quats = quats
+        self._times = times
+        self._head = self._count
+        self.capacity = needed
+
+    def new_rep(self):
+        """
+        Mark the start of a new repetition. Only used when window_mode is 'rep'.
+        """
+        self._rep_count = 0
+
+    def add_samples(self, quats, dts):
+        """
+        Appends new samples to the ring buffer.
+
+        Parameters
+        ----------
+        quats : np.array
+                (N, 4) array of w, x, y, z quaternion components.
+        dts   : np.array
+                (N,) array of the time elapsed since the previous sample.
+        """
+        quats = np.asarray(quats, dtype=float).reshape(-1, 4)
+        times = self._last_time + np.cumsum(np.asarray(dts, dtype=float))
+        n = len(quats)
+        if n == 0:
+            return
+        self._last_time = times[-1]
+
+        # only the newest capacity samples can survive the write
+        if n > self.capacity:
+            quats = quats[-self.capacity:]
+            times = times[-self.capacity:]
+            self._head = (self._head + n - self.capacity) % self.capacity
+            n = self.capacity
+
+        first = min(n, self.capacity - self._head)
+        self._quats[self._head:self._head + first] = quats[:first]
+        self._times[self._head:self._head + first] = times[:first]
+        self._quats[:n - first] = quats[first:]
+        self._times[:n - first] = times[first:]
+
+        self._head = (self._head + n) % self.capacity
+        self._count = min(self._count + n, self.capacity)
+        self._rep_count = min(self._rep_count + n, self.capacity)
+
+    def window(self):
+        """
+        Returns:
+            The quaternion (N, 4) and time (N,) arrays of the current window, oldest sample first.
+        """
+        count = self._rep_count if self.window_mode == 'rep' else self._count
+        start = (self._head - count) % self.capacity
+        idx = (start + np.arange(count)) % self.capacity
+        quats = self._quats[idx]
+        times = self._times[idx]
+
+        if self.window_mode == 'seconds' and count:
+            first = np.searchsorted(times, times[-1] - self.window_seconds)
+            quats = quats[first:]
+            times = times[first:]
+        return quats, times
+
+    def compute(self):
+        """
+        Calculates SPARC and LDLJ of the angular speed over the current window.
+
+        Returns
+        -------
+        sparc : float
+                The spectral arc length of the window.
+        ldlj  : float
+                The log dimensionless jerk of the window.
+        """
+        quats, times = self.window()
+        if len(quats) < self.MIN_SAMPLES:
+            raise ValueError(f"Need at least {self.MIN_SAMPLES} samples to calculate smoothness ({len(quats)} buffered).")
+
+        if not profiler.enabled:
+            if self.pool is not None:
+                return self.pool.submit(calculate_smoothness, quats, times, self.fs, self.angular_method).result()
+            return calculate_smoothness(quats, times, self.fs, self.angular_method)
+
+        if self.pool is not None:
+            sparc, ldlj, timings = self.pool.submit(calculate_smoothness_timed, quats, times, self.fs,
+                                                    self.angular_method).result()
+        else:
+            sparc, ldlj, timings = calculate_smoothness_timed(quats, times, self.fs, self.angular_method)
+        for stage, duration in timings.items():
+            profiler.add(stage, duration)
+        profiler.count("window_samples", len(quats))
+        return sparc, ldlj
+
+
+####################################################################################################################
+
+HOST = 'localhost'  # Localhost
+PORT = 5556       # Choose a port number
+
+# Smoothness window settings, see SmoothnessEngine
+FS = 9  # used until a client sends its own sample rate
+WINDOW_MODE = 'seconds'  # 'seconds' or 'rep'
+WINDOW_SECONDS = 10.0
+BUFFER_CAPACITY = 2048
+# 'spline', or 'log' / 'central' finite differences, several times faster on long windows
+# (compare them with benchmarks/bench_angular_velocity.py)
+ANGULAR_METHOD = 'spline'
+
+# Server settings
+MAX_WORKERS = 4  # threads running the NumPy/SciPy work, shared by all clients
+EXECUTOR_MODE = 'thread'  # 'thread', or 'process' to also run the calculations in MAX_WORKERS processes
+MAX_PENDING = 16  # requests allowed to wait for a worker before clients are made to wait
+
+# Profiling settings, see profiling.py and the {"type": "stats"} request
+PROFILE = True  # time the stages of every request, False turns the timers and counters off
+PROFILE_LOG = None  # e.g. "unityConnect_stats.jsonl" to append the stats to every PROFILE_LOG_INTERVAL seconds
+PROFILE_LOG_INTERVAL = 60.0
+VERBOSE = False  # print the SPARC and LDLJ of every request, off as the stats request and PROFILE_LOG report on a running server
+
+
+def decode_request(frame):
+    """
+    Decodes one request frame, either binary (see BINARY_MAGIC) or JSON.
+
+    Returns
+    -------
+    quats : np.array
+            (N, 4) array of w, x, y, z quaternion components.
+    dts   : np.array
+            (N,) array of the time elapsed since the previous sample.
+    reset : bool
+            True if the engine should start a new session first.
+    rep   : bool
+            True if the engine should start a new repetition first.
+    fs    : float
+            The sample rate of the request in Hz, or None if it didn't carry one.
+    trace : dict
+            The latency trace (seq, callback, sent) of the request, or None if it didn't carry one.
+    """
+    t = profiler.clock()
+    if frame[:len(BINARY_MAGIC)] == BINARY_MAGIC:
+        samples, flags, fs, trace = decode_binary_samples(frame)
+        profiler.lap("decode", t)
+        return (samples[:, :4], samples[:, 4], bool(flags & FLAG_RESET), bool(flags & FLAG_REP),
+                fs or None, trace)
+
+    the_data = json.loads(str(frame, "utf-8"))
+    t = profiler.lap("decode", t)
+    quaternions = the_data['quaternions']
+    quats = np.array([[q["w"], q["x"], q["y"], q["z"]] for q in quaternions], dtype=float).reshape(-1, 4)
+    dts = np.array([q["timestamp"] for q in quaternions], dtype=float)
+    profiler.lap("arrays", t)
+    fs = the_data.get('fs')
+    return (quats, dts, bool(the_data.get('reset')), bool(the_data.get('rep')), float(fs) if fs else None,
+            the_data.get('trace'))
+
+
+# Latency of the requests (see latency.py), printed with DUMP_SIGNAL and when the server stops
+tracer = LatencyTracer("unityConnect")
+
+# Stage timers and counters of the request handler, answered to {"type": "stats"} requests
+profiler = StageProfiler("unityConnect", enabled=PROFILE)
+QUERY_MAX_SIZE = 1024  # larger frames are never taken for a query
+
+
+def parse_query(frame):
+    """
+    Returns:
+        The JSON object of a query request ({"type": ...}), or None if the frame is a sample request
+    """
+    if len(frame) > QUERY_MAX_SIZE or b'"type"' not in frame:
+        return None
+    query = json.loads(str(frame, "utf-8"))
+    return query if isinstance(query, dict) and "type" in query else None
+
+
+def handle_query(query):
+    """
+    Answers a query request.
+
+    {"type": "stats"} returns the profiler's counters and stage durations and the latency
+    histograms, {"type": "stats", "reset": true} also starts them over.
+    """
+    if query["type"] != "stats":
+        return {"message": f"Unknown request type {query['type']!r}"}
+    response = {"message": "stats", "stats": profiler.stats(), "latency": tracer.summary()}
+    if query.get("reset"):
+        profiler.reset()
+        tracer.reset()
+    return response
+
+
+def handle_request(frame, engine, received=None):
+    """
+    Feeds the samples of one request frame into the engine and builds the response.
+
+    The request may ask for a new session (JSON "reset": true / FLAG_RESET) or a new
+    repetition (JSON "rep": true / FLAG_REP) before its samples are added. If it carries
+    its sample rate (JSON "fs" / the binary header) the engine is switched to that rate.
+    If it carries a latency trace (JSON "trace" / FLAG_TRACE), the trace is returned with
+    the received (now_ns() when the frame was read) and replied timestamps added.
+    """
+    started = now_ns()
+    quats, dts, reset, rep, fs, trace = decode_request(frame)
+
+    t = profiler.clock()
+    if fs is not None and fs != engine.fs:
+        engine.set_sample_rate(fs)
+    if reset:
+        engine.reset()
+    if rep:
+        engine.new_rep()
+    engine.add_samples(quats, dts)
+    t = profiler.lap("buffer", t)
+    profiler.count("samples", len(quats))
+
+    # CALCULATE SMOOTHNESS MEASURES
+    sparc_Angular, ldlj_Angular = engine.compute()
+    profiler.lap("compute", t)
+
+    if VERBOSE:
+        print(f"{len(quats)} samples, SPARC: {sparc_Angular}, LDLJ: {ldlj_Angular}")
+
+    # Create a response dictionary with the data you want to send back
+    response = {
+        "message": "Data received successfully",
+        "SPARC": sparc_Angular,
+        "LDLJ": ldlj_Angular,
+        "samples": len(quats)
+    }
+
+    replied = now_ns()
+    tracer.record("compute", started, replied)
+    if received is not None:
+        tracer.record("queued", received, started)
+    if trace:
+        if received is not None:
+            tracer.record("unity->server", trace["sent"], received)
+            trace = dict(trace, received=received)
+        if trace.get("callback"):
+            tracer.record("callback->reply", trace["callback"], replied)
+        response["trace"] = dict(trace, replied=replied)
+    return response
+
+
+def process_frame(frame, engine, received=None):
+    """
+    Handles one request frame and returns the encoded reply.
+
+    Every request gets a reply, including failed ones, so a pipelining client keeps its
+    replies matched to its requests.
+    """
+    start = profiler.clock()
+    query = None
+    try:
+        query = parse_query(frame)
+        response_data = handle_query(query) if query is not None else handle_request(frame, engine, received)
+    except json.decoder.JSONDecodeError as e:
+        # Handle the case where the received data is not valid JSON
+        print("Error decoding JSON:", e)
+        response_data = {"message": f"Error decoding JSON: {e}"}
+        profiler.count("errors")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        response_data = {"message": f"An error occurred: {e}"}
+        profiler.count("errors")
+
+    t = profiler.clock()
+    reply = json.dumps(response_data).encode("utf-8")
+    if query is not None:
+        profiler.count("queries")
+        return reply
+    profiler.lap("encode", t)
+    profiler.lap("total", start)
+    profiler.count("requests")
+    profiler.count("bytes_in", len(frame))
+    profiler.count("bytes_out", len(reply))
+    return reply
+
+
+async def read_frame_async(reader):
+    """
+    Returns:
+        The payload of the next frame from an asyncio StreamReader, or None if the client
+        disconnected.
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+        (length,) = FRAME_HEADER.unpack(header)
+        if length > MAX_FRAME_SIZE:
+            raise ValueError(f"Frame of {length} bytes exceeds the maximum of {MAX_FRAME_SIZE} bytes.")
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
+
+
+class SmoothnessServer:
+    """
+    asyncio server that serves any number of Unity clients at once.
+
+    Each client gets its own SmoothnessEngine. Its requests are handled in order, but the
+    calculations run on a bounded executor so one heavy request never blocks the event loop
+    or the other clients.
+
+    With profile_log set, the profiler's stats are appended to that file every
+    profile_log_interval seconds and once more at shutdown.
+    """
+
+    def __init__(self, host=HOST, port=PORT, max_workers=MAX_WORKERS, max_pending=MAX_PENDING,
+                 executor_mode=EXECUTOR_MODE, profile_log=PROFILE_LOG, profile_log_interval=PROFILE_LOG_INTERVAL):
+        if executor_mode not in ('thread', 'process'):
+            raise ValueError(f"executor_mode has to be ('thread', 'process'), {executor_mode} provided is not valid")
+        self.host = host
+        self.port = port
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # in process mode the threads only decode and buffer, the GIL-bound maths runs in the pool
+        self._process_pool = ProcessPoolExecutor(max_workers=max_workers) if executor_mode == 'process' else None
+        self._pending = asyncio.Semaphore(max_pending)
+        self._server = None
+        self._clients = set()
+        self._stop = asyncio.Event()
+        self.profile_log = profile_log
+        self.profile_log_interval = profile_log_interval
+        self._profile_task = None
+
+    def _write_stats(self):
+        try:
+            profiler.write_stats(self.profile_log, latency=tracer.summary())
+        except OSError as e:
+            print(f"Could not write the stats to {self.profile_log}: {e}")
+
+    async def _log_stats(self):
+        while True:
+            await asyncio.sleep(self.profile_log_interval)
+            self._write_stats()
+
+    async def _handle_client(self, reader, writer):
+        address = writer.get_extra_info("peername")
+        print(f"Connected by {address}")
+        self._clients.add(writer)
+
+        # one engine per connection so sessions never share a buffer
+        engine = SmoothnessEngine(fs=FS, window_mode=WINDOW_MODE, window_seconds=WINDOW_SECONDS,
+                                  capacity=BUFFER_CAPACITY, pool=self._process_pool, angular_method=ANGULAR_METHOD)
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                frame = await read_frame_async(reader)
+                received = now_ns()
+                if frame is None:
+                    break
+
+                async with self._pending:
+                    reply = await loop.run_in_executor(self._executor, process_frame, frame, engine, received)
+
+                writer.write(FRAME_HEADER.pack(len(reply)) + reply)
+                await writer.drain()
+        except (ValueError, ConnectionError) as e:
+            # the stream can't be resynchronised after a bad header, so drop the client
+            print(f"An error occurred: {e}")
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+            print(f"Disconnected {address}")
+
+    async def serve(self):
+        """
+        Serves clients until stop() is called, then shuts down gracefully.
+        """
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        print(f"Server listening on {self.host}:{self.port}")
+        if self.profile_log and profiler.enabled:
+            self._profile_task = asyncio.create_task(self._log_stats())
+            print(f"Writing the stats to {self.profile_log} every {self.profile_log_interval:g} s")
+        try:
+            await self._stop.wait()
+        finally:
+            await self.shutdown()
+
+    def stop(self):
+        self._stop.set()
+
+    async def shutdown(self):
+        """
+        Stops accepting clients, closes the open connections and waits for running
+        calculations to finish.
+        """
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._clients):
+            writer.close()
+        if self._server is not None:
+            await self._server.wait_closed()
+        # shutdown(wait=True) blocks until the workers finish, so it runs off the event loop
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._executor.shutdown)
+        if self._process_pool is not None:
+            await loop.run_in_executor(None, self._process_pool.shutdown)
+        if self._profile_task is not None:
+            self._profile_task.cancel()
+            self._write_stats()
+        print(tracer.report())
+        print("Server stopped.")
+
+
+async def serve():
+    server = SmoothnessServer()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, server.stop)
+        except (NotImplementedError, RuntimeError):
+            pass  # not available on Windows, Ctrl+C then arrives as KeyboardInterrupt
+    dump = dump_on_signal(tracer)
+    if dump is not None:
+        print(f"To print the latency histograms, {dump}")
+    await server.serve()
+
+
+def main():
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\nInterrupt received, server stopped.")
+
+
+if __name__ == "__main__":
+    main()
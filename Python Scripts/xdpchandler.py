@@ -28,10 +28,16 @@
 #  
 
 import movelladot_pc_sdk
-from collections import defaultdict
-from threading import Lock
-from pynput import keyboard
+import numpy as np
+from collections import defaultdict, deque, namedtuple
+from threading import Condition, Lock
+try:
+    from pynput import keyboard
+except ImportError:
+    # no keyboard listener without a display (e.g. dot_simulator.py on a headless box), scanning then runs until the timeout
+    keyboard = None
 from user_settings import *
+from latency import now_ns
 import time
 
 waitForConnections = True
@@ -42,13 +48,88 @@ def on_press(key):
     waitForConnections = False
 
 
+# Decoded sample columns, as returned by SampleStore
+Samples = namedtuple("Samples", ["orientation", "acceleration", "gyroscope", "sampleTimeFine", "arrival"])
+
+
+class SampleStore:
+    """
+    Per-device columnar store of decoded samples.
+
+    Each column is allocated twice the capacity and every sample is written to both halves,
+    so the latest capacity samples are always one contiguous slice and can be handed out as
+    NumPy views without copying. A view of n samples stays valid until capacity - n more
+    samples arrive.
+    Not thread safe on its own, XdpcHandler guards it with its lock.
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.count = 0  # total number of samples written
+        self.orientation = np.full((2 * capacity, 4), np.nan)  # w, x, y, z
+        self.acceleration = np.full((2 * capacity, 3), np.nan)  # m/s^2
+        self.gyroscope = np.full((2 * capacity, 3), np.nan)  # deg/s
+        self.sampleTimeFine = np.zeros(2 * capacity, dtype=np.int64)  # microseconds
+        self.arrival = np.zeros(2 * capacity, dtype=np.int64)  # latency.now_ns() when decoded
+
+    def append(self, orientation, acceleration, gyroscope, sampleTimeFine, arrival=0):
+        i = self.count % self.capacity
+        for index in (i, i + self.capacity):
+            self.orientation[index] = orientation
+            self.acceleration[index] = acceleration
+            self.gyroscope[index] = gyroscope
+            self.sampleTimeFine[index] = sampleTimeFine
+            self.arrival[index] = arrival
+        self.count += 1
+
+    def latest(self, n):
+        """
+        Returns:
+             Samples holding views of the latest n samples (fewer if not that many arrived yet), oldest first
+        """
+        n = min(n, self.count, self.capacity)
+        end = self.count % self.capacity + self.capacity
+        return Samples(self.orientation[end - n:end], self.acceleration[end - n:end],
+                       self.gyroscope[end - n:end], self.sampleTimeFine[end - n:end], self.arrival[end - n:end])
+
+
+def decodePacket(packet):
+    """
+    Decodes the fields of an XsDataPacket that the sample store keeps
+
+    Fields the packet does not contain are NaN (0 for SampleTimeFine). Acceleration is the calibrated
+    acceleration if available, otherwise the free acceleration sent in the quaternion payload modes.
+    Returns:
+        orientation (w, x, y, z), acceleration (x, y, z), gyroscope (x, y, z), sampleTimeFine
+    """
+    orientation = acceleration = gyroscope = np.nan
+    sampleTimeFine = 0
+    if packet.containsOrientation():
+        quat = packet.orientationQuaternion()
+        orientation = (quat[0], quat[1], quat[2], quat[3])
+    if packet.containsCalibratedAcceleration():
+        acc = packet.calibratedAcceleration()
+        acceleration = (acc[0], acc[1], acc[2])
+    elif packet.containsFreeAcceleration():
+        acc = packet.freeAcceleration()
+        acceleration = (acc[0], acc[1], acc[2])
+    if packet.containsCalibratedGyroscopeData():
+        gyr = packet.calibratedGyroscopeData()
+        gyroscope = (gyr[0], gyr[1], gyr[2])
+    if packet.containsSampleTimeFine():
+        sampleTimeFine = packet.sampleTimeFine()
+    return orientation, acceleration, gyroscope, sampleTimeFine
+
+
 class XdpcHandler(movelladot_pc_sdk.XsDotCallback):
-    def __init__(self, max_buffer_size=5):
+    def __init__(self, max_buffer_size=5, sample_capacity=1024):
         movelladot_pc_sdk.XsDotCallback.__init__(self)
 
         self.__manager = 0
 
         self.__lock = Lock()
+        # notified by onLiveDataAvailable whenever a sample has been decoded
+        self.__dataAvailable = Condition(self.__lock)
         self.__errorReceived = False
         self.__updateDone = False
         self.__recordingStopped = False
@@ -62,9 +143,20 @@ class XdpcHandler(movelladot_pc_sdk.XsDotCallback):
         self.__connectedDots = list()
         self.__connectedUsbDots = list()
         self.__maxNumberOfPacketsInBuffer = max_buffer_size
-        self.__packetBuffer = defaultdict(list)
+        # fixed capacity per device, appending to a full buffer drops the oldest packet
+        self.__packetBuffer = defaultdict(self.__newPacketBuffer)
+        self.__droppedPackets = defaultdict(int)
+        # decoded samples per device, see SampleStore
+        self.__sampleCapacity = sample_capacity
+        self.__sampleStores = defaultdict(self.__newSampleStore)
         self.__progress = dict()
 
+    def __newPacketBuffer(self):
+        return deque(maxlen=self.__maxNumberOfPacketsInBuffer)
+
+    def __newSampleStore(self):
+        return SampleStore(self.__sampleCapacity)
+
     def initialize(self):
         """
         Initialize the PC SDK
@@ -116,8 +208,9 @@ class XdpcHandler(movelladot_pc_sdk.XsDotCallback):
         self.__manager.enableDeviceDetection()
 
         # Setup the keyboard input listener
-        listener = keyboard.Listener(on_press=on_press)
-        listener.start()
+        if keyboard is not None:
+            listener = keyboard.Listener(on_press=on_press)
+            listener.start()
 
         print("Press any key or wait 20 seconds to stop scanning...")
         connectedDOTCount = 0
@@ -266,10 +359,8 @@ class XdpcHandler(movelladot_pc_sdk.XsDotCallback):
         Returns:
             True if a data packet is available for the Movella DOT with the provided bluetoothAddress
         """
-        self.__lock.acquire()
-        res = len(self.__packetBuffer[bluetoothAddress]) > 0
-        self.__lock.release()
-        return res
+        with self.__lock:
+            return len(self.__packetBuffer[bluetoothAddress]) > 0
 
     def packetsReceived(self):
         """
@@ -285,12 +376,87 @@ class XdpcHandler(movelladot_pc_sdk.XsDotCallback):
         Returns:
              The next available data packet for the Movella DOT with the provided bluetoothAddress
         """
-        if len(self.__packetBuffer[bluetoothAddress]) == 0:
-            return None
-        self.__lock.acquire()
-        oldest_packet = movelladot_pc_sdk.XsDataPacket(self.__packetBuffer[bluetoothAddress].pop(0))
-        self.__lock.release()
-        return oldest_packet
+        with self.__lock:
+            buffer = self.__packetBuffer[bluetoothAddress]
+            if len(buffer) == 0:
+                return None
+            # the packet was already copied on arrival, so it can be handed out as is
+            return buffer.popleft()
+
+    def drainPackets(self, bluetoothAddress):
+        """
+        Parameters:
+            bluetoothAddress: The bluetooth address of the Movella DOT to get the packets for
+        Returns:
+             All buffered data packets for the Movella DOT with the provided bluetoothAddress, oldest first
+        """
+        with self.__lock:
+            # swap in an empty buffer so the lock is only held for O(1) work
+            packets = self.__packetBuffer[bluetoothAddress]
+            self.__packetBuffer[bluetoothAddress] = self.__newPacketBuffer()
+        return packets
+
+    def droppedPackets(self, bluetoothAddress):
+        """
+        Parameters:
+            bluetoothAddress: The bluetooth address of the Movella DOT
+        Returns:
+             The number of packets dropped because the buffer of the Movella DOT was full
+        """
+        with self.__lock:
+            return self.__droppedPackets[bluetoothAddress]
+
+    def sampleCount(self, bluetoothAddress):
+        """
+        Parameters:
+            bluetoothAddress: The bluetooth address of the Movella DOT
+        Returns:
+             The total number of samples decoded for the Movella DOT with the provided bluetoothAddress
+        """
+        with self.__lock:
+            return self.__sampleStores[bluetoothAddress].count
+
+    def latestSamples(self, bluetoothAddress, n):
+        """
+        Parameters:
+            bluetoothAddress: The bluetooth address of the Movella DOT
+            n: The number of samples to return, at most the sample capacity
+        Returns:
+             Samples holding zero-copy NumPy views of the latest n decoded samples, oldest first.
+             The views stay valid until sample_capacity - n more samples arrive, copy them to keep them longer.
+        """
+        with self.__lock:
+            return self.__sampleStores[bluetoothAddress].latest(n)
+
+    def samplesSince(self, bluetoothAddress, count):
+        """
+        Parameters:
+            bluetoothAddress: The bluetooth address of the Movella DOT
+            count: A sample count returned by an earlier call (or sampleCount)
+        Returns:
+             Samples holding views of the samples decoded after count (at most the sample capacity),
+             and the new sample count to pass to the next call
+        """
+        with self.__lock:
+            store = self.__sampleStores[bluetoothAddress]
+            return store.latest(store.count - count), store.count
+
+    def waitForNewSamples(self, counts, timeout=None):
+        """
+        Blocks until every connected Movella DOT has decoded samples beyond the given counts,
+        woken by the live data callback instead of polling
+
+        Parameters:
+            counts: A dict of bluetooth address to the sample count already read (missing means 0)
+            timeout: The maximum number of seconds to wait, None to wait forever
+        Returns:
+             True if new samples are available for every connected Movella DOT, False on timeout
+        """
+        addresses = [dev.bluetoothAddress() for dev in self.__connectedDots]
+        with self.__dataAvailable:
+            return self.__dataAvailable.wait_for(
+                lambda: all(self.__sampleStores[address].count > counts.get(address, 0) for address in addresses),
+                timeout)
 
     def addDeviceToProgressBuffer(self, bluetoothAddress):
         """
@@ -360,17 +526,25 @@ class XdpcHandler(movelladot_pc_sdk.XsDotCallback):
         """
         Called when new data has been received from a device
         Adds the new packet to the device's packet buffer
-        Monitors buffer size, removes oldest packets if the size gets too big
+        When the buffer is full the oldest packet is dropped and counted
+        Decodes the packet into the device's sample store
 
         Parameters:
             device: The device that initiated the callback.
             packet: The data packet that has been received (and processed).
         """
-        self.__lock.acquire()
-        while len(self.__packetBuffer[device.portInfo().bluetoothAddress()]) >= self.__maxNumberOfPacketsInBuffer:
-            self.__packetBuffer[device.portInfo().bluetoothAddress()].pop()
-        self.__packetBuffer[device.portInfo().bluetoothAddress()].append(movelladot_pc_sdk.XsDataPacket(packet))
-        self.__lock.release()
+        arrival = now_ns()  # the first hop of the latency trace, see latency.py
+        # the SDK reuses the packet after the callback, so copy it before taking the lock
+        address = device.portInfo().bluetoothAddress()
+        packet = movelladot_pc_sdk.XsDataPacket(packet)
+        sample = decodePacket(packet)
+        with self.__lock:
+            buffer = self.__packetBuffer[address]
+            if len(buffer) == buffer.maxlen:
+                self.__droppedPackets[address] += 1
+            buffer.append(packet)
+            self.__sampleStores[address].append(*sample, arrival)
+            self.__dataAvailable.notify_all()
 
     def onProgressUpdated(self, device, current, total, identifier):
         """
@@ -1,4 +1,6 @@
 using System;
+using System.Collections.Generic;
+using System.Text;
 using System.Threading;
 using NetMQ;
 using NetMQ.Sockets;
@@ -20,16 +22,16 @@ namespace ServerReceiver
                 {
                     while (running)
                     {
-                        // Receive the JSON and pass it back to the calling function
-                        string data = socket.ReceiveFrameString();
-                        ((Action<string>)callback)(data);
+                        // Receive every part of the message and pass them back to the calling function
+                        List<byte[]> parts = socket.ReceiveMultipartBytes();
+                        ((Action<List<byte[]>>)callback)(parts);
                     }
                 }
             });
         }
 
         // Call this function when starting Sensor Transmission
-        public void Start(Action<string> callback)
+        public void Start(Action<List<byte[]>> callback)
         {
             running = true;
             receiveThread.Start(callback);
@@ -49,6 +51,13 @@ namespace ServerReceiver
         private ServerReceiver receiver;
         private string sensor1;
         private string sensor2;
+        private int sampleRate;
+        private FrameTrace latestTrace;
+        private long? nextSeq;
+        private long lostFrames;
+
+        // Latency of the sensor frames from TCPServer.py (see latency.py), recorded on the receive thread
+        public readonly LatencyTracer Latency = new LatencyTracer("Unity sensor stream");
 
         public Server()
         {
@@ -60,12 +69,27 @@ namespace ServerReceiver
         {
             AsyncIO.ForceDotNet.Force();
             receiver = new ServerReceiver();
-            receiver.Start((string d) =>
+            receiver.Start((List<byte[]> parts) =>
             {
-                Debug.Log($"Received data: {d}");
                 try
                 {
+                    if (IsBinaryMessage(parts))
+                    {
+                        HandleBinaryMessage(parts);
+                        return;
+                    }
+
+                    string d = Encoding.UTF8.GetString(parts[0]);
+                    Debug.Log($"Received data: {d}");
                     var data = JsonUtility.FromJson<SensorData>(d);
+                    if (data.rate > 0)
+                    {
+                        sampleRate = data.rate;
+                    }
+                    if (data.trace != null && data.trace.sent != 0)
+                    {
+                        RecordTrace(data.seq, data.trace.callback, data.trace.sent, LatencyClock.NowNs());
+                    }
                     if (data.sensors.Length > 0)
                     {
                         SetSensor1(JsonUtility.ToJson(data.sensors[0]));
@@ -82,6 +106,85 @@ namespace ServerReceiver
             });
         }
 
+        // Binary sensor stream (see sensor_stream.py): header "SQS1", version, sensor count, frame count,
+        // output rate in Hz, flags and 1 reserved byte, then per frame int64 SampleTimeFine, int32 skew and
+        // float32 w, x, y, z per sensor. If flags has 0x01 a third part holds per frame uint32 sequence number,
+        // 4 reserved bytes and int64 callback and sent timestamps in ns. Version 2 has no flags.
+        private static bool IsBinaryMessage(List<byte[]> parts)
+        {
+            return parts.Count >= 2 && parts[0].Length == 12 && Encoding.ASCII.GetString(parts[0], 0, 4) == "SQS1"
+                && (parts[0][4] == 2 || parts[0][4] == 3);
+        }
+
+        private void HandleBinaryMessage(List<byte[]> parts)
+        {
+            long received = LatencyClock.NowNs();
+            byte[] header = parts[0];
+            int sensors = header[5];
+            int frames = BitConverter.ToUInt16(header, 6);
+            int rate = BitConverter.ToUInt16(header, 8);
+            if (rate > 0)
+            {
+                sampleRate = rate;
+            }
+            if (frames == 0)
+            {
+                return;
+            }
+            if (header[4] == 3 && (header[10] & 0x01) != 0 && parts.Count > 2)
+            {
+                for (int f = 0; f < frames; f++)
+                {
+                    int t = f * 24;
+                    RecordTrace(BitConverter.ToUInt32(parts[2], t), BitConverter.ToInt64(parts[2], t + 8),
+                        BitConverter.ToInt64(parts[2], t + 16), received);
+                }
+            }
+
+            // only the newest frame of a batch is shown
+            int recordSize = 12 + sensors * 16;
+            int offset = (frames - 1) * recordSize + 12;
+            for (int s = 0; s < sensors && s < 2; s++)
+            {
+                int q = offset + s * 16;
+                var sensor = new Sensor
+                {
+                    id = $"sensor{s + 1}",
+                    quaternion = new QuaternionData
+                    {
+                        w = BitConverter.ToSingle(parts[1], q),
+                        x = BitConverter.ToSingle(parts[1], q + 4),
+                        y = BitConverter.ToSingle(parts[1], q + 8),
+                        z = BitConverter.ToSingle(parts[1], q + 12)
+                    }
+                };
+                if (s == 0)
+                {
+                    SetSensor1(JsonUtility.ToJson(sensor));
+                }
+                else
+                {
+                    SetSensor2(JsonUtility.ToJson(sensor));
+                }
+            }
+        }
+
+        private void RecordTrace(long seq, long callback, long sent, long received)
+        {
+            // a gap in the sequence numbers is a frame lost on the way, e.g. dropped at TCPServer's high-water mark
+            if (nextSeq.HasValue && seq > nextSeq.Value)
+            {
+                lostFrames += seq - nextSeq.Value;
+            }
+            nextSeq = seq + 1;
+            Latency.Record("sent->unity", sent, received);
+            if (callback != 0)
+            {
+                Latency.Record("callback->unity", callback, received);
+            }
+            latestTrace = new FrameTrace { seq = seq, callback = callback, sent = sent };
+        }
+
         public void Stop()
         {
             receiver?.Stop();
@@ -112,12 +215,170 @@ namespace ServerReceiver
         {
             return sensor2;
         }
+
+        // Output rate of the sensors in Hz as sent by TCPServer.py, 0 until the first message arrives
+        public int GetSampleRate()
+        {
+            return sampleRate;
+        }
+
+        // Sequence number and timestamps of the newest traced frame, null until one arrives
+        public FrameTrace GetLatestTrace()
+        {
+            return latestTrace;
+        }
+
+        // Frames missing from the sequence numbers so far
+        public long GetLostFrames()
+        {
+            return lostFrames;
+        }
+    }
+
+    // Same clock as latency.now_ns() in the Python scripts: Stopwatch.GetTimestamp is QueryPerformanceCounter on
+    // Windows and CLOCK_MONOTONIC elsewhere, so the timestamps of all processes on the machine can be compared
+    public static class LatencyClock
+    {
+        private static readonly double NsPerTick = 1e9 / System.Diagnostics.Stopwatch.Frequency;
+
+        public static long NowNs()
+        {
+            return (long)(System.Diagnostics.Stopwatch.GetTimestamp() * NsPerTick);
+        }
+    }
+
+    // HDR-style histogram of latencies in microseconds, the same buckets as LatencyHistogram in latency.py
+    public class LatencyHistogram
+    {
+        private const int SubBucketBits = 8;
+        private const long HighestUs = 60000000;
+        private readonly long[] counts = new long[BucketIndex(HighestUs) + 1];
+
+        public long Count { get; private set; }
+        public long Max { get; private set; }
+        public long Negative { get; private set; }
+
+        private static int BucketIndex(long value)
+        {
+            int shift = 0;
+            while ((value >> shift) >= (1L << SubBucketBits))
+            {
+                shift++;
+            }
+            if (shift == 0)
+            {
+                return (int)value;
+            }
+            return (1 << SubBucketBits) + ((shift - 1) << (SubBucketBits - 1)) + (int)(value >> shift)
+                - (1 << (SubBucketBits - 1));
+        }
+
+        private static long BucketHighest(int index)
+        {
+            if (index < 1 << SubBucketBits)
+            {
+                return index;
+            }
+            int half = 1 << (SubBucketBits - 1);
+            int shift = (index - (1 << SubBucketBits)) / half + 1;
+            long mantissa = (index - (1 << SubBucketBits)) % half + half;
+            return ((mantissa + 1) << shift) - 1;
+        }
+
+        public void Record(long valueUs)
+        {
+            if (valueUs < 0)
+            {
+                Negative++;
+                valueUs = 0;
+            }
+            valueUs = Math.Min(valueUs, HighestUs);
+            counts[BucketIndex(valueUs)]++;
+            Count++;
+            Max = Math.Max(Max, valueUs);
+        }
+
+        // The latency in microseconds that p percent of the recorded latencies are at or below
+        public long Percentile(double p)
+        {
+            long rank = Math.Max(1, (long)Math.Ceiling(p / 100 * Count));
+            long seen = 0;
+            for (int i = 0; i < counts.Length; i++)
+            {
+                seen += counts[i];
+                if (seen >= rank)
+                {
+                    return Math.Min(BucketHighest(i), Max);
+                }
+            }
+            return Max;
+        }
+    }
+
+    // A LatencyHistogram per stage, safe to record into from several threads
+    public class LatencyTracer
+    {
+        private readonly string name;
+        private readonly List<string> stages = new List<string>();
+        private readonly Dictionary<string, LatencyHistogram> histograms = new Dictionary<string, LatencyHistogram>();
+
+        public LatencyTracer(string name)
+        {
+            this.name = name;
+        }
+
+        // Records the time from startNs to endNs (LatencyClock.NowNs() timestamps) as a latency of stage
+        public void Record(string stage, long startNs, long endNs)
+        {
+            lock (histograms)
+            {
+                if (!histograms.TryGetValue(stage, out LatencyHistogram histogram))
+                {
+                    histogram = new LatencyHistogram();
+                    histograms[stage] = histogram;
+                    stages.Add(stage);
+                }
+                histogram.Record((endNs - startNs) / 1000);
+            }
+        }
+
+        // p50, p95, p99 and max of every stage in milliseconds, as printed by latency.py
+        public string Report()
+        {
+            var report = new StringBuilder($"{name} latency (ms)\n");
+            report.Append($"{"stage",-28}{"count",9}{"p50",9}{"p95",9}{"p99",9}{"max",9}");
+            lock (histograms)
+            {
+                foreach (string stage in stages)
+                {
+                    LatencyHistogram h = histograms[stage];
+                    report.Append($"\n{stage,-28}{h.Count,9}{h.Percentile(50) / 1e3,9:F2}{h.Percentile(95) / 1e3,9:F2}"
+                        + $"{h.Percentile(99) / 1e3,9:F2}{h.Max / 1e3,9:F2}");
+                    if (h.Negative > 0)
+                    {
+                        report.Append($"  ({h.Negative} negative, are the processes on one machine?)");
+                    }
+                }
+            }
+            return report.ToString();
+        }
+    }
+
+    [System.Serializable]
+    public class FrameTrace
+    {
+        public long seq;
+        public long callback;
+        public long sent;
     }
 
     [System.Serializable]
     public class SensorData
     {
         public Sensor[] sensors;
+        public int rate;
+        public long seq;
+        public FrameTrace trace;
     }
 
     [System.Serializable]
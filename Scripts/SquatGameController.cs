@@ -8,6 +8,7 @@ using System.Net.Sockets;
 using System.Text;
 using System.Collections.Generic;
 using System.Collections;
+using System.IO;
 
 public class SquatGameController : MonoBehaviour
 {
@@ -62,12 +63,28 @@ public class SquatGameController : MonoBehaviour
     private const int POINTS_PER_ASSESSMENT = 600;
 
     // Smoothness Analysis
+    public bool useBinarySmoothnessPayload = true;
     private TcpClient smoothnessClient;
     private NetworkStream smoothnessStream;
     private List<QuaternionData> dataPoints = new List<QuaternionData>();
     private float lastTimestamp = 0f;
     private CSVExporter csvExporter;
 
+    // Repetitions, for the server's 'rep' window (WINDOW_MODE in unityConnect.py): a squat counts once the
+    // knee bends below repBottomAngle and straightens above repTopAngle again. The request that ends a
+    // rep is sent straight away and the next one is flagged rep, so the server starts a new window;
+    // the first request of a game is flagged reset, so it forgets the samples of the previous one.
+    public float repBottomAngle = 110f;
+    public float repTopAngle = 150f;
+    private bool isAtRepBottom = false;
+    private bool pendingRep = false;
+    private bool pendingReset = true;
+    private int repCount = 0;
+
+    // Latency tracing (see latency.py), the histograms are logged with latencyDumpKey and when the game closes
+    public KeyCode latencyDumpKey = KeyCode.F9;
+    private readonly LatencyTracer smoothnessLatency = new LatencyTracer("Unity smoothness requests");
+
     // Unity Lifecycle Methods
     private void Start()
     {
@@ -92,6 +109,11 @@ public class SquatGameController : MonoBehaviour
 
     private void Update()
     {
+        if (Input.GetKeyDown(latencyDumpKey))
+        {
+            DumpLatency();
+        }
+
         UpdateTimerDisplay();
         UpdateDifficulty();
         MoveWindow();
@@ -105,6 +127,7 @@ public class SquatGameController : MonoBehaviour
             {
                 float kneeAngle = CalculateKneeAngle(sensor1Data, sensor2Data);
                 UpdateUI(kneeAngle);
+                bool repCompleted = CountRep(kneeAngle);
 
                 var thighSensor = JsonConvert.DeserializeObject<SensorData>(sensor1Data);
                 var shinSensor = JsonConvert.DeserializeObject<SensorData>(sensor2Data);
@@ -125,11 +148,16 @@ public class SquatGameController : MonoBehaviour
 
                 AddDataPoint(thighQuaternion, Time.time);
 
-                if (dataPoints.Count >= 300)
+                // the server needs at least 4 samples, a shorter rep end carries over into the next rep
+                if (dataPoints.Count >= 300 || (repCompleted && dataPoints.Count >= 4))
                 {
                     CalculateSmoothness();
                     dataPoints.Clear();
                 }
+                if (repCompleted)
+                {
+                    pendingRep = true;
+                }
 
                 float sparc = float.Parse(sparcText.text.Split(':')[1].Trim());
                 float ldlj = float.Parse(ldljText.text.Split(':')[1].Trim());
@@ -154,6 +182,7 @@ public class SquatGameController : MonoBehaviour
 
     private void OnDestroy()
     {
+        DumpLatency();
         server?.Stop();
         smoothnessClient?.Close();
     }
@@ -342,6 +371,7 @@ public class SquatGameController : MonoBehaviour
         gameTimer = 0f;
         assessmentTimer = 0f;
         totalPoints = 0;
+        StartSmoothnessSession();
         UpdatePointsDisplay();
         timerText.gameObject.SetActive(true);
         startButton.interactable = false;
@@ -518,6 +548,34 @@ public class SquatGameController : MonoBehaviour
         }
     }
 
+    // A new session on the same connection, the next request tells the server to drop its buffer
+    private void StartSmoothnessSession()
+    {
+        dataPoints.Clear();
+        lastTimestamp = Time.time;
+        pendingReset = true;
+        pendingRep = false;
+        isAtRepBottom = false;
+        repCount = 0;
+    }
+
+    // Returns true when the knee angle completes a squat (down past repBottomAngle, back up past repTopAngle)
+    private bool CountRep(float kneeAngle)
+    {
+        if (kneeAngle < repBottomAngle)
+        {
+            isAtRepBottom = true;
+        }
+        else if (isAtRepBottom && kneeAngle > repTopAngle)
+        {
+            isAtRepBottom = false;
+            repCount++;
+            Debug.Log($"Squat {repCount} completed");
+            return true;
+        }
+        return false;
+    }
+
     private void AddDataPoint(Quaternion quaternion, float timestamp)
     {
         dataPoints.Add(new QuaternionData
@@ -535,24 +593,53 @@ public class SquatGameController : MonoBehaviour
     {
         try
         {
-            var data = new
+            // the trace of the newest sensor frame goes along, so the server can time the whole path
+            FrameTrace frame = server?.GetLatestTrace();
+            long sent = LatencyClock.NowNs();
+            FrameTrace trace = frame == null ? null
+                : new FrameTrace { seq = frame.seq, callback = frame.callback, sent = sent };
+
+            bool reset = pendingReset;
+            bool rep = pendingRep;
+            pendingReset = false;
+            pendingRep = false;
+
+            if (useBinarySmoothnessPayload)
             {
-                quaternions = dataPoints,
-                deltaTime = Time.deltaTime,
-                time = Time.time
-            };
-
-            string jsonData = JsonConvert.SerializeObject(data);
-            byte[] sendData = Encoding.ASCII.GetBytes(jsonData);
-
-            smoothnessStream.Write(sendData, 0, sendData.Length);
+                WriteFrame(PackBinarySamples(trace, reset, rep));
+            }
+            else
+            {
+                var data = new
+                {
+                    quaternions = dataPoints,
+                    fs = SmoothnessSampleRate(),
+                    deltaTime = Time.deltaTime,
+                    time = Time.time,
+                    reset = reset,
+                    rep = rep,
+                    trace = trace
+                };
+
+                string jsonData = JsonConvert.SerializeObject(data);
+                WriteFrame(Encoding.UTF8.GetBytes(jsonData));
+            }
 
-            byte[] receiveData = new byte[1024];
-            int bytesRead = smoothnessStream.Read(receiveData, 0, receiveData.Length);
-            string jsonResponse = Encoding.ASCII.GetString(receiveData, 0, bytesRead);
+            string jsonResponse = Encoding.UTF8.GetString(ReadFrame());
+            long received = LatencyClock.NowNs();
 
             var response = JsonConvert.DeserializeObject<SmoothnessResponse>(jsonResponse);
 
+            smoothnessLatency.Record("round trip", sent, received);
+            if (response.trace != null)
+            {
+                smoothnessLatency.Record("server->unity", response.trace.replied, received);
+                if (response.trace.callback != 0)
+                {
+                    smoothnessLatency.Record("callback->smoothness", response.trace.callback, received);
+                }
+            }
+
             UpdateSmoothnessVisualFeedback(response.sparc, response.ldlj);
         }
         catch (Exception e)
@@ -561,6 +648,99 @@ public class SquatGameController : MonoBehaviour
         }
     }
 
+    // Rate at which data points were collected, so the server sizes its buffers and FFTs from it
+    // (0 lets the server fall back to its default)
+    private ushort SmoothnessSampleRate()
+    {
+        float duration = 0f;
+        foreach (var point in dataPoints)
+        {
+            duration += point.timestamp;
+        }
+        return duration > 0f ? (ushort)Mathf.RoundToInt(dataPoints.Count / duration) : (ushort)0;
+    }
+
+    // Binary smoothness payload: "SQB1", version, flags (0x01 reset, 0x02 rep, 0x04 trace), sample rate
+    // in Hz, sample count, then little-endian float32 (w, x, y, z, dt) per sample, and with flag 0x04 the
+    // trace (uint32 sequence number, 4 reserved bytes, int64 callback and sent timestamps in ns)
+    private byte[] PackBinarySamples(FrameTrace trace, bool reset, bool rep)
+    {
+        byte flags = (byte)((reset ? 0x01 : 0) | (rep ? 0x02 : 0) | (trace != null ? 0x04 : 0));
+        using (var memory = new MemoryStream(12 + dataPoints.Count * 20 + 24))
+        using (var writer = new BinaryWriter(memory))
+        {
+            writer.Write(Encoding.ASCII.GetBytes("SQB1"));
+            writer.Write((byte)1);
+            writer.Write(flags);
+            writer.Write(SmoothnessSampleRate());
+            writer.Write((uint)dataPoints.Count);
+            foreach (var point in dataPoints)
+            {
+                writer.Write(point.w);
+                writer.Write(point.x);
+                writer.Write(point.y);
+                writer.Write(point.z);
+                writer.Write(point.timestamp);
+            }
+            if (trace != null)
+            {
+                writer.Write((uint)trace.seq);
+                writer.Write(0);
+                writer.Write(trace.callback);
+                writer.Write(trace.sent);
+            }
+            writer.Flush();
+            return memory.ToArray();
+        }
+    }
+
+    // Smoothness server framing: 4-byte big-endian payload length followed by the payload
+    private void WriteFrame(byte[] payload)
+    {
+        byte[] header = BitConverter.GetBytes(payload.Length);
+        if (BitConverter.IsLittleEndian)
+        {
+            Array.Reverse(header);
+        }
+        smoothnessStream.Write(header, 0, header.Length);
+        smoothnessStream.Write(payload, 0, payload.Length);
+    }
+
+    private byte[] ReadFrame()
+    {
+        byte[] header = ReadExactly(4);
+        if (BitConverter.IsLittleEndian)
+        {
+            Array.Reverse(header);
+        }
+        return ReadExactly(BitConverter.ToInt32(header, 0));
+    }
+
+    private byte[] ReadExactly(int count)
+    {
+        byte[] buffer = new byte[count];
+        int offset = 0;
+        while (offset < count)
+        {
+            int bytesRead = smoothnessStream.Read(buffer, offset, count - offset);
+            if (bytesRead == 0)
+            {
+                throw new Exception("Smoothness server closed the connection");
+            }
+            offset += bytesRead;
+        }
+        return buffer;
+    }
+
+    private void DumpLatency()
+    {
+        if (server == null)
+        {
+            return;
+        }
+        Debug.Log($"{server.Latency.Report()}\nLost frames: {server.GetLostFrames()}\n{smoothnessLatency.Report()}");
+    }
+
     private void UpdateSmoothnessVisualFeedback(float sparc, float ldlj)
     {
         sparcText.text = $"SPARC: {sparc:F2}";
@@ -597,4 +777,12 @@ public class QuaternionData
 public class SmoothnessResponse
 {
     public float sparc, ldlj;
+    public SmoothnessTrace trace;
+}
+
+// The request's trace with the received and replied timestamps of unityConnect.py added
+[System.Serializable]
+public class SmoothnessTrace
+{
+    public long seq, callback, sent, received, replied;
 }